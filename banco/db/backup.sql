@@ -407,7 +407,8 @@ ALTER SEQUENCE public.system_changes_id_seq OWNED BY public.system_changes.id;
 
 CREATE TABLE public.user_finger (
     user_id integer NOT NULL,
-    template_position integer
+    template_position integer,
+    dedo smallint DEFAULT 0 NOT NULL
 );
 
 
@@ -1097,10 +1098,10 @@ COPY public.system_changes (id, table_name, last_change, change_count) FROM stdi
 -- Data for Name: user_finger; Type: TABLE DATA; Schema: public; Owner: postgres
 --
 
-COPY public.user_finger (user_id, template_position) FROM stdin;
-60	0
-66	1
-74	2
+COPY public.user_finger (user_id, template_position, dedo) FROM stdin;
+60	0	0
+66	1	0
+74	2	0
 \.
 
 
@@ -1292,7 +1293,7 @@ ALTER TABLE ONLY public.system_changes
 --
 
 ALTER TABLE ONLY public.user_finger
-    ADD CONSTRAINT user_finger_pkey PRIMARY KEY (user_id);
+    ADD CONSTRAINT user_finger_pkey PRIMARY KEY (user_id, dedo);
 
 
 --
@@ -1,7 +1,15 @@
 #!/usr/bin/env python3
 
-import psycopg2
-from pyfingerprint.pyfingerprint import PyFingerprint
+import argparse
+import csv
+import json
+import os
+import time
+
+from psycopg2.extras import execute_values
+
+from sensor import criar_sensor
+from banco import obter_pool, migrar_dedos, DEDOS_POR_USUARIO
 
 # Configuração PostgreSQL
 PG_CONFIG = {
@@ -15,14 +23,26 @@ PG_CONFIG = {
 SENSOR_PORT = '/dev/ttyUSB0'
 SENSOR_BAUD = 57600
 
+INTERVALO_LEITURA = 0.1   # entre dois readImage (sem ocupar 100% da CPU)
+TIMEOUT_DEDO = 30
+CHECKPOINT_PADRAO = 10    # cadastros por transação no modo lote
+PROGRESSO_LOTE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cadastro_lote.progresso.jsonl')
+
+SQL_VINCULAR = """
+    INSERT INTO user_finger (user_id, dedo, template_position)
+    VALUES %s
+    ON CONFLICT (user_id, dedo) DO UPDATE SET template_position = EXCLUDED.template_position
+"""
+
 
 def conectar_banco():
-    return psycopg2.connect(**PG_CONFIG)
+    """Empresta uma conexão do pool compartilhado (usar com 'with')"""
+    return obter_pool(PG_CONFIG).conexao()
 
 
 def inicializar_sensor():
     try:
-        finger = PyFingerprint(SENSOR_PORT, SENSOR_BAUD, 0xFFFFFFFF, 0x00000000)
+        finger = criar_sensor(SENSOR_PORT, SENSOR_BAUD)
         if not finger.verifyPassword():
             raise Exception("Senha incorreta do sensor")
         print("✅ Sensor inicializado")
@@ -32,45 +52,63 @@ def inicializar_sensor():
         return None
 
 
-def cadastrar_biometria(finger, identificador, nome, id):
-    try:
-        print(f"👤 Cadastrando digital para: {nome} (Identificador: {identificador})")
-        usuario_id = id
-        print("👉 Coloque o dedo no sensor...")
-        while not finger.readImage():
-            pass
-        finger.convertImage(0x01)
-
-        result = finger.searchTemplate()
-        if result[0] >= 0:
-            print("⚠️ Digital já cadastrada na posição", result[0])
-            return False
+def aguardar_dedo(finger, presente=True, timeout=TIMEOUT_DEDO):
+    """Lê o sensor até o dedo estar (ou não estar) nele; False no timeout"""
+    limite = time.monotonic() + timeout
+    while time.monotonic() < limite:
+        if finger.readImage() == presente:
+            return True
+        time.sleep(INTERVALO_LEITURA)
+    return False
 
-        print("👉 Remova e coloque o mesmo dedo novamente...")
-        while finger.readImage():
-            pass
-        while not finger.readImage():
-            pass
-        finger.convertImage(0x02)
 
-        if finger.compareCharacteristics() == 0:
-            print("❌ Digitais não correspondem, tente novamente")
-            return False
+def capturar_digital(finger):
+    """Duas leituras do mesmo dedo gravadas no sensor; retorna a posição ou None"""
+    print("👉 Coloque o dedo no sensor...")
+    if not aguardar_dedo(finger):
+        print("⏱️ Nenhum dedo detectado")
+        return None
+    finger.convertImage(0x01)
+
+    result = finger.searchTemplate()
+    if result[0] >= 0:
+        print("⚠️ Digital já cadastrada na posição", result[0])
+        return None
 
-        position = finger.storeTemplate()
-        print("✅ Digital armazenada na posição", position)
+    print("👉 Remova e coloque o mesmo dedo novamente...")
+    if not aguardar_dedo(finger, presente=False) or not aguardar_dedo(finger):
+        print("⏱️ Segunda leitura não detectada")
+        return None
+    finger.convertImage(0x02)
 
-        conn = conectar_banco()
+    if finger.compareCharacteristics() == 0 or not finger.createTemplate():
+        print("❌ Digitais não correspondem, tente novamente")
+        return None
+
+    position = finger.storeTemplate()
+    print("✅ Digital armazenada na posição", position)
+    return position
+
+
+def vincular_digitais(vinculos):
+    """Grava [(user_id, dedo, posição), ...] em user_finger numa única transação"""
+    if not vinculos:
+        return
+    with conectar_banco() as conn:
         cursor = conn.cursor()
-        cursor.execute("""
-            INSERT INTO user_finger (user_id, template_position)
-            VALUES (%s, %s)
-            ON CONFLICT (user_id) DO UPDATE SET template_position = EXCLUDED.template_position
-        """, (usuario_id, position))
+        execute_values(cursor, SQL_VINCULAR, vinculos)
         conn.commit()
         cursor.close()
-        conn.close()
 
+
+def cadastrar_biometria(finger, identificador, nome, id, dedo=0):
+    try:
+        print(f"👤 Cadastrando dedo {dedo} para: {nome} (Identificador: {identificador})")
+        position = capturar_digital(finger)
+        if position is None:
+            return False
+
+        vincular_digitais([(id, dedo, position)])
         print(f"📝 Digital vinculada ao usuário {nome} (Identificador: {identificador})")
         return True
 
@@ -79,24 +117,185 @@ def cadastrar_biometria(finger, identificador, nome, id):
         return False
 
 
+# ==================== MODO LOTE ====================
+
+def ler_identificadores_csv(caminho):
+    """Coluna 'identificador' (ou a primeira coluna, se não houver cabeçalho)"""
+    with open(caminho, newline='', encoding='utf-8') as f:
+        linhas = list(csv.reader(f))
+    if not linhas:
+        return []
+    cabecalho = [coluna.strip().lower() for coluna in linhas[0]]
+    if 'identificador' in cabecalho:
+        indice = cabecalho.index('identificador')
+        linhas = linhas[1:]
+    else:
+        indice = 0
+    return [linha[indice].strip() for linha in linhas if len(linha) > indice and linha[indice].strip()]
+
+
+def buscar_usuarios(identificadores=None, dedo=0):
+    """
+    Carrega de uma vez os usuários do lote, com a posição atual do dedo
+    (se houver). Sem identificadores, traz todos que ainda não têm o dedo.
+    """
+    with conectar_banco() as conn:
+        cursor = conn.cursor()
+        if identificadores is None:
+            cursor.execute("""
+                SELECT u.identificador, u.nome, u.id, NULL
+                FROM usuario u
+                LEFT JOIN user_finger f ON f.user_id = u.id AND f.dedo = %s
+                WHERE f.user_id IS NULL
+                ORDER BY u.nome
+            """, (dedo,))
+        else:
+            cursor.execute("""
+                SELECT u.identificador, u.nome, u.id, f.template_position
+                FROM usuario u
+                LEFT JOIN user_finger f ON f.user_id = u.id AND f.dedo = %s
+                WHERE u.identificador::text = ANY(%s)
+            """, (dedo, identificadores))
+        usuarios = cursor.fetchall()
+        cursor.close()
+
+    if identificadores is not None:
+        # Mantém a ordem do arquivo e avisa quem não existe
+        por_identificador = {str(usuario[0]): usuario for usuario in usuarios}
+        for identificador in identificadores:
+            if identificador not in por_identificador:
+                print(f"❌ Usuário não encontrado: {identificador}")
+        usuarios = [por_identificador[i] for i in dict.fromkeys(identificadores) if i in por_identificador]
+    return usuarios
+
+
+def ler_progresso(caminho=PROGRESSO_LOTE):
+    """Digitais já capturadas numa execução anterior: {(user_id, dedo): posição}"""
+    progresso = {}
+    if not os.path.exists(caminho):
+        return progresso
+    with open(caminho, encoding='utf-8') as f:
+        for linha in f:
+            try:
+                registro = json.loads(linha)
+            except ValueError:
+                continue  # linha parcial de uma interrupção
+            progresso[(registro['user_id'], registro.get('dedo', 0))] = registro['posicao']
+    return progresso
+
+
+def anotar_progresso(user_id, dedo, posicao, caminho=PROGRESSO_LOTE):
+    """Anota a captura antes de ir ao banco: o slot no sensor não se perde"""
+    with open(caminho, 'a', encoding='utf-8') as f:
+        f.write(json.dumps({'user_id': user_id, 'dedo': dedo, 'posicao': posicao}) + '\n')
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def cadastrar_lote(finger, usuarios, checkpoint=CHECKPOINT_PADRAO, dedo=0):
+    """
+    Conduz o operador pela lista de usuários. As capturas ficam anotadas no
+    arquivo de progresso e vão para user_finger em uma transação a cada
+    `checkpoint` cadastros e no final. Se o programa for interrompido, a
+    próxima execução grava o que faltou e pula quem já foi capturado.
+    """
+    progresso = ler_progresso()
+    if progresso:
+        print(f"📦 Retomando lote: {len(progresso)} digitais capturadas anteriormente")
+        vincular_digitais([(user_id, dedo_anotado, posicao) for (user_id, dedo_anotado), posicao in progresso.items()])
+
+    pendentes = []
+    for usuario in usuarios:
+        identificador, nome, user_id, posicao_atual = usuario
+        if (user_id, dedo) in progresso:
+            continue
+        if posicao_atual is not None:
+            print(f"⏭️  {nome} ({identificador}) já tem o dedo {dedo} na posição {posicao_atual}")
+            continue
+        pendentes.append((identificador, nome, user_id))
+
+    total = len(pendentes)
+    print(f"📋 {total} usuários para cadastrar")
+    capturados = []
+    inicio = time.monotonic()
+
+    try:
+        for numero, (identificador, nome, user_id) in enumerate(pendentes, 1):
+            print(f"\n[{numero}/{total}] 👤 {nome} (Identificador: {identificador})")
+            opcao = input("Enter para capturar, 'p' para pular, 'sair' para encerrar: ").strip().lower()
+            if opcao == 'sair':
+                break
+            if opcao == 'p':
+                continue
+
+            posicao = None
+            for tentativa in range(1, 4):
+                if tentativa > 1:
+                    print(f"🔄 Tentativa {tentativa}/3...")
+                try:
+                    posicao = capturar_digital(finger)
+                except Exception as e:
+                    print("❌ Erro ao capturar digital:", e)
+                if posicao is not None:
+                    break
+            if posicao is None:
+                print(f"❌ {nome} ficou sem digital")
+                continue
+
+            anotar_progresso(user_id, dedo, posicao)
+            capturados.append((user_id, dedo, posicao))
+
+            if len(capturados) >= checkpoint:
+                vincular_digitais(capturados)
+                print(f"💾 Checkpoint: {len(capturados)} digitais gravadas no banco")
+                capturados = []
+    finally:
+        if capturados:
+            vincular_digitais(capturados)
+            print(f"💾 {len(capturados)} digitais gravadas no banco")
+
+    if os.path.exists(PROGRESSO_LOTE):
+        os.remove(PROGRESSO_LOTE)
+
+    decorrido = time.monotonic() - inicio
+    print(f"✅ Lote encerrado em {decorrido:.0f}s")
+
+
+def argumentos():
+    parser = argparse.ArgumentParser(description="Cadastro de digitais (individual ou em lote)")
+    grupo = parser.add_mutually_exclusive_group()
+    grupo.add_argument('--csv', help="arquivo CSV com os identificadores do lote")
+    grupo.add_argument('--pendentes', action='store_true', help="lote com todos os usuários sem digital")
+    parser.add_argument('--checkpoint', type=int, default=CHECKPOINT_PADRAO,
+                        help="cadastros por transação no banco (padrão: %(default)s)")
+    parser.add_argument('--dedo', type=int, default=0, choices=range(DEDOS_POR_USUARIO),
+                        help="número do dedo; outro que não o 0 cadastra um dedo adicional")
+    return parser.parse_args()
+
+
 if __name__ == "__main__":
+    args = argumentos()
     finger = inicializar_sensor()
     if finger:
+        migrar_dedos(obter_pool(PG_CONFIG))
+    if finger and (args.csv or args.pendentes):
+        usuarios = buscar_usuarios(ler_identificadores_csv(args.csv) if args.csv else None, args.dedo)
+        cadastrar_lote(finger, usuarios, args.checkpoint, args.dedo)
+    elif finger:
         while True:
             identificador = input("\nDigite o identificador do usuário (ou 'sair' para encerrar): ").strip()
             if identificador.lower() == "sair":
                 print("👋 Encerrando programa.")
                 break
 
-            conn = conectar_banco()
-            cursor = conn.cursor()
-            cursor.execute("SELECT identificador, nome, id FROM usuario WHERE identificador = %s", (identificador,))
-            usuario = cursor.fetchone()
-            cursor.close()
-            conn.close()
+            with conectar_banco() as conn:
+                cursor = conn.cursor()
+                cursor.execute("SELECT identificador, nome, id FROM usuario WHERE identificador = %s", (identificador,))
+                usuario = cursor.fetchone()
+                cursor.close()
 
             if usuario:
                 identificador, nome, id = usuario
-                cadastrar_biometria(finger, identificador, nome, id)
+                cadastrar_biometria(finger, identificador, nome, id, args.dedo)
             else:
                 print("❌ Usuário não encontrado no banco de dados.")
@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+
+import heapq
+import itertools
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as TempoEsgotado
+
+# Menor número = atendido primeiro
+PRIORIDADE_RECONHECIMENTO = 0
+PRIORIDADE_CADASTRO = 1
+PRIORIDADE_DIAGNOSTICO = 2
+
+NOMES_PRIORIDADE = {
+    PRIORIDADE_RECONHECIMENTO: 'reconhecimento',
+    PRIORIDADE_CADASTRO: 'cadastro',
+    PRIORIDADE_DIAGNOSTICO: 'diagnostico',
+}
+
+
+class SensorIndisponivel(Exception):
+    """O comando precisa do sensor, mas ele não está inicializado"""
+
+
+class AgendadorSensor:
+    """
+    Única thread que conversa com o sensor biométrico.
+
+    Quem precisa do sensor envia um comando (função que recebe o sensor) e
+    recebe um Future. Os comandos são atendidos por prioridade e, dentro da
+    mesma prioridade, por ordem de chegada; como cada comando é curto (um
+    readImage, um convertImage...), um reconhecimento nunca espera mais que
+    o comando em execução. Um Future ainda na fila pode ser cancelado com
+    `cancel()`; o que já está no sensor vai até o fim.
+    """
+
+    def __init__(self, obter_sensor):
+        self.obter_sensor = obter_sensor
+        self.cond = threading.Condition()
+        self.fila = []
+        self.sequencia = itertools.count()
+        self.running = True
+        self.thread = None
+        self.comando_atual = None
+
+        self.executados = {nome: 0 for nome in NOMES_PRIORIDADE.values()}
+        self.cancelados = 0
+        self.falhas = 0
+        self.espera_max = 0.0
+
+    # ==================== ENVIO ====================
+
+    def enviar(self, funcao, prioridade=PRIORIDADE_DIAGNOSTICO, nome=None):
+        """Agenda `funcao(sensor)` e retorna o Future com o resultado"""
+        futuro = Future()
+        comando = (prioridade, next(self.sequencia), funcao, futuro, nome or getattr(funcao, '__name__', 'comando'),
+                   time.monotonic())
+
+        with self.cond:
+            if not self.running:
+                raise RuntimeError("Agendador do sensor parado")
+            self._garantir_thread()
+            heapq.heappush(self.fila, comando)
+            self.cond.notify()
+        return futuro
+
+    def executar(self, funcao, prioridade=PRIORIDADE_DIAGNOSTICO, timeout=None, nome=None):
+        """Envia e espera o resultado; cancela o comando se o tempo acabar"""
+        futuro = self.enviar(funcao, prioridade, nome)
+        try:
+            return futuro.result(timeout)
+        except TempoEsgotado:
+            futuro.cancel()
+            raise
+
+    def chamar(self, metodo, *args, prioridade=PRIORIDADE_DIAGNOSTICO, timeout=None):
+        """Atalho para um método do sensor, ex.: chamar('readImage', prioridade=...)"""
+        def _comando(sensor):
+            if sensor is None:
+                raise SensorIndisponivel("Sensor não inicializado")
+            return getattr(sensor, metodo)(*args)
+        return self.executar(_comando, prioridade, timeout, nome=metodo)
+
+    def cancelar_pendentes(self, prioridade):
+        """Cancela os comandos de uma prioridade que ainda não começaram"""
+        with self.cond:
+            cancelados = 0
+            for comando in self.fila:
+                if comando[0] == prioridade and comando[3].cancel():
+                    cancelados += 1
+            self.cancelados += cancelados
+        return cancelados
+
+    # ==================== EXECUÇÃO ====================
+
+    def _garantir_thread(self):
+        if self.thread is None:
+            self.thread = threading.Thread(target=self._trabalhar, name="sensor", daemon=True)
+            self.thread.start()
+
+    def _trabalhar(self):
+        while True:
+            with self.cond:
+                while self.running and not self.fila:
+                    self.cond.wait()
+                if not self.fila:
+                    return
+                prioridade, _, funcao, futuro, nome, enviado_em = heapq.heappop(self.fila)
+                if not futuro.set_running_or_notify_cancel():
+                    continue
+                self.comando_atual = nome
+                self.espera_max = max(self.espera_max, time.monotonic() - enviado_em)
+
+            try:
+                resultado = funcao(self.obter_sensor())
+            except BaseException as e:
+                with self.cond:
+                    self.falhas += 1
+                futuro.set_exception(e)
+            else:
+                futuro.set_result(resultado)
+            finally:
+                with self.cond:
+                    self.comando_atual = None
+                    chave = NOMES_PRIORIDADE.get(prioridade)
+                    if chave:
+                        self.executados[chave] += 1
+
+    # ==================== CICLO DE VIDA / MÉTRICAS ====================
+
+    def parar(self, timeout=3):
+        """Cancela o que está na fila e espera o comando em andamento"""
+        with self.cond:
+            self.running = False
+            for comando in self.fila:
+                if comando[3].cancel():
+                    self.cancelados += 1
+            self.fila.clear()
+            self.cond.notify_all()
+        if self.thread:
+            self.thread.join(timeout=timeout)
+
+    def metricas(self):
+        with self.cond:
+            fila = {nome: 0 for nome in NOMES_PRIORIDADE.values()}
+            for comando in self.fila:
+                if not comando[3].cancelled():
+                    fila[NOMES_PRIORIDADE[comando[0]]] += 1
+            return {
+                "fila": fila,
+                "comando_atual": self.comando_atual,
+                "executados": dict(self.executados),
+                "cancelados": self.cancelados,
+                "falhas": self.falhas,
+                "espera_max_ms": round(1000 * self.espera_max, 3),
+            }
@@ -0,0 +1,244 @@
+#!/usr/bin/env python3
+
+import argparse
+import os
+import struct
+import time
+
+from sensor import criar_sensor
+from banco import obter_pool
+from log_catraca import componente, configurar_logs
+
+log = componente('templates')
+
+PG_CONFIG = {
+    'host': "192.168.15.16",
+    'port': "5432",
+    'user': "postgres",
+    'password': "rafarod",
+    'database': "turnstile_system"
+}
+
+SENSOR_PORT = '/dev/ttyUSB0'
+SENSOR_BAUD = 57600
+
+TEMPLATES_POR_PAGINA = 256   # getTemplateIndex devolve 256 posições por página
+INTERVALO_PROGRESSO = 50     # templates entre dois relatórios de progresso
+
+# Arquivo compactado: cabeçalho (assinatura, versão, quantidade) e, para
+# cada template, posição e tamanho seguidos dos bytes das características
+ASSINATURA_ARQUIVO = b'CTPL'
+VERSAO_ARQUIVO = 1
+CABECALHO = struct.Struct('>4sHI')
+REGISTRO = struct.Struct('>HH')
+
+SQL_TABELA = """
+    CREATE TABLE IF NOT EXISTS template_backup (
+        posicao integer PRIMARY KEY,
+        caracteristicas bytea NOT NULL,
+        atualizado_em timestamp NOT NULL DEFAULT now()
+    )
+"""
+
+SQL_SALVAR = """
+    INSERT INTO template_backup (posicao, caracteristicas)
+    VALUES %s
+    ON CONFLICT (posicao) DO UPDATE
+        SET caracteristicas = EXCLUDED.caracteristicas, atualizado_em = now()
+"""
+
+# Todas as funções que falam com o sensor recebem `executar`, que roda
+# `funcao(sensor)`: direto no script, ou pelo agendador na catraca em
+# funcionamento (um comando por template, sem travar o reconhecimento).
+
+
+def executar_direto(sensor):
+    return lambda funcao: funcao(sensor)
+
+
+class Progresso:
+    """Conta templates e bytes e registra a vazão a cada INTERVALO_PROGRESSO"""
+
+    def __init__(self, operacao, total):
+        self.operacao = operacao
+        self.total = total
+        self.feitos = 0
+        self.bytes = 0
+        self.inicio = time.monotonic()
+
+    def avancar(self, tamanho):
+        self.feitos += 1
+        self.bytes += tamanho
+        if self.feitos % INTERVALO_PROGRESSO == 0 or self.feitos == self.total:
+            log.info(f"   {self.operacao}: {self.feitos}/{self.total} "
+                     f"({self.por_segundo():.1f} templates/s, {self.bytes / 1024:.0f} KiB)")
+
+    def decorrido(self):
+        return time.monotonic() - self.inicio
+
+    def por_segundo(self):
+        decorrido = self.decorrido()
+        return self.feitos / decorrido if decorrido > 0 else 0.0
+
+    def resumo(self):
+        return {
+            "operacao": self.operacao,
+            "total": self.total,
+            "feitos": self.feitos,
+            "bytes": self.bytes,
+            "segundos": round(self.decorrido(), 2),
+            "templates_por_segundo": round(self.por_segundo(), 2),
+        }
+
+
+# ==================== SENSOR ====================
+
+def posicoes_ocupadas(executar):
+    """Posições com template, lidas pelo índice do sensor (uma página por comando)"""
+    capacidade = executar(lambda sensor: sensor.getStorageCapacity())
+    posicoes = []
+    for pagina in range((capacidade + TEMPLATES_POR_PAGINA - 1) // TEMPLATES_POR_PAGINA):
+        indice = executar(lambda sensor: sensor.getTemplateIndex(pagina))
+        base = pagina * TEMPLATES_POR_PAGINA
+        posicoes.extend(base + i for i, ocupada in enumerate(indice) if ocupada and base + i < capacidade)
+    return posicoes
+
+
+def baixar_templates(executar, posicoes=None, progresso=None):
+    """Lista [(posição, bytes)] com as características de cada template do sensor"""
+    if posicoes is None:
+        posicoes = posicoes_ocupadas(executar)
+    progresso = progresso or Progresso('backup', len(posicoes))
+
+    def _baixar(posicao):
+        def _comando(sensor):
+            sensor.loadTemplate(posicao, 0x01)
+            return bytes(sensor.downloadCharacteristics(0x01))
+        return _comando
+
+    templates = []
+    for posicao in posicoes:
+        dados = executar(_baixar(posicao))
+        templates.append((posicao, dados))
+        progresso.avancar(len(dados))
+    return templates
+
+
+def restaurar_templates(executar, templates, limpar=False, progresso=None):
+    """Grava cada template de volta na mesma posição do sensor"""
+    progresso = progresso or Progresso('restauração', len(templates))
+
+    if limpar:
+        executar(lambda sensor: sensor.clearDatabase())
+
+    def _gravar(posicao, dados):
+        def _comando(sensor):
+            sensor.uploadCharacteristics(0x01, list(dados))
+            return sensor.storeTemplate(posicao, 0x01)
+        return _comando
+
+    for posicao, dados in templates:
+        executar(_gravar(posicao, dados))
+        progresso.avancar(len(dados))
+    return progresso
+
+
+# ==================== BANCO ====================
+
+def salvar_no_banco(pool, templates):
+    """Substitui o backup no banco pelos templates dados, numa transação"""
+    with pool.conexao() as conn:
+        cursor = conn.cursor()
+        cursor.execute(SQL_TABELA)
+        cursor.execute("DELETE FROM template_backup")
+        if templates:
+            from psycopg2.extras import execute_values
+            execute_values(cursor, SQL_SALVAR, templates, page_size=200)
+        conn.commit()
+        cursor.close()
+
+
+def carregar_do_banco(pool):
+    with pool.conexao() as conn:
+        cursor = conn.cursor()
+        cursor.execute(SQL_TABELA)
+        cursor.execute("SELECT posicao, caracteristicas FROM template_backup ORDER BY posicao")
+        templates = [(posicao, bytes(dados)) for posicao, dados in cursor.fetchall()]
+        conn.commit()
+        cursor.close()
+    return templates
+
+
+# ==================== ARQUIVO ====================
+
+def caminho_no_diretorio(diretorio, nome):
+    """
+    Caminho de um arquivo de backup pedido pela API: só um nome simples,
+    sempre dentro de `diretorio` (ValueError para caminhos, '..' e afins).
+    A linha de comando continua aceitando qualquer caminho.
+    """
+    if (not isinstance(nome, str) or not nome or nome in ('.', '..') or '..' in nome or '\0' in nome
+            or '/' in nome or '\\' in nome or (os.altsep and os.altsep in nome)):
+        raise ValueError(f"Nome de arquivo de backup inválido: {nome!r} (use só o nome, sem diretório)")
+    return os.path.join(diretorio, nome)
+
+
+def salvar_arquivo(caminho, templates):
+    diretorio = os.path.dirname(caminho)
+    if diretorio:
+        os.makedirs(diretorio, mode=0o700, exist_ok=True)
+    with open(caminho, 'wb') as f:
+        f.write(CABECALHO.pack(ASSINATURA_ARQUIVO, VERSAO_ARQUIVO, len(templates)))
+        for posicao, dados in templates:
+            f.write(REGISTRO.pack(posicao, len(dados)))
+            f.write(dados)
+
+
+def ler_arquivo(caminho):
+    with open(caminho, 'rb') as f:
+        assinatura, versao, quantidade = CABECALHO.unpack(f.read(CABECALHO.size))
+        if assinatura != ASSINATURA_ARQUIVO or versao != VERSAO_ARQUIVO:
+            raise ValueError(f"Arquivo de templates inválido: {caminho}")
+        templates = []
+        for _ in range(quantidade):
+            posicao, tamanho = REGISTRO.unpack(f.read(REGISTRO.size))
+            dados = f.read(tamanho)
+            if len(dados) != tamanho:
+                raise ValueError(f"Arquivo de templates truncado: {caminho}")
+            templates.append((posicao, dados))
+    return templates
+
+
+# ==================== LINHA DE COMANDO ====================
+
+def argumentos():
+    parser = argparse.ArgumentParser(description="Backup e restauração dos templates do sensor")
+    parser.add_argument('operacao', choices=['backup', 'restaurar'])
+    parser.add_argument('--arquivo', help="usa um arquivo compactado em vez da tabela template_backup")
+    parser.add_argument('--limpar', action='store_true', help="apaga o sensor antes de restaurar")
+    parser.add_argument('--porta', default=SENSOR_PORT)
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = argumentos()
+    configurar_logs()
+    sensor = criar_sensor(args.porta, SENSOR_BAUD)
+    if not sensor.verifyPassword():
+        raise SystemExit("❌ Erro na autenticação do sensor")
+    executar = executar_direto(sensor)
+
+    if args.operacao == 'backup':
+        print("💾 Baixando templates do sensor...")
+        templates = baixar_templates(executar)
+        if args.arquivo:
+            salvar_arquivo(args.arquivo, templates)
+        else:
+            salvar_no_banco(obter_pool(PG_CONFIG), templates)
+        print(f"✅ Backup de {len(templates)} templates em {args.arquivo or 'template_backup'}")
+    else:
+        templates = ler_arquivo(args.arquivo) if args.arquivo else carregar_do_banco(obter_pool(PG_CONFIG))
+        print(f"📦 Restaurando {len(templates)} templates...")
+        progresso = restaurar_templates(executar, templates, limpar=args.limpar)
+        resumo = progresso.resumo()
+        print(f"✅ Restauração concluída em {resumo['segundos']}s ({resumo['templates_por_segundo']} templates/s)")
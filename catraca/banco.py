@@ -0,0 +1,270 @@
+#!/usr/bin/env python3
+
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+# psycopg2 é importado na primeira conexão: o processo da API, que não fala
+# com o banco, não paga a importação na inicialização
+
+# Sentenças do caminho quente, preparadas uma vez por conexão física
+SENTENCAS_PREPARADAS = {
+    'buscar_usuario_por_posicao': """
+        PREPARE buscar_usuario_por_posicao (integer) AS
+        SELECT uf.template_position, u.id, u.nome, u.tipo, u.identificador
+        FROM usuario u
+        JOIN user_finger uf ON u.id = uf.user_id
+        WHERE uf.template_position = $1
+    """,
+    'inserir_log_entrada': """
+        PREPARE inserir_log_entrada (integer, varchar, varchar, varchar, bigint, timestamp) AS
+        INSERT INTO log_entrada (usuario_id, nome, tipo, periodo, identificador,
+                                 created_at, data_entrada, horario)
+        VALUES ($1, $2, $3, $4, $5, $6, $6::date, $6::time)
+    """,
+}
+
+# Vários dedos por usuário: uma linha de user_finger por (usuário, dedo).
+# Bancos criados antes disso têm só a chave (user_id); a migração roda uma vez.
+DEDOS_POR_USUARIO = 10
+
+SQL_DEDOS = """
+DO $$
+BEGIN
+    IF NOT EXISTS (SELECT 1 FROM information_schema.columns
+                   WHERE table_schema = 'public' AND table_name = 'user_finger' AND column_name = 'dedo') THEN
+        ALTER TABLE public.user_finger ADD COLUMN dedo smallint NOT NULL DEFAULT 0;
+        ALTER TABLE public.user_finger DROP CONSTRAINT IF EXISTS user_finger_pkey;
+        ALTER TABLE public.user_finger ADD CONSTRAINT user_finger_pkey PRIMARY KEY (user_id, dedo);
+    END IF;
+END
+$$;
+"""
+
+
+class PoolEsgotado(Exception):
+    """Nenhuma conexão ficou livre dentro do tempo de espera"""
+
+
+class PoolBanco:
+    """
+    Pool de conexões PostgreSQL compartilhado entre threads.
+
+    Mantém entre `minimo` e `maximo` conexões abertas. Quem pede uma conexão
+    com o pool cheio espera até `timeout_espera` segundos. Conexões ociosas há
+    mais de `verificar_apos` segundos passam por um SELECT 1 antes de serem
+    entregues, e conexões que falham são descartadas e reabertas.
+    """
+
+    def __init__(self, config, minimo=1, maximo=4, timeout_espera=5.0,
+                 verificar_apos=30.0, timeout_conexao=3):
+        self.config = config
+        self.minimo = minimo
+        self.maximo = maximo
+        self.timeout_espera = timeout_espera
+        self.verificar_apos = verificar_apos
+        self.timeout_conexao = timeout_conexao
+
+        self.ociosas = deque()  # (conn, instante da devolução)
+        self.total = 0
+        self.cond = threading.Condition()
+
+        self.emprestimos = 0
+        self.esperas = 0
+        self.espera_total = 0.0
+        self.espera_max = 0.0
+        self.esgotamentos = 0
+        self.conexoes_abertas = 0
+        self.conexoes_descartadas = 0
+        self.falhas_verificacao = 0
+
+    # ==================== CICLO DE VIDA ====================
+
+    def aquecer(self):
+        """Abre as conexões mínimas antecipadamente"""
+        conexoes = []
+        try:
+            for _ in range(self.minimo):
+                conexoes.append(self.emprestar())
+        finally:
+            for conn in conexoes:
+                self.devolver(conn)
+
+    def fechar(self):
+        with self.cond:
+            while self.ociosas:
+                conn, _ = self.ociosas.popleft()
+                self.total -= 1
+                conn.close()
+            self.cond.notify_all()
+
+    def _abrir(self):
+        import psycopg2
+        conn = psycopg2.connect(connect_timeout=self.timeout_conexao, **self.config)
+        try:
+            cursor = conn.cursor()
+            for sentenca in SENTENCAS_PREPARADAS.values():
+                cursor.execute(sentenca)
+            conn.commit()
+            cursor.close()
+        except Exception:
+            conn.close()
+            raise
+
+        with self.cond:
+            self.conexoes_abertas += 1
+        return conn
+
+    def _descartar(self, conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+        with self.cond:
+            self.total -= 1
+            self.conexoes_descartadas += 1
+            self.cond.notify()
+
+    def _saudavel(self, conn, devolvida_em):
+        if conn.closed:
+            return False
+        if time.monotonic() - devolvida_em < self.verificar_apos:
+            return True
+
+        try:
+            cursor = conn.cursor()
+            cursor.execute("SELECT 1")
+            cursor.close()
+            conn.rollback()
+            return True
+        except Exception:
+            with self.cond:
+                self.falhas_verificacao += 1
+            return False
+
+    # ==================== EMPRÉSTIMO ====================
+
+    def emprestar(self):
+        inicio = time.monotonic()
+        limite = inicio + self.timeout_espera
+        conn = None
+        devolvida_em = None
+
+        with self.cond:
+            while True:
+                if self.ociosas:
+                    conn, devolvida_em = self.ociosas.pop()
+                    break
+                if self.total < self.maximo:
+                    self.total += 1
+                    break
+
+                restante = limite - time.monotonic()
+                if restante <= 0:
+                    self.esgotamentos += 1
+                    raise PoolEsgotado(
+                        f"Nenhuma conexão livre em {self.timeout_espera}s "
+                        f"({self.maximo} em uso)"
+                    )
+                self.esperas += 1
+                self.cond.wait(restante)
+
+            espera = time.monotonic() - inicio
+            self.emprestimos += 1
+            self.espera_total += espera
+            self.espera_max = max(self.espera_max, espera)
+
+        if conn is not None and self._saudavel(conn, devolvida_em):
+            return conn
+
+        if conn is not None:
+            # Socket velho: descarta e reabre no mesmo lugar
+            try:
+                conn.close()
+            except Exception:
+                pass
+            with self.cond:
+                self.conexoes_descartadas += 1
+
+        try:
+            return self._abrir()
+        except Exception:
+            with self.cond:
+                self.total -= 1
+                self.cond.notify()
+            raise
+
+    def devolver(self, conn, descartar=False):
+        if descartar or conn.closed:
+            self._descartar(conn)
+            return
+
+        import psycopg2.extensions
+        try:
+            if conn.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                conn.rollback()
+        except Exception:
+            self._descartar(conn)
+            return
+
+        with self.cond:
+            self.ociosas.append((conn, time.monotonic()))
+            self.cond.notify()
+
+    @contextmanager
+    def conexao(self):
+        """Empresta uma conexão e devolve ao sair do bloco"""
+        conn = self.emprestar()
+        import psycopg2
+        try:
+            yield conn
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            self.devolver(conn, descartar=True)
+            raise
+        except BaseException:
+            self.devolver(conn)
+            raise
+        else:
+            self.devolver(conn)
+
+    # ==================== MÉTRICAS ====================
+
+    def metricas(self):
+        with self.cond:
+            return {
+                "conexoes_total": self.total,
+                "conexoes_ociosas": len(self.ociosas),
+                "conexoes_em_uso": self.total - len(self.ociosas),
+                "maximo": self.maximo,
+                "emprestimos": self.emprestimos,
+                "esperas": self.esperas,
+                "espera_media_ms": round(1000 * self.espera_total / self.emprestimos, 3) if self.emprestimos else 0.0,
+                "espera_max_ms": round(1000 * self.espera_max, 3),
+                "esgotamentos": self.esgotamentos,
+                "conexoes_abertas": self.conexoes_abertas,
+                "conexoes_descartadas": self.conexoes_descartadas,
+                "falhas_verificacao": self.falhas_verificacao,
+            }
+
+
+def migrar_dedos(pool):
+    """Garante a coluna 'dedo' e a chave (user_id, dedo) em user_finger"""
+    with pool.conexao() as conn:
+        cursor = conn.cursor()
+        cursor.execute(SQL_DEDOS)
+        conn.commit()
+        cursor.close()
+
+
+_pools = {}
+_lock_pools = threading.Lock()
+
+
+def obter_pool(config, **opcoes):
+    """Retorna o pool compartilhado do processo para esta configuração"""
+    chave = tuple(sorted(config.items()))
+    with _lock_pools:
+        if chave not in _pools:
+            _pools[chave] = PoolBanco(config, **opcoes)
+        return _pools[chave]
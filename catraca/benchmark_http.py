@@ -0,0 +1,233 @@
+#!/usr/bin/env python3
+"""
+Carga na API: requisições por segundo e latência (p50/p95/p99) por rota.
+
+Sem --url, compara os dois servidores HTTP da API: sobe `python.py api`
+com CATRACA_SERVIDOR_HTTP=desenvolvimento (app.run do Flask) e depois com
+o pool (servidor_http.py), cada um lendo um bloco de estado publicado por
+este script, no lugar do processo do hardware. Assim só a camada HTTP é
+medida, sem sensor nem banco.
+
+    python benchmark_http.py --conexoes 32 --duracao 10
+    python benchmark_http.py --url http://192.168.11.220:5000 --rotas /api/health
+
+Com --nova-conexao cada requisição abre uma conexão (cliente sem keep-alive).
+"""
+
+import argparse
+import http.client
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from urllib.parse import urlsplit
+
+from ipc_catraca import BlocoEstado, INTERVALO_ESTADO
+
+ROTAS = ('/api/health', '/api/catraca/status')
+SERVIDORES = ('desenvolvimento', 'pool')
+
+
+def estado_exemplo(faixas=2):
+    """Estado com o formato e o tamanho do publicado por SistemaCatraca.estado()"""
+    saude = {"estado": "ok", "falha": None, "ultimo_erro": None, "erros_seguidos": 0,
+             "resultados": {"ok": 120, "ocioso": 5400, "sem_match": 8, "erro_protocolo": 0, "desconectado": 0},
+             "tentativas_reabrir": 0, "recuperacoes": 0, "sondas": 0, "sondas_falhas": 0, "sem_resposta_s": 0.4}
+    return {
+        "publicado_em": time.time(),
+        "pid": os.getpid(),
+        "sensor_conectado": True,
+        "status": {
+            "online": True,
+            "modo": "consulta",
+            "sensor_status": "conectado",
+            "cadastro_ativo": False,
+            "cadastro_intercalado": True,
+            "leitor_cadastro": "catraca",
+            "acessos_pendentes": 0,
+            "modo_operacao": "online",
+            "origem_dados": "banco",
+            "idade_dados_s": 3.2,
+            "filtro_acessos": {"janela_s": 10, "validade_antipassback_s": 0, "capacidade": 10000, "usuarios": 85,
+                               "consultas": 128, "acertos": 12, "suprimidos": {"repeticao": 12, "antipassback": 0},
+                               "descartados": 0},
+            "faixas": {f"faixa{i}": {
+                "porta": f"/dev/ttyUSB{i}", "sentido": None, "antipassback": False, "sensor_status": "conectado",
+                "consulta_ativa": True, "ultimo_erro": None,
+                "ultimo_acesso": {"usuario_id": 60, "nome": "Usuário", "momento": "2026-10-18T08:00:00"},
+                "reconhecimentos": {"reconhecido": 120, "sem_match": 8, "timeout": 5400},
+                "passagens": {"liberada": 110, "sem_giro": 10}, "fila_sensor": 0, "saude_sensor": saude,
+            } for i in range(faixas)},
+        },
+        "cadastro": {"etapa": "inativo", "mensagem": "", "dados": None, "em_andamento": False, "success": True,
+                     "timestamp": None},
+        "eventos_cadastro": [],
+        "templates": {"operacao": None, "progresso": None, "sincronizacao": None},
+    }
+
+
+def publicar_exemplo(bloco, parar):
+    while not parar.is_set():
+        bloco.publicar(estado_exemplo())
+        parar.wait(INTERVALO_ESTADO)
+
+
+# ==================== CARGA ====================
+
+def percentil(valores, p):
+    if not valores:
+        return 0.0
+    return valores[min(len(valores) - 1, int(len(valores) * p))]
+
+
+def carga(url, rota, conexoes, duracao, nova_conexao=False):
+    """`conexoes` clientes pedindo `rota` sem pausa por `duracao` segundos"""
+    partes = urlsplit(url)
+    latencias = []
+    erros = [0]
+    lock = threading.Lock()
+    fim = time.monotonic() + duracao
+
+    def cliente():
+        minhas = []
+        falhas = 0
+        conn = None
+        while time.monotonic() < fim:
+            if conn is None:
+                conn = http.client.HTTPConnection(partes.hostname, partes.port or 80, timeout=30)
+            inicio = time.perf_counter()
+            try:
+                conn.request('GET', rota)
+                resposta = conn.getresponse()
+                resposta.read()
+                if resposta.status != 200:
+                    falhas += 1
+                else:
+                    minhas.append(time.perf_counter() - inicio)
+                if nova_conexao or resposta.will_close:
+                    conn.close()
+                    conn = None
+            except (OSError, http.client.HTTPException):
+                falhas += 1
+                conn.close()
+                conn = None
+        if conn is not None:
+            conn.close()
+        with lock:
+            latencias.extend(minhas)
+            erros[0] += falhas
+
+    threads = [threading.Thread(target=cliente) for _ in range(conexoes)]
+    inicio = time.monotonic()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    decorrido = time.monotonic() - inicio
+
+    latencias.sort()
+    return {
+        "requisicoes": len(latencias),
+        "erros": erros[0],
+        "req_s": len(latencias) / decorrido,
+        "p50_ms": percentil(latencias, 0.50) * 1000,
+        "p95_ms": percentil(latencias, 0.95) * 1000,
+        "p99_ms": percentil(latencias, 0.99) * 1000,
+        "max_ms": (latencias[-1] if latencias else 0.0) * 1000,
+    }
+
+
+def imprimir(nome, rota, r):
+    print(f"{nome:<16} {rota:<22} {r['req_s']:>9.0f} {r['p50_ms']:>8.1f} {r['p95_ms']:>8.1f} "
+          f"{r['p99_ms']:>8.1f} {r['max_ms']:>8.1f} {r['erros']:>6}")
+
+
+def cabecalho():
+    print(f"{'servidor':<16} {'rota':<22} {'req/s':>9} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'max ms':>8} {'erros':>6}")
+
+
+# ==================== COMPARAÇÃO ====================
+
+def aguardar_api(url, timeout=15):
+    partes = urlsplit(url)
+    limite = time.monotonic() + timeout
+    while time.monotonic() < limite:
+        try:
+            conn = http.client.HTTPConnection(partes.hostname, partes.port, timeout=1)
+            conn.request('GET', '/api/health')
+            if conn.getresponse().status == 200:
+                conn.close()
+                return True
+        except OSError:
+            time.sleep(0.2)
+    return False
+
+
+def comparar(args):
+    diretorio = tempfile.mkdtemp(prefix="benchmark_http_")
+    caminho_bloco = os.path.join(diretorio, "estado")
+    bloco = BlocoEstado(caminho_bloco, escrita=True)
+    parar = threading.Event()
+    threading.Thread(target=publicar_exemplo, args=(bloco, parar), daemon=True).start()
+
+    url = f"http://127.0.0.1:{args.porta}"
+    resultados = []
+    try:
+        for servidor in SERVIDORES:
+            ambiente = dict(os.environ,
+                            CATRACA_SERVIDOR_HTTP=servidor,
+                            CATRACA_PORTA=str(args.porta),
+                            CATRACA_BLOCO_ESTADO=caminho_bloco,
+                            CATRACA_SOCKET=os.path.join(diretorio, "catraca.sock"))
+            api = subprocess.Popen([sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'python.py'), 'api'],
+                                   env=ambiente, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            try:
+                if not aguardar_api(url):
+                    print(f"❌ API ({servidor}) não subiu na porta {args.porta}")
+                    continue
+                for rota in args.rotas:
+                    carga(url, rota, args.conexoes, 1, args.nova_conexao)  # aquecimento
+                    resultados.append((servidor, rota, carga(url, rota, args.conexoes, args.duracao, args.nova_conexao)))
+            finally:
+                api.send_signal(signal.SIGTERM)
+                try:
+                    api.wait(timeout=20)
+                except subprocess.TimeoutExpired:
+                    api.kill()
+                    api.wait()
+    finally:
+        parar.set()
+        bloco.fechar()
+        for nome in os.listdir(diretorio):
+            os.unlink(os.path.join(diretorio, nome))
+        os.rmdir(diretorio)
+
+    print(f"🔥 {args.conexoes} conexões, {args.duracao:.0f}s por rota"
+          f"{', conexão nova por requisição' if args.nova_conexao else ', keep-alive'}")
+    cabecalho()
+    for servidor, rota, r in resultados:
+        imprimir(servidor, rota, r)
+
+
+def argumentos():
+    parser = argparse.ArgumentParser(description="Carga nos endpoints da API da catraca")
+    parser.add_argument('--url', help="API já rodando (sem isso, compara os dois servidores)")
+    parser.add_argument('--rotas', nargs='+', default=list(ROTAS))
+    parser.add_argument('--conexoes', type=int, default=32)
+    parser.add_argument('--duracao', type=float, default=10, help="segundos por rota")
+    parser.add_argument('--porta', type=int, default=5099, help="porta da API na comparação")
+    parser.add_argument('--nova-conexao', action='store_true')
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = argumentos()
+    if args.url:
+        cabecalho()
+        for rota in args.rotas:
+            imprimir(urlsplit(args.url).netloc, rota, carga(args.url, rota, args.conexoes, args.duracao, args.nova_conexao))
+    else:
+        comparar(args)
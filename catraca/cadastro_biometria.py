@@ -0,0 +1,331 @@
+#!/usr/bin/env python3
+
+import time
+from concurrent.futures import CancelledError
+
+from agendador_sensor import PRIORIDADE_CADASTRO
+from metricas import DURACAO_ETAPA
+from log_catraca import componente
+
+log = componente('cadastro')
+
+TIMEOUT_DEDO = 30           # segundos para cada leitura
+INTERVALO_LEITURA = 0.1     # entre dois readImage
+INTERVALO_AVISO = 5         # contagem regressiva no webhook
+
+ESTADOS_FINAIS = ('sucesso', 'erro', 'cancelado')
+
+
+class CadastroCancelado(Exception):
+    """O cadastro foi cancelado pela rota enquanto esperava o sensor"""
+
+
+class EsperaCaptura:
+    """Vaga para o reconhecimento entregar ao cadastro a próxima digital lida"""
+
+    def __init__(self):
+        self.caracteristicas = None
+
+    def entregar(self, caracteristicas):
+        if self.caracteristicas is None:
+            self.caracteristicas = caracteristicas
+
+
+class MaquinaCadastro:
+    """
+    Cadastro de uma digital como máquina de estados.
+
+    Cada estado é um método `_<estado>` que faz o seu trabalho e devolve o
+    próximo estado. Não há pausas fixas: as transições acontecem quando o
+    sensor detecta o dedo (ou a retirada dele), e o ritmo das mensagens na
+    tela fica por conta do cliente. O tempo gasto em cada estado fica em
+    `tempos` e vai junto no evento final.
+
+    As características de cada captura são baixadas para a memória logo
+    após o convertImage e reenviadas aos buffers 0x01/0x02 no mesmo comando
+    que as usa. Assim o reconhecimento pode continuar usando o sensor entre
+    uma etapa e outra sem estragar o cadastro. As capturas vão para o leitor
+    de cadastro (que pode ser um segundo leitor no balcão); busca, validação
+    e gravação rodam sempre no leitor da catraca, onde os templates ficam.
+
+    Se o leitor for o mesmo da catraca e a consulta continua rodando, quem
+    lê o sensor é só o reconhecimento: enquanto o cadastro espera uma
+    captura, toda digital lida é entregue a ele por `sistema.captura_cadastro`
+    sem passar pela busca nem liberar a catraca, e a digital já cadastrada
+    é recusada em `_verificando_existente`. Entre uma captura e outra quem
+    passa na catraca é atendido normalmente.
+    """
+
+    def __init__(self, sistema, user_id, identificador, nome, dedo=0, timeout_dedo=TIMEOUT_DEDO):
+        self.sistema = sistema
+        self.user_id = user_id
+        self.identificador = identificador
+        self.nome = nome
+        self.dedo = dedo
+        self.timeout_dedo = timeout_dedo
+
+        self.tempos = {}
+        self.caracteristicas = []
+        self.posicao = None
+        self.resultado = None
+
+    def executar(self):
+        """Roda do estado inicial até um final e retorna o resultado do cadastro"""
+        inicio_total = time.perf_counter()
+        estado = 'iniciando'
+
+        try:
+            while estado not in ESTADOS_FINAIS:
+                inicio = time.perf_counter()
+                proximo = getattr(self, '_' + estado)()
+                self._medir(estado, time.perf_counter() - inicio)
+                estado = proximo
+        except (CadastroCancelado, CancelledError):
+            # A rota de cancelamento já notificou a etapa 'cancelado'
+            estado = 'cancelado'
+            self.resultado = {"success": False, "message": "Cadastro cancelado"}
+        finally:
+            self._medir('total', time.perf_counter() - inicio_total)
+
+        return self.resultado
+
+    # ==================== ESTADOS ====================
+
+    def _iniciando(self):
+        self.sistema.notificar_etapa('iniciando', 'Iniciando cadastro de biometria...')
+        self.sistema.notificar_etapa('conectado', 'Conectando com a catraca...')
+        log.info(f"👤 Iniciando cadastro para: {self.nome} (dedo {self.dedo})")
+        return 'aguardando_primeira'
+
+    def _aguardando_primeira(self):
+        self.sistema.notificar_etapa('aguardando_primeira', 'Coloque o dedo no sensor para a primeira leitura')
+        log.info("👉 PRIMEIRA LEITURA - Coloque o dedo no sensor...")
+
+        if not self._esperar_dedo(True, 'aguardando_primeira', 'Aguardando primeira leitura'):
+            return self._falhar('Timeout - falha ao detectar dedo na primeira leitura')
+        return 'primeira_capturada'
+
+    def _primeira_capturada(self):
+        self.sistema.notificar_etapa('primeira_capturada', 'Primeira digital capturada com sucesso!')
+        log.info("✅ Primeira leitura capturada")
+        return 'verificando_existente'
+
+    def _verificando_existente(self):
+        self.sistema.notificar_etapa('verificando_existente', 'Verificando se digital já está cadastrada...')
+
+        primeira = self.caracteristicas[0]
+
+        def _buscar(sensor):
+            sensor.uploadCharacteristics(0x01, primeira)
+            return sensor.searchTemplate()
+
+        posicao = self._comando(_buscar)[0]
+        if posicao >= 0:
+            return self._falhar(f"Digital já cadastrada na posição {posicao}")
+        return 'aguardando_remocao'
+
+    def _aguardando_remocao(self):
+        self.sistema.notificar_etapa('aguardando_remocao', 'Retire o dedo do sensor')
+
+        if not self._esperar_dedo(False, 'aguardando_remocao', 'Retire o dedo do sensor'):
+            return self._falhar('Timeout - o dedo não foi retirado do sensor')
+        return 'aguardando_segunda'
+
+    def _aguardando_segunda(self):
+        self.sistema.notificar_etapa('aguardando_segunda', 'Coloque o mesmo dedo novamente para confirmar')
+        log.info("👉 SEGUNDA LEITURA - Coloque o mesmo dedo novamente...")
+
+        if not self._esperar_dedo(True, 'aguardando_segunda', 'Aguardando segunda leitura'):
+            return self._falhar('Timeout - falha ao detectar dedo na segunda leitura')
+        return 'segunda_capturada'
+
+    def _segunda_capturada(self):
+        self.sistema.notificar_etapa('segunda_capturada', 'Segunda digital capturada com sucesso!')
+        log.info("✅ Segunda leitura capturada")
+        return 'validando'
+
+    def _validando(self):
+        self.sistema.notificar_etapa('validando', 'Validando correspondência das digitais...')
+
+        def _comparar(sensor):
+            self._restaurar_buffers(sensor)
+            return sensor.compareCharacteristics()
+
+        similaridade = self._comando(_comparar)
+        log.info(f"🔍 Similaridade das digitais: {similaridade}")
+        if similaridade == 0:
+            return self._falhar('Digitais não correspondem. Tente novamente.', 'Digitais não correspondem')
+
+        self.sistema.notificar_etapa('validacao_ok', 'Digitais correspondem! Salvando...')
+        return 'salvando'
+
+    def _salvando(self):
+        self.sistema.notificar_etapa('salvando', 'Salvando digital no banco de dados...')
+
+        sincronizador = self.sistema.sincronizador
+        replicar = len(self.sistema.faixas) > 1
+        template = None
+
+        def _gravar_template(sensor):
+            self._restaurar_buffers(sensor)
+            if not sensor.createTemplate():
+                return None
+            posicao = sensor.storeTemplate()
+            if sincronizador or replicar:
+                # O template combinado continua no buffer: vai para o
+                # repositório central e para os leitores das outras faixas
+                nonlocal template
+                template = sensor.downloadCharacteristics(0x01)
+            return posicao
+
+        # Sem trava da sincronização: ela escolhe a posição lendo o índice do
+        # sensor no mesmo comando em que grava, então não pega esta
+        self.posicao = self._comando(_gravar_template)
+        if self.posicao is None:
+            return self._falhar('Digitais não correspondem. Tente novamente.', 'Digitais não correspondem')
+        log.info(f"✅ Digital armazenada na posição {self.posicao}")
+        if replicar:
+            self.sistema.replicar_template(self.posicao, template)
+
+        import psycopg2.errors
+        with self.sistema.conectar_banco() as conn:
+            cursor = conn.cursor()
+            # Recadastro do mesmo dedo: a posição antiga sai do sensor depois
+            if sincronizador:
+                anterior = sincronizador.registrar_local(cursor, self.user_id, self.posicao, template, self.dedo)
+                cursor.execute("SAVEPOINT user_finger")
+            else:
+                cursor.execute("""
+                    SELECT template_position FROM user_finger WHERE user_id = %s AND dedo = %s FOR UPDATE
+                """, (self.user_id, self.dedo))
+                linha = cursor.fetchone()
+                anterior = linha[0] if linha else None
+            try:
+                cursor.execute("""
+                    INSERT INTO user_finger (user_id, dedo, template_position)
+                    VALUES (%s, %s, %s)
+                    ON CONFLICT (user_id, dedo) DO UPDATE SET template_position = EXCLUDED.template_position
+                """, (self.user_id, self.dedo, self.posicao))
+            except psycopg2.errors.UniqueViolation:
+                if not sincronizador:
+                    raise
+                # A posição é deste sensor; em user_finger ela pode ser de outra catraca
+                cursor.execute("ROLLBACK TO SAVEPOINT user_finger")
+                log.warning(f"⚠️ Posição {self.posicao} já vinculada em user_finger por outra catraca - "
+                            f"vínculo registrado só em template_posicao")
+            conn.commit()
+            cursor.close()
+
+        if anterior is not None and anterior != self.posicao:
+            try:
+                self.sistema.executar_espelhado(lambda sensor: sensor.deleteTemplate(anterior))
+                log.info(f"🧹 Template anterior do dedo {self.dedo} removido da posição {anterior}")
+            except Exception as e:
+                log.warning(f"⚠️ Template anterior na posição {anterior} não removido: {e}")
+
+        # O NOTIFY também chega, isto só adianta
+        try:
+            self.sistema.indice.atualizar_usuario(self.user_id)
+        except Exception as e:
+            log.warning(f"⚠️ Índice biométrico será atualizado via notificação: {e}")
+
+        return 'finalizado'
+
+    def _finalizado(self):
+        self.sistema.notificar_etapa('finalizado', f'Cadastro finalizado com sucesso! Digital salva na posição {self.posicao}')
+        self.sistema.notificar_etapa('sucesso', f'Biometria cadastrada com sucesso para {self.nome}', {
+            'posicao': self.posicao,
+            'dedo': self.dedo,
+            'tempos_ms': self.tempos_ms(),
+        })
+        self.resultado = {
+            "success": True,
+            "message": f"Digital vinculada ao usuário {self.nome}",
+            "position": self.posicao,
+            "dedo": self.dedo,
+            "tempos_ms": self.tempos_ms(),
+        }
+        return 'sucesso'
+
+    # ==================== AUXILIARES ====================
+
+    def _comando(self, funcao, leitor_cadastro=False):
+        """Executa `funcao(sensor)` como um único comando, sem nada intercalado"""
+        if self.sistema.cancelamento_cadastro.is_set():
+            raise CadastroCancelado()
+        agendador = self.sistema.agendador_cadastro if leitor_cadastro else self.sistema.agendador
+        return agendador.executar(funcao, PRIORIDADE_CADASTRO, nome=funcao.__name__)
+
+    def _capturar(self, sensor):
+        """readImage, convertImage e download juntos: a imagem não é trocada no meio"""
+        if not sensor.readImage():
+            return None
+        sensor.convertImage(0x01)
+        return sensor.downloadCharacteristics(0x01)
+
+    def leitor_compartilhado(self):
+        return self.sistema.cadastro_intercalado and self.sistema.agendador_cadastro is self.sistema.agendador
+
+    def _restaurar_buffers(self, sensor):
+        sensor.uploadCharacteristics(0x01, self.caracteristicas[0])
+        sensor.uploadCharacteristics(0x02, self.caracteristicas[1])
+
+    def _esperar_dedo(self, presente, etapa, aviso):
+        """
+        Lê o sensor até o dedo estar (ou não estar) nele. Com o dedo presente
+        a captura é convertida e guardada em `caracteristicas`. Retorna False
+        no timeout; um cancelamento interrompe a espera na hora.
+        """
+        inicio = time.monotonic()
+        ultimo_aviso = 0
+        espera = None
+
+        if presente and self.leitor_compartilhado():
+            espera = EsperaCaptura()
+            self.sistema.captura_cadastro = espera
+
+        try:
+            while True:
+                if espera is not None:
+                    if espera.caracteristicas is not None:
+                        self.caracteristicas.append(espera.caracteristicas)
+                        return True
+                elif presente:
+                    caracteristicas = self._comando(self._capturar, leitor_cadastro=True)
+                    if caracteristicas is not None:
+                        self.caracteristicas.append(caracteristicas)
+                        return True
+                elif not self._comando(_ler_imagem, leitor_cadastro=True):
+                    return True
+
+                decorrido = time.monotonic() - inicio
+                if decorrido >= self.timeout_dedo:
+                    return False
+
+                # Contagem regressiva uma vez por intervalo
+                segundos = int(decorrido)
+                if segundos and segundos % INTERVALO_AVISO == 0 and segundos != ultimo_aviso:
+                    ultimo_aviso = segundos
+                    self.sistema.notificar_etapa(etapa, f'{aviso}... {self.timeout_dedo - segundos}s restantes')
+
+                if self.sistema.cancelamento_cadastro.wait(INTERVALO_LEITURA):
+                    raise CadastroCancelado()
+        finally:
+            if espera is not None:
+                self.sistema.captura_cadastro = None
+
+    def _falhar(self, mensagem, retorno=None):
+        self.sistema.notificar_etapa('erro', mensagem, {'tempos_ms': self.tempos_ms()}, success=False)
+        self.resultado = {"success": False, "message": retorno or mensagem}
+        return 'erro'
+
+    def _medir(self, estado, duracao):
+        self.tempos[estado] = self.tempos.get(estado, 0.0) + duracao
+        DURACAO_ETAPA.rotulo(fluxo='cadastro', etapa=estado).observar(duracao)
+
+    def tempos_ms(self):
+        return {estado: round(1000 * duracao, 1) for estado, duracao in self.tempos.items()}
+
+
+def _ler_imagem(sensor):
+    return sensor.readImage()
@@ -1,6 +1,6 @@
 #!/usr/bin/env python3
 
-from pyfingerprint.pyfingerprint import PyFingerprint
+from sensor import criar_sensor
 import time
 
 def testar_sensor():
@@ -9,7 +9,7 @@ def testar_sensor():
     try:
         # Tentar conectar com o sensor
         print("1. Conectando com o sensor...")
-        sensor = PyFingerprint('/dev/ttyUSB0', 57600, 0xFFFFFFFF, 0x00000000)
+        sensor = criar_sensor('/dev/ttyUSB0', 57600)
         
         if not sensor.verifyPassword():
             print("❌ SENHA DO SENSOR INCORRETA!")
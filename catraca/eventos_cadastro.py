@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+
+import json
+import threading
+import time
+from collections import deque
+
+# Intervalo do comentário de keep-alive no stream (segundos)
+INTERVALO_HEARTBEAT = 15
+
+ESTADO_INICIAL = {
+    "etapa": "inativo",
+    "mensagem": "",
+    "dados": None,
+    "em_andamento": False,
+    "success": True,
+    "timestamp": None,
+}
+
+
+class CanalEventos:
+    """
+    Histórico curto das etapas do cadastro para o endpoint SSE.
+
+    Cada evento recebe um id crescente e fica em um buffer circular, então
+    um cliente que reconecta com Last-Event-ID recebe só o que perdeu. O
+    último estado também fica em `estado`, um dict trocado por inteiro a
+    cada publicação, para que os endpoints de status leiam sem lock.
+
+    Quando o processo que publica reinicia, os ids recomeçam do zero; a
+    `epoca` muda para que os streams abertos também recomecem.
+    """
+
+    def __init__(self, tamanho=256):
+        self.eventos = deque(maxlen=tamanho)
+        self.cond = threading.Condition()
+        self.ultimo_id = 0
+        self.epoca = 0
+        self.estado = dict(ESTADO_INICIAL)
+
+    def publicar(self, evento):
+        """Registra um novo estado e acorda os clientes conectados"""
+        with self.cond:
+            self.ultimo_id += 1
+            evento = dict(evento, id=self.ultimo_id)
+            self.eventos.append(evento)
+            self.estado = evento
+            self.cond.notify_all()
+        return evento
+
+    def receber(self, evento):
+        """Repete um evento publicado em outro processo, com o id de lá"""
+        with self.cond:
+            if evento["id"] <= self.ultimo_id:
+                return
+            self.ultimo_id = evento["id"]
+            self.eventos.append(evento)
+            self.estado = evento
+            self.cond.notify_all()
+
+    def recomecar(self):
+        """Esquece os eventos recebidos (o processo que publica reiniciou)"""
+        with self.cond:
+            self.eventos.clear()
+            self.ultimo_id = 0
+            self.epoca += 1
+            self.estado = dict(ESTADO_INICIAL)
+            self.cond.notify_all()
+
+    def acordar(self):
+        """Acorda os streams em espera, para conferirem se devem encerrar"""
+        with self.cond:
+            self.cond.notify_all()
+
+    def ultimos(self, quantidade):
+        with self.cond:
+            return list(self.eventos)[-quantidade:]
+
+    def eventos_desde(self, ultimo_id, timeout=INTERVALO_HEARTBEAT):
+        """
+        Retorna os eventos com id maior que `ultimo_id`, esperando até
+        `timeout` segundos se ainda não houver nenhum.
+        """
+        with self.cond:
+            if self.ultimo_id <= ultimo_id:
+                self.cond.wait(timeout)
+            return [evento for evento in self.eventos if evento["id"] > ultimo_id]
+
+    def stream(self, ultimo_id=None, running=lambda: True):
+        """Gerador no formato text/event-stream"""
+        if ultimo_id is not None and ultimo_id > self.ultimo_id:
+            # Last-Event-ID de antes de um reinício do processo que publica
+            ultimo_id = None
+        if ultimo_id is None:
+            # Cliente novo: começa pelo estado atual
+            estado = self.estado
+            if estado.get("id"):
+                yield self._formatar(estado)
+            ultimo_id = estado.get("id", 0)
+
+        yield "retry: 2000\n\n"
+
+        epoca = self.epoca
+        while running():
+            eventos = self.eventos_desde(ultimo_id)
+            if self.epoca != epoca:
+                # Ids recomeçaram: manda tudo o que chegou depois do reinício
+                epoca, ultimo_id = self.epoca, 0
+                continue
+            if not eventos:
+                yield f": heartbeat {int(time.time())}\n\n"
+                continue
+
+            for evento in eventos:
+                yield self._formatar(evento)
+                ultimo_id = evento["id"]
+
+    def _formatar(self, evento):
+        dados = json.dumps(evento, ensure_ascii=False, default=str)
+        return f"id: {evento['id']}\ndata: {dados}\n\n"
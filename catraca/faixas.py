@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+
+import json
+import threading
+import time
+
+from agendador_sensor import AgendadorSensor
+from saude_sensor import MonitorSaude
+
+# Nome da faixa montada com SENSOR_PORT/GPIO_OUT/GPIO_IN quando não há
+# arquivo de faixas
+FAIXA_PRINCIPAL = 'principal'
+
+
+class Faixa:
+    """
+    Um par leitor/catraca (uma faixa de passagem) dentro do processo.
+
+    Cada faixa tem o seu sensor, o seu agendador (a thread que fala com
+    aquele leitor), o seu monitor de saúde, os seus pinos de
+    liberação/passagem e a sua thread de reconhecimento. Índice biométrico,
+    pool do banco, spool de acessos e webhooks são do SistemaCatraca e
+    compartilhados por todas.
+    """
+
+    def __init__(self, nome, porta, gpio_saida, gpio_entrada, sentido=None, antipassback=False):
+        self.nome = nome
+        self.porta = porta
+        self.gpio_saida = gpio_saida
+        self.gpio_entrada = gpio_entrada
+        self.sentido = sentido
+        self.antipassback = antipassback
+        self.sensor = None
+        self.agendador = AgendadorSensor(lambda: self.sensor)
+        self.saude = MonitorSaude(nome, self.agendador)
+        self.thread_consulta = None
+        self.ultimo_erro = None
+
+        # Uma liberação por vez (reconhecimento ou teste): os pinos são da faixa
+        self.lock_catraca = threading.Lock()
+
+        self.lock = threading.Lock()
+        self.reconhecimentos = {}
+        self.passagens = {}
+        self.ultimo_acesso = None
+
+    def contar_reconhecimento(self, resultado):
+        with self.lock:
+            self.reconhecimentos[resultado] = self.reconhecimentos.get(resultado, 0) + 1
+
+    def contar_passagem(self, resultado, nome=None):
+        with self.lock:
+            self.passagens[resultado] = self.passagens.get(resultado, 0) + 1
+            if resultado == 'passou':
+                self.ultimo_acesso = {"nome": nome, "timestamp": time.time()}
+
+    def status(self):
+        with self.lock:
+            return {
+                "porta": self.porta,
+                "sentido": self.sentido,
+                "antipassback": self.antipassback,
+                "sensor_status": "conectado" if self.sensor else "erro",
+                "consulta_ativa": bool(self.thread_consulta and self.thread_consulta.is_alive()),
+                "ultimo_erro": self.ultimo_erro,
+                "ultimo_acesso": self.ultimo_acesso,
+                "reconhecimentos": dict(self.reconhecimentos),
+                "passagens": dict(self.passagens),
+                "fila_sensor": self.agendador.metricas()["fila"],
+                "saude_sensor": self.saude.metricas(),
+            }
+
+
+def carregar_faixas(caminho, padrao, caminho_gpio):
+    """
+    Lê o arquivo de faixas (JSON). Sem arquivo, usa só a faixa `padrao`.
+
+    Formato:
+        [{"nome": "entrada", "sensor": "/dev/ttyUSB0", "gpio_saida": 415, "gpio_entrada": 412},
+         {"nome": "saida", "sensor": "/dev/ttyUSB1", "gpio_saida": 416, "gpio_entrada": 413,
+          "sentido": "SAIDA", "antipassback": true}]
+
+    GPIOs podem ser o número do pino (resolvido por `caminho_gpio`) ou o
+    caminho do arquivo 'value'. A primeira faixa é a principal: é nela que
+    ficam o cadastro, o backup e a sincronização de templates. Anti-passback
+    só vale nas faixas com `sentido` (ver repeticao_acessos.py).
+    """
+    if not caminho:
+        return [padrao]
+
+    with open(caminho, encoding='utf-8') as f:
+        configuracao = json.load(f)
+
+    def _pino(valor):
+        return caminho_gpio(valor) if isinstance(valor, int) else valor
+
+    faixas = []
+    for item in configuracao:
+        faixa = Faixa(item['nome'], item['sensor'], _pino(item['gpio_saida']), _pino(item['gpio_entrada']),
+                      item.get('sentido'), bool(item.get('antipassback', False)))
+        if any(outra.nome == faixa.nome for outra in faixas):
+            raise ValueError(f"Faixa repetida em {caminho}: {faixa.nome}")
+        faixas.append(faixa)
+
+    if not faixas:
+        raise ValueError(f"Nenhuma faixa configurada em {caminho}")
+    return faixas
@@ -1,8 +1,15 @@
 #!/usr/bin/env python3
 
-from pyfingerprint.pyfingerprint import PyFingerprint
+import argparse
+import os
+import time
+
+from psycopg2.extras import execute_values
+
+from sensor import criar_sensor
 import sys
-import psycopg2
+from banco import obter_pool
+from backup_templates import posicoes_ocupadas, executar_direto
 
 PG_CONFIG = {
     'host': "192.168.15.16",
@@ -12,19 +19,85 @@ PG_CONFIG = {
     'database': "turnstile_system"
 }
 
+# Compactação: templates movidos antes de gravar as novas posições no banco
+LOTE_COMPACTACAO = 50
+
+# Diferença sensor x banco numa consulta só: posições ocupadas no sensor
+# sem vínculo (user_id NULL) e vínculos para posições vazias (no_sensor false)
+SQL_DIFERENCA = """
+    SELECT COALESCE(s.posicao, uf.template_position) AS posicao, uf.user_id, s.posicao IS NOT NULL AS no_sensor
+    FROM unnest(%s::integer[]) AS s(posicao)
+    FULL JOIN (SELECT user_id, template_position FROM user_finger WHERE template_position IS NOT NULL) uf
+        ON uf.template_position = s.posicao
+    WHERE s.posicao IS NULL OR uf.user_id IS NULL
+    ORDER BY 1
+"""
+
+SQL_MOVER = """
+    UPDATE user_finger AS uf SET template_position = m.nova
+    FROM (VALUES %s) AS m(antiga, nova)
+    WHERE uf.template_position = m.antiga
+"""
+
+# Com distribuição de templates (CATRACA_NO) o que está neste sensor é o
+# template_posicao do nó: user_finger pode apontar para posições do
+# sensor de outra catraca e não é alterado pela reconciliação
+SQL_DIFERENCA_NO = """
+    SELECT COALESCE(s.posicao, tp.posicao) AS posicao, tp.user_id, s.posicao IS NOT NULL AS no_sensor
+    FROM unnest(%s::integer[]) AS s(posicao)
+    FULL JOIN (SELECT user_id, posicao FROM template_posicao WHERE no = %s) tp
+        ON tp.posicao = s.posicao
+    WHERE s.posicao IS NULL OR tp.user_id IS NULL
+    ORDER BY 1
+"""
+
+SQL_MOVER_NO = """
+    UPDATE template_posicao AS tp SET posicao = m.nova
+    FROM (VALUES %s) AS m(antiga, nova, no)
+    WHERE tp.no = m.no AND tp.posicao = m.antiga
+"""
+
+
+def faixas_consecutivas(posicoes):
+    """[3, 4, 5, 9] -> [(3, 3), (9, 1)]: (início, quantidade) para deleteTemplate"""
+    faixas = []
+    for posicao in sorted(posicoes):
+        if faixas and faixas[-1][0] + faixas[-1][1] == posicao:
+            faixas[-1] = (faixas[-1][0], faixas[-1][1] + 1)
+        else:
+            faixas.append((posicao, 1))
+    return faixas
+
+
+def formatar_posicoes(posicoes):
+    """[3, 4, 5, 9] -> '3-5, 9'"""
+    return ", ".join(str(inicio) if quantidade == 1 else f"{inicio}-{inicio + quantidade - 1}"
+                     for inicio, quantidade in faixas_consecutivas(posicoes))
+
+
 class GerenciamentoDigital:
 
+    def __init__(self, no=None):
+        # Nó da distribuição de templates (ver sincronizacao_templates.py)
+        self.no = no
+
     def conectar_banco(self):
-        return psycopg2.connect(**PG_CONFIG)
+        """Empresta uma conexão do pool compartilhado (usar com 'with')"""
+        return obter_pool(PG_CONFIG).conexao()
+
+    def conectar_sensor(self):
+        sensor = criar_sensor('/dev/ttyUSB0', 57600)
+        if not sensor.verifyPassword():
+            print("❌ Erro na autenticação do sensor")
+            return None
+        return sensor
 
     def limpar_templates(self):
         """Limpa todos os templates do sensor e esvazia a tabela user_finger no banco."""
         try:
             # Conectar ao sensor
-            sensor = PyFingerprint('/dev/ttyUSB0', 57600, 0xFFFFFFFF, 0x00000000)
-            
-            if not sensor.verifyPassword():
-                print("❌ Erro na autenticação do sensor")
+            sensor = self.conectar_sensor()
+            if not sensor:
                 return False
             
             # Verificar quantidade atual de templates
@@ -48,12 +121,11 @@ class GerenciamentoDigital:
             sensor.clearDatabase()
     
             # Limpar tabela no banco de dados
-            conn = self.conectar_banco()
-            cursor = conn.cursor()
-            cursor.execute("TRUNCATE TABLE user_finger;")
-            conn.commit()
-            cursor.close()
-            conn.close()
+            with self.conectar_banco() as conn:
+                cursor = conn.cursor()
+                cursor.execute("TRUNCATE TABLE user_finger;")
+                conn.commit()
+                cursor.close()
             
             # Verificar resultado no sensor
             templates_depois = sensor.getTemplateCount()
@@ -65,5 +137,184 @@ class GerenciamentoDigital:
             print(f"❌ Erro ao limpar templates: {e}")
             return False
 
+    # ==================== RECONCILIAÇÃO ====================
+
+    def diferenca(self, executar):
+        """
+        Lê o índice do sensor (uma página por comando) e compara com
+        user_finger (com `no`, com o template_posicao do nó). Retorna
+        (ocupadas, órfãs no sensor, órfãs no banco, não importadas):
+        posições com template e sem usuário, {posição: user_id} apontando
+        para posição vazia e, com `no`, as posições sem template_posicao que
+        user_finger ainda cita (cadastro de antes da distribuição, que não
+        são apagadas).
+        """
+        ocupadas = posicoes_ocupadas(executar)
+        nao_importadas = []
+        with self.conectar_banco() as conn:
+            cursor = conn.cursor()
+            if self.no:
+                cursor.execute(SQL_DIFERENCA_NO, (ocupadas, self.no))
+            else:
+                cursor.execute(SQL_DIFERENCA, (ocupadas,))
+            linhas = cursor.fetchall()
+            if self.no:
+                cursor.execute("SELECT DISTINCT template_position FROM user_finger WHERE template_position = ANY(%s)",
+                               ([posicao for posicao, _, no_sensor in linhas if no_sensor],))
+                nao_importadas = sorted(linha[0] for linha in cursor.fetchall())
+            cursor.close()
+
+        orfas_sensor = [posicao for posicao, user_id, no_sensor in linhas
+                        if no_sensor and posicao not in nao_importadas]
+        orfas_banco = {posicao: user_id for posicao, user_id, no_sensor in linhas if not no_sensor}
+        return ocupadas, orfas_sensor, orfas_banco, nao_importadas
+
+    def reconciliar(self, executar, aplicar=False, compactar=False):
+        """
+        Acerta sensor e user_finger sem apagar tudo: relata as diferenças e,
+        com `aplicar`, apaga do sensor os templates sem usuário (em blocos
+        de posições consecutivas) e remove de user_finger os vínculos para
+        posições vazias. `compactar` ainda move os templates para o início
+        da memória, fechando os buracos.
+
+        Com `no` a referência é o template_posicao do nó: um vínculo para
+        posição vazia tem o template regravado do repositório central (ou
+        o vínculo removido, se o template foi removido de lá), e user_finger
+        não é alterado.
+        """
+        inicio = time.monotonic()
+        ocupadas, orfas_sensor, orfas_banco, nao_importadas = self.diferenca(executar)
+        print(f"📊 Sensor{f' (nó {self.no})' if self.no else ''}: {len(ocupadas)} templates | "
+              f"órfãos no sensor: {len(orfas_sensor)} | vínculos sem template: {len(orfas_banco)}")
+        if orfas_sensor:
+            print(f"   - Posições sem usuário: {formatar_posicoes(orfas_sensor)}")
+        if nao_importadas:
+            print(f"   - Posições só em user_finger, mantidas (rode 'sincronizacao_templates.py importar'): "
+                  f"{formatar_posicoes(nao_importadas)}")
+        for posicao, user_id in orfas_banco.items():
+            print(f"   - Usuário {user_id} vinculado à posição vazia {posicao}")
+
+        if not aplicar:
+            print(f"ℹ️ Nada alterado ({time.monotonic() - inicio:.1f}s) - use --aplicar para corrigir")
+            return {"ocupadas": len(ocupadas), "orfas_sensor": orfas_sensor, "orfas_banco": orfas_banco,
+                    "nao_importadas": nao_importadas}
+
+        blocos = faixas_consecutivas(orfas_sensor)
+        for posicao, quantidade in blocos:
+            executar(lambda sensor: sensor.deleteTemplate(posicao, quantidade))
+        if orfas_sensor:
+            print(f"🧹 {len(orfas_sensor)} templates órfãos apagados em {len(blocos)} comandos")
+
+        if orfas_banco and self.no:
+            self.regravar(executar, orfas_banco)
+        elif orfas_banco:
+            with self.conectar_banco() as conn:
+                cursor = conn.cursor()
+                cursor.execute("DELETE FROM user_finger WHERE template_position = ANY(%s)", (list(orfas_banco),))
+                conn.commit()
+                cursor.close()
+            print(f"🧹 {len(orfas_banco)} vínculos sem template removidos de user_finger")
+
+        movidos = 0
+        if compactar:
+            validas = set(ocupadas) - set(orfas_sensor) - set(nao_importadas)
+            if self.no:
+                validas |= set(orfas_banco)
+            movidos = self.compactar(executar, sorted(validas), fixas=set(nao_importadas))
+
+        print(f"✅ Reconciliação concluída em {time.monotonic() - inicio:.1f}s")
+        return {"ocupadas": len(ocupadas), "orfas_sensor": orfas_sensor, "orfas_banco": orfas_banco,
+                "nao_importadas": nao_importadas, "movidos": movidos}
+
+    def regravar(self, executar, orfas_banco):
+        """Com `no`: grava de novo, do repositório central, os templates do nó que sumiram do sensor"""
+        def _gravar(posicao, caracteristicas):
+            def _comando(sensor):
+                sensor.uploadCharacteristics(0x01, list(caracteristicas))
+                return sensor.storeTemplate(posicao, 0x01)
+            return _comando
+
+        with self.conectar_banco() as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                SELECT tp.posicao, tc.caracteristicas
+                FROM template_posicao tp JOIN template_central tc ON tc.id = tp.template_id
+                WHERE tp.no = %s AND tp.posicao = ANY(%s)
+            """, (self.no, list(orfas_banco)))
+            templates = cursor.fetchall()
+            removidos = [posicao for posicao, caracteristicas in templates if caracteristicas is None]
+            for posicao, caracteristicas in templates:
+                if caracteristicas is not None:
+                    executar(_gravar(posicao, bytes(caracteristicas)))
+            if removidos:
+                cursor.execute("DELETE FROM template_posicao WHERE no = %s AND posicao = ANY(%s)", (self.no, removidos))
+            conn.commit()
+            cursor.close()
+        print(f"📥 {len(templates) - len(removidos)} templates regravados do repositório central"
+              f"{f', {len(removidos)} vínculos de templates removidos apagados' if removidos else ''}")
+
+    def compactar(self, executar, posicoes, fixas=()):
+        """
+        Move os templates das posições mais altas para os buracos mais
+        baixos. Cada template é gravado na posição nova antes de o banco
+        apontar para ela, e a posição antiga só é apagada depois do commit:
+        uma interrupção deixa no máximo uma cópia órfã, que a próxima
+        reconciliação apaga. As posições em `fixas` ficam onde estão.
+        """
+        ocupadas = set(posicoes) | set(fixas)
+        livres = iter(posicao for posicao in range(len(ocupadas)) if posicao not in ocupadas)
+        movimentos = []
+        for antiga in reversed(posicoes):
+            nova = next(livres, None)
+            if nova is None or nova > antiga:
+                break
+            movimentos.append((antiga, nova))
+
+        def _mover(antiga, nova):
+            def _comando(sensor):
+                sensor.loadTemplate(antiga, 0x01)
+                return sensor.storeTemplate(nova, 0x01)
+            return _comando
+
+        for inicio in range(0, len(movimentos), LOTE_COMPACTACAO):
+            lote = movimentos[inicio:inicio + LOTE_COMPACTACAO]
+            for antiga, nova in lote:
+                executar(_mover(antiga, nova))
+
+            with self.conectar_banco() as conn:
+                cursor = conn.cursor()
+                if self.no:
+                    execute_values(cursor, SQL_MOVER_NO, [(antiga, nova, self.no) for antiga, nova in lote])
+                else:
+                    execute_values(cursor, SQL_MOVER, lote)
+                conn.commit()
+                cursor.close()
+
+            for posicao, quantidade in faixas_consecutivas(antiga for antiga, _ in lote):
+                executar(lambda sensor: sensor.deleteTemplate(posicao, quantidade))
+
+        if movimentos:
+            print(f"📦 {len(movimentos)} templates movidos para o início da memória")
+        return len(movimentos)
+
+
+def argumentos():
+    parser = argparse.ArgumentParser(description="Manutenção dos templates do sensor")
+    parser.add_argument('operacao', nargs='?', choices=['limpar', 'reconciliar'], default='limpar')
+    parser.add_argument('--aplicar', action='store_true', help="corrige as diferenças encontradas")
+    parser.add_argument('--compactar', action='store_true', help="fecha os buracos na memória do sensor (implica --aplicar)")
+    parser.add_argument('--no', default=os.environ.get('CATRACA_NO'),
+                        help="nó da distribuição de templates (padrão: CATRACA_NO)")
+    return parser.parse_args()
+
+
 if __name__ == "__main__":
-    GerenciamentoDigital().limpar_templates()
\ No newline at end of file
+    args = argumentos()
+    gerenciamento = GerenciamentoDigital(args.no)
+    if args.operacao == 'limpar':
+        gerenciamento.limpar_templates()
+    else:
+        sensor = gerenciamento.conectar_sensor()
+        if sensor:
+            gerenciamento.reconciliar(executar_direto(sensor), aplicar=args.aplicar or args.compactar,
+                                      compactar=args.compactar)
\ No newline at end of file
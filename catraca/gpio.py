@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+
+import os
+import select
+import tempfile
+import threading
+import time
+
+# Intervalo de leitura quando o pino não suporta interrupção por borda
+INTERVALO_POLLING = 0.01
+
+
+class PinoGPIO:
+    """
+    Pino GPIO via sysfs com o arquivo 'value' mantido aberto.
+
+    Pinos de entrada tentam configurar 'edge' e esperam mudanças com
+    poll(POLLPRI), sem custo de CPU enquanto nada acontece. Se o pino (ou o
+    simulador) não tiver 'edge', a espera cai para leitura periódica no
+    mesmo descritor, a cada INTERVALO_POLLING segundos.
+    """
+
+    def __init__(self, caminho_valor, saida=False, borda='both'):
+        self.caminho_valor = caminho_valor
+        self.saida = saida
+        self.fd = os.open(caminho_valor, os.O_RDWR if saida else os.O_RDONLY)
+        self.lock = threading.Lock()
+        self.poller = None
+        self.suporta_borda = False
+
+        if not saida:
+            self.suporta_borda = self._configurar_borda(borda)
+            if self.suporta_borda:
+                self.poller = select.poll()
+                self.poller.register(self.fd, select.POLLPRI | select.POLLERR)
+
+    def _configurar_borda(self, borda):
+        caminho_borda = os.path.join(os.path.dirname(self.caminho_valor), 'edge')
+        if not os.path.exists(caminho_borda):
+            return False
+        try:
+            with open(caminho_borda, 'w') as f:
+                f.write(borda)
+            return True
+        except OSError:
+            return False
+
+    def ler(self):
+        with self.lock:
+            os.lseek(self.fd, 0, os.SEEK_SET)
+            conteudo = os.read(self.fd, 8).strip()
+        return int(conteudo or 0)
+
+    def escrever(self, valor):
+        with self.lock:
+            os.lseek(self.fd, 0, os.SEEK_SET)
+            os.write(self.fd, b'1' if valor else b'0')
+
+    def aguardar(self, valor, timeout):
+        """Espera o pino chegar a `valor`; retorna False se o tempo acabar"""
+        limite = time.monotonic() + timeout
+
+        # A leitura também rearma a notificação de borda do sysfs
+        if self.ler() == valor:
+            return True
+
+        while True:
+            restante = limite - time.monotonic()
+            if restante <= 0:
+                return False
+
+            if self.suporta_borda:
+                self.poller.poll(int(restante * 1000) + 1)
+            else:
+                time.sleep(min(INTERVALO_POLLING, restante))
+
+            if self.ler() == valor:
+                return True
+
+    def fechar(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+
+class SimuladorGPIO:
+    """
+    GPIOs de mentira em arquivos comuns, no mesmo layout do sysfs.
+
+    Não há arquivo 'edge', então os pinos abertos sobre o simulador usam a
+    espera por leitura periódica. Serve para rodar a catraca e exercitar
+    `liberar_catraca` sem a placa.
+    """
+
+    def __init__(self, diretorio=None):
+        self.diretorio = diretorio or tempfile.mkdtemp(prefix='gpio_simulado_')
+
+    def caminho(self, numero):
+        """Cria (se preciso) e retorna o caminho do 'value' do pino"""
+        pasta = os.path.join(self.diretorio, f'gpio{numero}')
+        os.makedirs(pasta, exist_ok=True)
+        caminho = os.path.join(pasta, 'value')
+        if not os.path.exists(caminho):
+            with open(caminho, 'w') as f:
+                f.write('0\n')
+        return caminho
+
+    def definir(self, numero, valor):
+        with open(self.caminho(numero), 'w') as f:
+            f.write(f'{int(valor)}\n')
+
+    def ler(self, numero):
+        with open(self.caminho(numero)) as f:
+            return int(f.read().strip() or 0)
+
+    def pulso(self, numero, atraso=0.5, duracao=0.3):
+        """Simula uma passagem: sobe o pino após `atraso` e desce após `duracao`"""
+        def _pulso():
+            time.sleep(atraso)
+            self.definir(numero, 1)
+            time.sleep(duracao)
+            self.definir(numero, 0)
+
+        thread = threading.Thread(target=_pulso, daemon=True)
+        thread.start()
+        return thread
@@ -0,0 +1,350 @@
+#!/usr/bin/env python3
+
+import json
+import select
+from array import array
+import threading
+import time
+
+from log_catraca import componente
+
+log = componente('indice')
+
+# Canal usado pelos gatilhos do banco para avisar alterações de biometria
+CANAL_BIOMETRIA = 'biometria_alterada'
+
+# Capacidade usada quando o sensor ainda não informou a sua
+CAPACIDADE_PADRAO = 1000
+
+# Posição sem template (ou sem usuário) na tabela de slots
+VAZIA = -1
+
+# Recarga completa periódica, além das notificações
+INTERVALO_SINCRONIZACAO = 300
+
+SQL_GATILHOS = """
+CREATE OR REPLACE FUNCTION public.notificar_biometria_alterada() RETURNS trigger
+    LANGUAGE plpgsql
+    AS $$
+DECLARE
+    v_user_id INTEGER;
+BEGIN
+    IF TG_TABLE_NAME = 'usuario' THEN
+        v_user_id := COALESCE(NEW.id, OLD.id);
+    ELSE
+        v_user_id := COALESCE(NEW.user_id, OLD.user_id);
+    END IF;
+
+    PERFORM pg_notify('biometria_alterada', json_build_object(
+        'tabela', TG_TABLE_NAME,
+        'operacao', TG_OP,
+        'user_id', v_user_id
+    )::text);
+
+    RETURN NULL;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS user_finger_notify_biometria ON public.user_finger;
+CREATE TRIGGER user_finger_notify_biometria
+    AFTER INSERT OR UPDATE OR DELETE ON public.user_finger
+    FOR EACH ROW EXECUTE FUNCTION public.notificar_biometria_alterada();
+
+DROP TRIGGER IF EXISTS usuario_notify_biometria ON public.usuario;
+CREATE TRIGGER usuario_notify_biometria
+    AFTER UPDATE OF nome, tipo, identificador OR DELETE ON public.usuario
+    FOR EACH ROW EXECUTE FUNCTION public.notificar_biometria_alterada();
+"""
+
+SQL_TODOS = """
+    SELECT uf.template_position, u.id, u.nome, u.tipo, u.identificador
+    FROM usuario u
+    JOIN user_finger uf ON u.id = uf.user_id
+    WHERE uf.template_position IS NOT NULL
+"""
+
+SQL_POR_USUARIO = SQL_TODOS + " AND u.id = %s"
+
+# Com distribuição de templates (CATRACA_NO), as posições são as deste nó
+SQL_TODOS_NO = """
+    SELECT tp.posicao, u.id, u.nome, u.tipo, u.identificador
+    FROM usuario u
+    JOIN template_posicao tp ON u.id = tp.user_id
+    WHERE tp.no = %s
+"""
+
+SQL_POR_USUARIO_NO = SQL_TODOS_NO + " AND u.id = %s"
+
+SQL_POR_POSICAO_NO = SQL_TODOS_NO + " AND tp.posicao = %s"
+
+
+class IndiceBiometria:
+    """
+    Índice residente posição do template -> (id, nome, tipo, identificador).
+
+    `slots` é um array de inteiros do tamanho da capacidade do sensor com o
+    id do usuário de cada posição (VAZIA se não houver), e `usuarios` guarda
+    os dados de cada usuário uma vez só. Um usuário pode ter vários dedos
+    (várias posições) e qualquer um deles resolve com dois acessos em
+    memória, sem ida ao banco. O índice é aquecido na inicialização e
+    atualizado por usuário a cada NOTIFY recebido no canal
+    'biometria_alterada'.
+
+    Se houver um `snapshot`, toda carga vinda do banco é espelhada nele, e
+    ele é usado para aquecer o índice quando o banco não responde.
+
+    Com `no` informado, as posições vêm de `template_posicao` daquele nó
+    (ver sincronizacao_templates) em vez de `user_finger`.
+    """
+
+    def __init__(self, pool, capacidade=CAPACIDADE_PADRAO, snapshot=None, no=None):
+        self.pool = pool
+        self.snapshot = snapshot
+        self.no = no
+        self.capacidade = capacidade
+        self.slots = array('i', [VAZIA]) * capacidade
+        self.usuarios = {}
+        self.posicoes_por_usuario = {}
+        self.lock = threading.Lock()
+        self.aquecido = False
+        self.ultima_atualizacao = None
+        self.origem = None
+        self.conectado = False
+        self.running = True
+        self.thread_escuta = None
+
+    def conectar_escuta(self):
+        # O LISTEN prende a conexão indefinidamente, então ela fica fora do pool
+        import psycopg2
+        return psycopg2.connect(**self.pool.config)
+
+    # ==================== CONSULTA ====================
+
+    def buscar(self, posicao):
+        """Retorna o usuário da posição sem acessar o banco (None se vazia)"""
+        if 0 <= posicao < len(self.slots):
+            usuario_id = self.slots[posicao]
+            if usuario_id != VAZIA:
+                return self.usuarios.get(usuario_id)
+        return None
+
+    def posicoes_do_usuario(self, usuario_id):
+        return sorted(self.posicoes_por_usuario.get(usuario_id, ()))
+
+    def __len__(self):
+        return len(self.posicoes_por_usuario)
+
+    # ==================== CARGA ====================
+
+    def aquecer(self):
+        """Carrega todas as posições vinculadas em uma única consulta"""
+        with self.pool.conexao() as conn:
+            cursor = conn.cursor()
+            if self.no:
+                cursor.execute(SQL_TODOS_NO, (self.no,))
+            else:
+                cursor.execute(SQL_TODOS)
+            linhas = cursor.fetchall()
+            cursor.close()
+
+        self.carregar(linhas, time.time())
+        self.origem = 'banco'
+        log.info(f"🗂️ Índice biométrico aquecido: {len(linhas)} posições")
+
+        if self.snapshot:
+            try:
+                self.snapshot.salvar(linhas)
+            except Exception as e:
+                log.warning(f"⚠️ Erro ao salvar snapshot local: {e}")
+        return len(linhas)
+
+    def aquecer_do_snapshot(self):
+        """Carrega o índice a partir do snapshot local (banco indisponível)"""
+        linhas = self.snapshot.carregar()
+        self.carregar(linhas, self.snapshot.sincronizado_em)
+        self.origem = 'snapshot'
+        log.info(f"💾 Índice biométrico carregado do snapshot local: {len(linhas)} posições")
+        return len(linhas)
+
+    def carregar(self, linhas, atualizado_em=None):
+        """
+        Substitui o conteúdo do índice por (posicao, id, nome, tipo, identificador).
+
+        `atualizado_em` é o instante em que as linhas saíram do banco; sem
+        ele (snapshot que nunca sincronizou) os dados ficam sem idade e a
+        catraca os trata como expirados.
+        """
+        capacidade = self.capacidade
+        for linha in linhas:
+            capacidade = max(capacidade, linha[0] + 1)
+
+        slots = array('i', [VAZIA]) * capacidade
+        usuarios = {}
+        posicoes_por_usuario = {}
+        for posicao, usuario_id, nome, tipo, identificador in linhas:
+            slots[posicao] = usuario_id
+            usuarios[usuario_id] = (usuario_id, nome, tipo, identificador)
+            posicoes_por_usuario.setdefault(usuario_id, set()).add(posicao)
+
+        with self.lock:
+            self.slots = slots
+            self.usuarios = usuarios
+            self.posicoes_por_usuario = posicoes_por_usuario
+            self.aquecido = True
+            self.ultima_atualizacao = atualizado_em
+
+    def atualizar_usuario(self, usuario_id):
+        """Recarrega somente as posições de um usuário"""
+        with self.pool.conexao() as conn:
+            cursor = conn.cursor()
+            if self.no:
+                cursor.execute(SQL_POR_USUARIO_NO, (self.no, usuario_id))
+            else:
+                cursor.execute(SQL_POR_USUARIO, (usuario_id,))
+            linhas = cursor.fetchall()
+            cursor.close()
+
+        self.aplicar_usuario(usuario_id, linhas)
+
+        if self.snapshot:
+            try:
+                self.snapshot.atualizar_usuario(usuario_id, linhas)
+            except Exception as e:
+                log.warning(f"⚠️ Erro ao atualizar snapshot local: {e}")
+
+    def aplicar_usuario(self, usuario_id, linhas):
+        """Troca as posições de um usuário pelas linhas informadas"""
+        with self.lock:
+            for posicao in self.posicoes_por_usuario.pop(usuario_id, ()):
+                if posicao < len(self.slots):
+                    self.slots[posicao] = VAZIA
+            self.usuarios.pop(usuario_id, None)
+
+            for posicao, _, nome, tipo, identificador in linhas:
+                self._garantir_capacidade(posicao + 1)
+                anterior = self.slots[posicao]
+                if anterior != VAZIA and anterior != usuario_id:
+                    restantes = self.posicoes_por_usuario.get(anterior, set())
+                    restantes.discard(posicao)
+                    if not restantes:
+                        self.posicoes_por_usuario.pop(anterior, None)
+                        self.usuarios.pop(anterior, None)
+                self.slots[posicao] = usuario_id
+                self.usuarios[usuario_id] = (usuario_id, nome, tipo, identificador)
+                self.posicoes_por_usuario.setdefault(usuario_id, set()).add(posicao)
+
+            self.ultima_atualizacao = time.time()
+
+    def resolver_ausente(self, posicao):
+        """
+        Consulta o banco para uma posição que não está no índice.
+
+        Só acontece se uma notificação se perdeu; o resultado é gravado no
+        índice para que o próximo match já saia da memória.
+        """
+        with self.pool.conexao() as conn:
+            cursor = conn.cursor()
+            if self.no:
+                cursor.execute(SQL_POR_POSICAO_NO, (self.no, posicao))
+            else:
+                cursor.execute("EXECUTE buscar_usuario_por_posicao (%s)", (posicao,))
+            linha = cursor.fetchone()
+            cursor.close()
+
+        if not linha:
+            return None
+
+        self.atualizar_usuario(linha[1])
+        return self.buscar(posicao)
+
+    def ajustar_capacidade(self, capacidade):
+        """Dimensiona os slots pela capacidade informada pelo sensor (sem perder posições ocupadas)"""
+        with self.lock:
+            self.capacidade = capacidade
+            maior = max((posicao for posicoes in self.posicoes_por_usuario.values() for posicao in posicoes), default=-1)
+            tamanho = max(capacidade, maior + 1)
+            if tamanho > len(self.slots):
+                self.slots.extend([VAZIA] * (tamanho - len(self.slots)))
+            else:
+                del self.slots[tamanho:]
+
+    def _garantir_capacidade(self, tamanho):
+        if tamanho > len(self.slots):
+            self.slots.extend([VAZIA] * (tamanho - len(self.slots)))
+
+    # ==================== LISTEN/NOTIFY ====================
+
+    def instalar_gatilhos(self):
+        """Cria (ou recria) os gatilhos que publicam no canal de biometria"""
+        try:
+            with self.pool.conexao() as conn:
+                cursor = conn.cursor()
+                cursor.execute(SQL_GATILHOS)
+                conn.commit()
+                cursor.close()
+            return True
+        except Exception as e:
+            log.warning(f"⚠️ Não foi possível instalar gatilhos de biometria: {e}")
+            return False
+
+    def iniciar_escuta(self):
+        self.thread_escuta = threading.Thread(target=self._escutar, daemon=True)
+        self.thread_escuta.start()
+
+    def parar(self):
+        self.running = False
+        if self.thread_escuta:
+            self.thread_escuta.join(timeout=5)
+
+    def _escutar(self):
+        """Mantém um LISTEN aberto; reaquece o índice a cada reconexão"""
+        espera = 1
+        reconexao = False
+
+        while self.running:
+            conn = None
+            try:
+                conn = self.conectar_escuta()
+                import psycopg2.extensions
+                conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+                cursor = conn.cursor()
+                cursor.execute(f"LISTEN {CANAL_BIOMETRIA};")
+
+                # Notificações perdidas enquanto estávamos desconectados
+                if reconexao or self.origem != 'banco':
+                    self.aquecer()
+                reconexao = True
+                self.conectado = True
+                espera = 1
+                proxima_sincronizacao = time.monotonic() + INTERVALO_SINCRONIZACAO
+
+                while self.running:
+                    if time.monotonic() >= proxima_sincronizacao:
+                        self.aquecer()
+                        proxima_sincronizacao = time.monotonic() + INTERVALO_SINCRONIZACAO
+
+                    if select.select([conn], [], [], 5) == ([], [], []):
+                        continue
+                    conn.poll()
+                    while conn.notifies:
+                        self._tratar_notificacao(conn.notifies.pop(0).payload)
+
+            except Exception as e:
+                self.conectado = False
+                log.error(f"❌ Escuta do índice biométrico interrompida: {e}")
+                time.sleep(espera)
+                espera = min(espera * 2, 30)
+            finally:
+                if conn is not None:
+                    conn.close()
+
+    def _tratar_notificacao(self, payload):
+        try:
+            dados = json.loads(payload)
+            usuario_id = dados['user_id']
+        except (ValueError, KeyError, TypeError):
+            self.aquecer()
+            return
+
+        self.atualizar_usuario(usuario_id)
+        log.info(f"🗂️ Índice biométrico atualizado para usuário {usuario_id}")
@@ -0,0 +1,274 @@
+#!/usr/bin/env python3
+"""
+Comunicação entre o processo do hardware e o processo da API.
+
+O processo do hardware (sensor, catraca, cadastro) publica uma fotografia
+do seu estado num bloco de memória compartilhada (arquivo em /dev/shm); a API lê esse bloco sem
+falar com o outro processo, então nenhuma requisição toma tempo dele. As
+ações (cadastro, teste da catraca, backup...) vão por um socket Unix, um
+comando por vez em cada conexão.
+"""
+
+import json
+import mmap
+import os
+import struct
+import threading
+import time
+from multiprocessing import connection
+
+from log_catraca import componente
+
+log = componente('ipc')
+
+TAMANHO_BLOCO = 512 * 1024
+CABECALHO = struct.Struct('<QQ')  # sequência, tamanho do JSON
+INTERVALO_ESTADO = 0.25           # segundos entre publicações
+LIMITE_IDADE = 5.0                # estado mais velho que isso: hardware sem resposta
+TIMEOUT_COMANDO = 15.0
+CONEXOES_MAXIMAS = 4
+
+
+class HardwareIndisponivel(Exception):
+    """O processo do hardware não publicou estado ou não atende comandos"""
+
+
+# ==================== BLOCO DE ESTADO ====================
+
+class BlocoEstado:
+    """
+    JSON num arquivo mapeado em memória (em /dev/shm), protegido por uma
+    sequência (seqlock).
+
+    Quem escreve deixa a sequência ímpar durante a escrita e par ao
+    terminar; quem lê repete a leitura se a sequência estava ímpar ou mudou
+    no meio. O escritor nunca espera pelos leitores. O arquivo sobrevive a
+    um reinício do hardware e a sequência continua de onde parou, então a
+    API não precisa reabrir nada.
+    """
+
+    def __init__(self, caminho, escrita=False, tamanho=TAMANHO_BLOCO):
+        self.caminho = caminho
+        if escrita:
+            fd = os.open(caminho, os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                if os.fstat(fd).st_size < tamanho:
+                    os.ftruncate(fd, tamanho)
+                self.memoria = mmap.mmap(fd, 0)
+            finally:
+                os.close(fd)
+            self.sequencia = CABECALHO.unpack_from(self.memoria, 0)[0]
+            if self.sequencia % 2:
+                # Escrita interrompida por uma queda
+                self.sequencia += 1
+        else:
+            fd = os.open(caminho, os.O_RDONLY)
+            try:
+                self.memoria = mmap.mmap(fd, 0, prot=mmap.PROT_READ)
+            finally:
+                os.close(fd)
+            self.sequencia = 0
+        self.cache = (None, None)
+
+    def publicar(self, estado):
+        dados = json.dumps(estado, ensure_ascii=False, default=str).encode('utf-8')
+        capacidade = len(self.memoria) - CABECALHO.size
+        if len(dados) > capacidade:
+            dados = json.dumps({"erro": f"estado com {len(dados)} bytes não cabe no bloco",
+                                "publicado_em": time.time()}).encode('utf-8')
+
+        self.sequencia += 1
+        CABECALHO.pack_into(self.memoria, 0, self.sequencia, 0)
+        self.memoria[CABECALHO.size:CABECALHO.size + len(dados)] = dados
+        self.sequencia += 1
+        CABECALHO.pack_into(self.memoria, 0, self.sequencia, len(dados))
+
+    def ler(self, tentativas=100):
+        """Último estado publicado (None se nada foi publicado ainda)"""
+        for _ in range(tentativas):
+            sequencia, tamanho = CABECALHO.unpack_from(self.memoria, 0)
+            if sequencia == 0:
+                return None
+            if sequencia % 2:
+                time.sleep(0.001)
+                continue
+            if sequencia == self.cache[0]:
+                return self.cache[1]
+
+            dados = self.memoria[CABECALHO.size:CABECALHO.size + tamanho]
+            if CABECALHO.unpack_from(self.memoria, 0)[0] != sequencia:
+                continue
+            try:
+                estado = json.loads(dados)
+            except ValueError:
+                continue
+            self.cache = (sequencia, estado)
+            return estado
+        raise HardwareIndisponivel("Estado do hardware em escrita contínua")
+
+    def fechar(self):
+        self.memoria.close()
+
+
+def publicar_estado(bloco, obter_estado, esperar, running):
+    """
+    Laço do processo do hardware: publica `obter_estado()` a cada
+    INTERVALO_ESTADO, ou antes se `esperar(timeout)` retornar cedo.
+    """
+    while running():
+        try:
+            bloco.publicar(obter_estado())
+        except Exception as e:
+            log.error(f"❌ Erro ao publicar estado do hardware: {e}")
+        esperar(INTERVALO_ESTADO)
+
+
+# ==================== COMANDOS ====================
+
+class ServidorComandos:
+    """Socket Unix do processo do hardware: (nome, argumentos) -> resultado"""
+
+    def __init__(self, endereco, chave, executar):
+        self.endereco = endereco
+        self.chave = chave
+        self.executar = executar
+        self.listener = None
+        self.thread = None
+        self.running = True
+
+    def iniciar(self):
+        if os.path.exists(self.endereco):
+            os.unlink(self.endereco)
+        self.listener = connection.Listener(self.endereco, family='AF_UNIX', authkey=self.chave)
+        os.chmod(self.endereco, 0o600)
+        self.thread = threading.Thread(target=self._aceitar, name="ipc-comandos", daemon=True)
+        self.thread.start()
+
+    def parar(self):
+        self.running = False
+        if self.listener:
+            self.listener.close()
+        if os.path.exists(self.endereco):
+            os.unlink(self.endereco)
+
+    def _aceitar(self):
+        while self.running:
+            try:
+                conn = self.listener.accept()
+            except Exception as e:
+                if self.running:
+                    log.warning(f"⚠️ Conexão de comando recusada: {e}")
+                continue
+            threading.Thread(target=self._atender, args=(conn,), name="ipc-conexao", daemon=True).start()
+
+    def _atender(self, conn):
+        with conn:
+            while self.running:
+                try:
+                    nome, argumentos = conn.recv()
+                except (EOFError, OSError):
+                    return
+                try:
+                    resposta = {"ok": True, "resultado": self.executar(nome, argumentos)}
+                except Exception as e:
+                    resposta = {"ok": False, "erro": str(e)}
+                try:
+                    conn.send(resposta)
+                except (EOFError, OSError):
+                    return
+
+
+class ClienteCatraca:
+    """
+    Lado da API. `estado()` lê o bloco compartilhado; `comando()` envia uma
+    ação ao processo do hardware e espera a resposta. Guarda até
+    CONEXOES_MAXIMAS conexões abertas para requisições simultâneas.
+    """
+
+    def __init__(self, caminho_bloco, endereco, chave, timeout=TIMEOUT_COMANDO):
+        self.caminho_bloco = caminho_bloco
+        self.endereco = endereco
+        self.chave = chave
+        self.timeout = timeout
+        self.bloco = None
+        self.lock = threading.Lock()
+        self.livres = []
+        self.vagas = threading.BoundedSemaphore(CONEXOES_MAXIMAS)
+
+    # ==================== ESTADO ====================
+
+    def estado(self):
+        """Estado publicado pelo hardware, com a idade em `idade_s`"""
+        with self.lock:
+            if self.bloco is None:
+                try:
+                    self.bloco = BlocoEstado(self.caminho_bloco)
+                except (FileNotFoundError, ValueError):
+                    raise HardwareIndisponivel("Processo do hardware ainda não publicou o estado")
+            bloco = self.bloco
+
+        estado = bloco.ler()
+        if estado is None:
+            raise HardwareIndisponivel("Processo do hardware ainda não publicou o estado")
+        return dict(estado, idade_s=round(time.time() - estado.get("publicado_em", 0), 3))
+
+    # ==================== COMANDOS ====================
+
+    def comando(self, nome, /, **argumentos):
+        if not self.vagas.acquire(timeout=self.timeout):
+            raise HardwareIndisponivel("Muitos comandos simultâneos para o hardware")
+        conn = None
+        try:
+            conn = self._conexao()
+            conn.send((nome, argumentos))
+            if not conn.poll(self.timeout):
+                raise HardwareIndisponivel(f"Hardware não respondeu ao comando {nome} em {self.timeout:.0f}s")
+            resposta = conn.recv()
+        except HardwareIndisponivel:
+            self._descartar(conn)
+            raise
+        except (OSError, EOFError, connection.AuthenticationError) as e:
+            self._descartar(conn)
+            raise HardwareIndisponivel(f"Sem comunicação com o processo do hardware: {e}")
+        else:
+            with self.lock:
+                self.livres.append(conn)
+        finally:
+            self.vagas.release()
+
+        if not resposta["ok"]:
+            raise RuntimeError(resposta["erro"])
+        return resposta["resultado"]
+
+    def _conexao(self):
+        with self.lock:
+            if self.livres:
+                return self.livres.pop()
+        return connection.Client(self.endereco, family='AF_UNIX', authkey=self.chave)
+
+    def _descartar(self, conn):
+        if conn is not None:
+            try:
+                conn.close()
+            except OSError:
+                pass
+
+
+def elevar_prioridade(prioridade):
+    """
+    Escalonamento quase tempo real para o processo do hardware: SCHED_RR
+    com `prioridade` (precisa de root ou CAP_SYS_NICE); sem permissão, tenta
+    só um nice menor. Retorna a política aplicada.
+    """
+    if not prioridade:
+        return None
+    try:
+        os.sched_setscheduler(0, os.SCHED_RR, os.sched_param(prioridade))
+        return f"SCHED_RR {prioridade}"
+    except (AttributeError, PermissionError, OSError):
+        pass
+    try:
+        os.nice(-10)
+        return "nice -10"
+    except (AttributeError, PermissionError, OSError):
+        return None
@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+"""
+Logs do serviço sem escrita síncrona no console.
+
+As threads do serviço só enfileiram: o QueueHandler nunca espera (com a
+fila cheia o registro é descartado e contado). Uma thread (QueueListener)
+escreve no console, no buffer circular servido por /api/logs e, se
+configurado, num arquivo com rotação. Cada componente é um logger
+`catraca.<componente>` com o seu nível.
+
+    CATRACA_LOG_NIVEL=INFO                        nível padrão dos componentes
+    CATRACA_LOG_NIVEIS=consulta=DEBUG,webhooks=WARNING,werkzeug=INFO
+    CATRACA_LOG_ARQUIVO=/var/log/catraca/catraca.log   (um arquivo por processo)
+    CATRACA_LOG_CONSOLE=0                         não escreve no console (tty1)
+"""
+
+import atexit
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import threading
+from collections import deque
+
+RAIZ = 'catraca'
+NIVEL_PADRAO = 'INFO'
+CAPACIDADE_BUFFER = 2000   # registros guardados para /api/logs
+TAMANHO_FILA = 10000       # registros esperando a thread de escrita
+TAMANHO_ARQUIVO = 5 * 1024 * 1024
+ARQUIVOS_ROTACAO = 3
+
+# Loggers de bibliotecas que aceitam nível próprio; o werkzeug registra
+# cada requisição em INFO, então por padrão só avisos
+EXTERNOS = {'werkzeug': 'WARNING'}
+
+# Atributos de todo LogRecord; os outros vieram de `extra` e vão em "dados"
+_ATRIBUTOS_PADRAO = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime', 'taskName'}
+
+
+def componente(nome):
+    """Logger de um componente do serviço (catraca.<nome>)"""
+    return logging.getLogger(f"{RAIZ}.{nome}")
+
+
+class FilaLogs(logging.handlers.QueueHandler):
+    """Enfileira sem esperar; acima de `limite` registros na fila, descarta"""
+
+    def __init__(self, fila, limite=TAMANHO_FILA):
+        super().__init__(fila)
+        self.limite = limite
+        self.descartados = 0
+
+    def enqueue(self, record):
+        if self.queue.qsize() >= self.limite:
+            self.descartados += 1
+            return
+        self.queue.put_nowait(record)
+
+
+class BufferLogs(logging.Handler):
+    """Últimos `capacidade` registros, já estruturados, com id crescente"""
+
+    def __init__(self, capacidade=CAPACIDADE_BUFFER):
+        super().__init__()
+        self.registros = deque(maxlen=capacidade)
+        self.ultimo_id = 0
+        self.lock_registros = threading.Lock()
+
+    def emit(self, record):
+        dados = {chave: valor if isinstance(valor, (str, int, float, bool, type(None))) else str(valor)
+                 for chave, valor in vars(record).items() if chave not in _ATRIBUTOS_PADRAO}
+        nome = record.name
+        if nome.startswith(RAIZ + '.'):
+            nome = nome[len(RAIZ) + 1:]
+        registro = {
+            "momento": record.created,
+            "nivel": record.levelname,
+            "componente": nome,
+            "mensagem": record.getMessage(),
+            "thread": record.threadName,
+        }
+        if dados:
+            registro["dados"] = dados
+        with self.lock_registros:
+            self.ultimo_id += 1
+            registro["id"] = self.ultimo_id
+            self.registros.append(registro)
+
+    def consultar(self, desde=0, nivel=None, componente=None, limite=200):
+        """Registros com id maior que `desde`, do nível para cima, do componente (e subcomponentes)"""
+        minimo = logging.getLevelName(nivel.upper()) if nivel else logging.NOTSET
+        if not isinstance(minimo, int):
+            raise ValueError(f"Nível de log desconhecido: {nivel}")
+        with self.lock_registros:
+            registros = list(self.registros)
+        selecionados = [
+            registro for registro in registros
+            if registro["id"] > desde
+            and logging.getLevelName(registro["nivel"]) >= minimo
+            and (componente is None or registro["componente"] == componente
+                 or registro["componente"].startswith(componente + '.'))
+        ]
+        return selecionados[-limite:]
+
+
+class Logs:
+    """Fila, thread de escrita e destinos de um processo (ver configurar_logs)"""
+
+    def __init__(self, niveis, arquivo=None, console=True, capacidade=CAPACIDADE_BUFFER):
+        self.niveis = niveis
+        self.arquivo = arquivo
+        self.buffer = BufferLogs(capacidade)
+        self.fila = FilaLogs(queue.SimpleQueue())
+
+        destinos = [self.buffer]
+        if console:
+            saida = logging.StreamHandler(sys.stdout)
+            saida.setFormatter(logging.Formatter('%(asctime)s %(message)s', '%H:%M:%S'))
+            destinos.append(saida)
+        if arquivo:
+            rotativo = logging.handlers.RotatingFileHandler(arquivo, maxBytes=TAMANHO_ARQUIVO,
+                                                            backupCount=ARQUIVOS_ROTACAO, encoding='utf-8')
+            rotativo.setFormatter(logging.Formatter('%(asctime)s %(levelname)s %(name)s [%(threadName)s] %(message)s'))
+            destinos.append(rotativo)
+        self.listener = logging.handlers.QueueListener(self.fila.queue, *destinos, respect_handler_level=True)
+        self.lock_parada = threading.Lock()
+
+    def iniciar(self):
+        raiz = logging.getLogger()
+        raiz.addHandler(self.fila)
+        for nome, nivel in self.niveis.items():
+            logging.getLogger(nome).setLevel(nivel)
+        self.listener.start()
+
+    def parar(self):
+        """Escreve o que ainda está na fila e para a thread (pode ser chamado de novo)"""
+        with self.lock_parada:
+            if self.listener._thread is not None:
+                self.listener.stop()
+
+    def consultar(self, desde=0, nivel=None, componente=None, limite=200):
+        return self.buffer.consultar(desde, nivel, componente, limite)
+
+    def metricas(self):
+        return {
+            "niveis": dict(self.niveis),
+            "fila": self.fila.queue.qsize(),
+            "descartados": self.fila.descartados,
+            "buffer": len(self.buffer.registros),
+            "ultimo_id": self.buffer.ultimo_id,
+            "arquivo": self.arquivo,
+        }
+
+
+def ler_niveis(padrao=None, por_componente=None):
+    """'INFO' e 'consulta=DEBUG,werkzeug=INFO' -> {nome do logger: nível}"""
+    niveis = {RAIZ: (padrao or NIVEL_PADRAO).upper(), **EXTERNOS}
+    for item in filter(None, (por_componente or '').split(',')):
+        nome, _, nivel = item.partition('=')
+        nome, nivel = nome.strip(), nivel.strip().upper()
+        if not isinstance(logging.getLevelName(nivel), int):
+            raise ValueError(f"Nível de log desconhecido em CATRACA_LOG_NIVEIS: {item}")
+        niveis[nome if nome in EXTERNOS or nome == RAIZ else f"{RAIZ}.{nome}"] = nivel
+    return niveis
+
+
+_logs = None
+
+
+def configurar_logs(processo=None):
+    """
+    Liga os logs deste processo (uma vez; as chamadas seguintes retornam a
+    mesma configuração). Com CATRACA_LOG_ARQUIVO e `processo`, cada
+    processo escreve no seu arquivo (catraca.hardware.log, catraca.api.log).
+    """
+    global _logs
+    if _logs is not None:
+        return _logs
+
+    arquivo = os.environ.get('CATRACA_LOG_ARQUIVO')
+    if arquivo and processo:
+        raiz, extensao = os.path.splitext(arquivo)
+        arquivo = f"{raiz}.{processo}{extensao or '.log'}"
+    _logs = Logs(
+        ler_niveis(os.environ.get('CATRACA_LOG_NIVEL'), os.environ.get('CATRACA_LOG_NIVEIS')),
+        arquivo=arquivo,
+        console=os.environ.get('CATRACA_LOG_CONSOLE', '1') != '0',
+    )
+    _logs.iniciar()
+    atexit.register(_logs.parar)
+    return _logs
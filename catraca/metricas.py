@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+
+import threading
+import time
+from contextlib import contextmanager
+
+# Limites (segundos) dos histogramas de latência: de 1 ms a 10 s
+BUCKETS_PADRAO = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Contador:
+    def __init__(self):
+        self.valor = 0
+        self.lock = threading.Lock()
+
+    def inc(self, quantidade=1):
+        with self.lock:
+            self.valor += quantidade
+
+
+class Histograma:
+    def __init__(self, buckets=BUCKETS_PADRAO):
+        self.buckets = tuple(buckets)
+        self.contagens = [0] * len(self.buckets)
+        self.soma = 0.0
+        self.total = 0
+        self.lock = threading.Lock()
+
+    def observar(self, valor):
+        with self.lock:
+            self.soma += valor
+            self.total += 1
+            for i, limite in enumerate(self.buckets):
+                if valor <= limite:
+                    self.contagens[i] += 1
+                    break
+
+    def acumulado(self):
+        """Contagens cumulativas por bucket, como o Prometheus espera"""
+        with self.lock:
+            acumulado, resultado = 0, []
+            for contagem in self.contagens:
+                acumulado += contagem
+                resultado.append(acumulado)
+            return resultado, self.soma, self.total
+
+
+class Familia:
+    """Uma métrica com nome, tipo e um filho por combinação de rótulos"""
+
+    def __init__(self, nome, tipo, ajuda, rotulos=(), fabrica=None):
+        self.nome = nome
+        self.tipo = tipo
+        self.ajuda = ajuda
+        self.rotulos = tuple(rotulos)
+        self.fabrica = fabrica
+        self.filhos = {}
+        self.lock = threading.Lock()
+        if not self.rotulos:
+            # Série única: exposta com zero desde o início
+            self.rotulo()
+
+    def rotulo(self, **valores):
+        chave = tuple(str(valores[r]) for r in self.rotulos)
+        filho = self.filhos.get(chave)
+        if filho is None:
+            with self.lock:
+                filho = self.filhos.setdefault(chave, self.fabrica())
+        return filho
+
+    # Atalhos para famílias sem rótulos
+    def inc(self, quantidade=1):
+        self.rotulo().inc(quantidade)
+
+    def observar(self, valor):
+        self.rotulo().observar(valor)
+
+
+class RegistroMetricas:
+    """
+    Registro central de contadores, histogramas e medidores.
+
+    Contadores e histogramas são atualizados nos caminhos quentes com um
+    lock curto por série; medidores são funções lidas só na hora de gerar
+    o texto do /api/metrics.
+    """
+
+    def __init__(self):
+        self.familias = []
+        self.medidores = []
+
+    def contador(self, nome, ajuda, rotulos=()):
+        familia = Familia(nome, 'counter', ajuda, rotulos, Contador)
+        self.familias.append(familia)
+        return familia
+
+    def histograma(self, nome, ajuda, rotulos=(), buckets=BUCKETS_PADRAO):
+        familia = Familia(nome, 'histogram', ajuda, rotulos, lambda: Histograma(buckets))
+        self.familias.append(familia)
+        return familia
+
+    def medidor(self, nome, ajuda, funcao):
+        """Valor lido na hora da coleta; `funcao` retorna um número (ou None para omitir)"""
+        self.medidores.append((nome, ajuda, funcao))
+
+    def renderizar(self):
+        """Texto no formato de exposição do Prometheus (0.0.4)"""
+        linhas = []
+
+        for familia in self.familias:
+            # Contador: HELP, TYPE e amostras com o mesmo nome, já com _total
+            nome = f"{familia.nome}_total" if familia.tipo == 'counter' else familia.nome
+            linhas.append(f"# HELP {nome} {familia.ajuda}")
+            linhas.append(f"# TYPE {nome} {familia.tipo}")
+            for chave, filho in sorted(familia.filhos.items()):
+                rotulos = _formatar_rotulos(familia.rotulos, chave)
+                if familia.tipo == 'counter':
+                    linhas.append(f"{nome}{_chaves(rotulos)} {filho.valor}")
+                else:
+                    acumulado, soma, total = filho.acumulado()
+                    limites = [str(limite) for limite in filho.buckets] + ['+Inf']
+                    for limite, contagem in zip(limites, acumulado + [total]):
+                        le = rotulos + ['le="%s"' % limite]
+                        linhas.append(f"{familia.nome}_bucket{_chaves(le)} {contagem}")
+                    linhas.append(f"{familia.nome}_sum{_chaves(rotulos)} {soma}")
+                    linhas.append(f"{familia.nome}_count{_chaves(rotulos)} {total}")
+
+        for nome, ajuda, funcao in self.medidores:
+            try:
+                valor = funcao()
+            except Exception:
+                continue
+            if valor is None:
+                continue
+            linhas.append(f"# HELP {nome} {ajuda}")
+            linhas.append(f"# TYPE {nome} gauge")
+            linhas.append(f"{nome} {float(valor)}")
+
+        return "\n".join(linhas) + "\n"
+
+
+def _formatar_rotulos(nomes, valores):
+    return [f'{nome}="{_escapar(valor)}"' for nome, valor in zip(nomes, valores)]
+
+
+def _chaves(rotulos):
+    return "{" + ",".join(rotulos) + "}" if rotulos else ""
+
+
+def _escapar(valor):
+    return str(valor).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+@contextmanager
+def cronometrar(histograma, **rotulos):
+    """Mede o bloco com perf_counter e registra no histograma"""
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        histograma.rotulo(**rotulos).observar(time.perf_counter() - inicio)
+
+
+# ==================== MÉTRICAS DA CATRACA ====================
+
+registro = RegistroMetricas()
+
+DURACAO_ETAPA = registro.histograma(
+    'catraca_etapa_duracao_segundos',
+    'Duração de cada etapa do reconhecimento e do cadastro',
+    ('fluxo', 'etapa')
+)
+RECONHECIMENTOS = registro.contador(
+    'catraca_reconhecimentos',
+    'Resultados das tentativas de reconhecimento',
+    ('faixa', 'resultado')
+)
+PASSAGENS = registro.contador(
+    'catraca_passagens',
+    'Liberações da catraca por resultado',
+    ('faixa', 'resultado')
+)
+RESULTADOS_SENSOR = registro.contador(
+    'catraca_sensor_resultados',
+    'Resultados do sensor por classe (ok, ocioso, sem_match, erro_protocolo, desconectado)',
+    ('faixa', 'classe')
+)
+REINICIALIZACOES_SENSOR = registro.contador(
+    'catraca_sensor_reinicializacoes',
+    'Reinicializações do sensor biométrico',
+    ('faixa',)
+)
+ACESSOS_SUPRIMIDOS = registro.contador(
+    'catraca_acessos_suprimidos',
+    'Reconhecimentos que não abriram a catraca (repetição ou anti-passback)',
+    ('faixa', 'motivo')
+)
+CADASTROS = registro.contador(
+    'catraca_cadastros',
+    'Cadastros de biometria por resultado',
+    ('resultado',)
+)
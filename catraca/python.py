@@ -1,17 +1,42 @@
 #!/usr/bin/env python3
 
-import psycopg2
 import time
+import os
+
+# Início do serviço, antes das importações pesadas: os marcos da
+# inicialização contam daqui (o processo do hardware recebe o do pai)
+INICIO = float(os.environ.setdefault('CATRACA_INICIO', str(time.monotonic())))
+
 import threading
 import json
+import argparse
+import multiprocessing
 from datetime import datetime
-from pyfingerprint.pyfingerprint import PyFingerprint
-from flask import Flask, request, jsonify
+from sensor import criar_sensor
+from flask import Flask, request, jsonify, Response, stream_with_context
 import logging
 import signal
 import sys
-import requests
-from threading import Thread
+from banco import obter_pool, migrar_dedos, DEDOS_POR_USUARIO
+from indice_biometria import IndiceBiometria
+from registro_acessos import RegistradorAcessos
+from webhooks import WebhookManager
+from eventos_cadastro import CanalEventos
+from gpio import PinoGPIO, SimuladorGPIO
+from snapshot_local import SnapshotLocal
+from cadastro_biometria import MaquinaCadastro
+import backup_templates
+from sincronizacao_templates import SincronizadorTemplates
+from faixas import Faixa, FAIXA_PRINCIPAL, carregar_faixas
+from repeticao_acessos import FiltroAcessos, LIBERAR, REPETIDO
+from saude_sensor import classificar_erro, classe_reconhecimento, SEM_MATCH
+from ipc_catraca import (BlocoEstado, ServidorComandos, ClienteCatraca, HardwareIndisponivel, publicar_estado,
+                         elevar_prioridade, INTERVALO_ESTADO, LIMITE_IDADE)
+from servidor_http import ServidorHTTP
+from tarefas_hardware import FilaTarefas, CONCLUIDA
+from log_catraca import componente, configurar_logs, CAPACIDADE_BUFFER
+from agendador_sensor import AgendadorSensor, PRIORIDADE_RECONHECIMENTO, PRIORIDADE_CADASTRO, PRIORIDADE_DIAGNOSTICO
+from metricas import registro as registro_metricas, cronometrar, DURACAO_ETAPA, RECONHECIMENTOS, PASSAGENS, REINICIALIZACOES_SENSOR, RESULTADOS_SENSOR, CADASTROS, ACESSOS_SUPRIMIDOS
 
 # Configuração PostgreSQL
 PG_CONFIG = {
@@ -26,65 +51,108 @@ PG_CONFIG = {
 SENSOR_PORT = '/dev/ttyUSB0'
 SENSOR_BAUD = 57600
 
+# Spool local de acessos ainda não gravados no banco
+SPOOL_ACESSOS = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'spool_acessos.jsonl')
+
+# Snapshot local dos usuários com biometria (autorização sem o banco central)
+SNAPSHOT_LOCAL = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'snapshot_biometria.db')
+VALIDADE_SNAPSHOT = 24 * 3600  # segundos
+
+# Cadastro intercalado: a catraca continua reconhecendo entre as capturas
+# do cadastro (CATRACA_CADASTRO_INTERCALADO=0 volta a pausar a consulta).
+# CATRACA_SENSOR_CADASTRO=<porta> usa um segundo leitor, no balcão, só
+# para as capturas do cadastro.
+CADASTRO_INTERCALADO = os.environ.get('CATRACA_CADASTRO_INTERCALADO', '1') != '0'
+SENSOR_CADASTRO_PORT = os.environ.get('CATRACA_SENSOR_CADASTRO')
+
+# Distribuição de templates entre catracas: CATRACA_NO=<identificador>
+# registra esta catraca como nó e mantém o sensor igual ao repositório
+# central (ver sincronizacao_templates.py). Sem ela, vale só user_finger.
+NO_CATRACA = os.environ.get('CATRACA_NO')
+
 # GPIOs (ajuste conforme sua placa)
 GPIO_OUT = "/sys/class/gpio/gpio415/value"
 GPIO_IN = "/sys/class/gpio/gpio412/value"
 
-# Configuração Flask
-app = Flask(__name__)
+# CATRACA_GPIO_SIMULADO=<diretório> usa arquivos comuns no lugar do sysfs
+GPIO_SIMULADO = os.environ.get('CATRACA_GPIO_SIMULADO')
+if GPIO_SIMULADO:
+    simulador_gpio = SimuladorGPIO(GPIO_SIMULADO)
+    GPIO_OUT = simulador_gpio.caminho(415)
+    GPIO_IN = simulador_gpio.caminho(412)
 
-# ==================== WEBHOOK MANAGER ====================
+# Várias faixas (leitor + catraca) no mesmo processo: CATRACA_FAIXAS=<arquivo
+# JSON> (ver faixas.py). Sem ele, uma faixa com SENSOR_PORT, GPIO_OUT e GPIO_IN.
+FAIXAS_CONFIG = os.environ.get('CATRACA_FAIXAS')
 
-class WebhookManager:
-    def __init__(self):
-        self.webhook_url = None
-        
-    def set_webhook_url(self, url):
-        """Define a URL do webhook para notificações"""
-        self.webhook_url = url
-        print(f"🎯 Webhook URL definida: {url}")
-        
-    def enviar_webhook(self, etapa, mensagem, dados=None, success=True):
-        """Envia notificação via webhook"""
-        if not self.webhook_url:
-            print("⚠️  Webhook URL não configurada - pulando notificação")
-            return
-            
-        payload = {
-            "etapa": etapa,
-            "mensagem": mensagem,
-            "dados": dados,
-            "success": success,
-            "timestamp": datetime.now().isoformat()
-        }
-        
-        try:
-            # Executa em thread separada para não bloquear
-            Thread(target=self._enviar_webhook_async, args=(payload,), daemon=True).start()
-        except Exception as e:
-            print(f"❌ Erro ao agendar webhook: {e}")
-    
-    def _enviar_webhook_async(self, payload):
-        """Envia webhook de forma assíncrona"""
-        try:
-            response = requests.post(
-                self.webhook_url,
-                json=payload,
-                timeout=2,  # Timeout curto para não bloquear
-                headers={'Content-Type': 'application/json'}
-            )
-            
-            if response.status_code == 200:
-                print(f"📤 Webhook enviado com sucesso: {payload['etapa']}")
-            else:
-                print(f"⚠️  Webhook retornou status {response.status_code}")
-                
-        except requests.exceptions.Timeout:
-            print("⏰ Timeout ao enviar webhook (ignorando)")
-        except requests.exceptions.ConnectionError:
-            print("🔌 Erro de conexão ao enviar webhook (ignorando)")
-        except Exception as e:
-            print(f"❌ Erro ao enviar webhook: {e}")
+# Leituras repetidas do mesmo usuário na mesma faixa dentro da janela não
+# reabrem a catraca nem duplicam o log (CATRACA_JANELA_REPETICAO=0 desliga).
+# O anti-passback é ligado por faixa, no arquivo de faixas.
+JANELA_REPETICAO = float(os.environ.get('CATRACA_JANELA_REPETICAO', 10))
+VALIDADE_ANTIPASSBACK = float(os.environ.get('CATRACA_VALIDADE_ANTIPASSBACK', 12 * 3600))
+
+# Hardware (sensor, catraca, cadastro) e API em processos separados: a API
+# lê o estado de um bloco de memória compartilhada e manda as ações por um
+# socket Unix (ver ipc_catraca.py). CATRACA_PRIORIDADE_RT=0 mantém o
+# escalonamento normal no processo do hardware.
+BLOCO_ESTADO = os.environ.get('CATRACA_BLOCO_ESTADO',
+                              '/dev/shm/catraca_estado' if os.path.isdir('/dev/shm') else '/tmp/catraca_estado')
+SOCKET_COMANDOS = os.environ.get('CATRACA_SOCKET', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'catraca.sock'))
+CHAVE_IPC = os.environ.get('CATRACA_CHAVE_IPC', 'catraca').encode('utf-8')
+PRIORIDADE_HARDWARE = int(os.environ.get('CATRACA_PRIORIDADE_RT', 10))
+NICE_API = 5
+EVENTOS_PUBLICADOS = 32  # eventos de cadastro no bloco, para o SSE da API
+
+# Servidor HTTP da API: pool fixo de workers com fila limitada, keep-alive
+# e drenagem no desligamento (ver servidor_http.py).
+# CATRACA_SERVIDOR_HTTP=desenvolvimento volta ao app.run do Flask.
+SERVIDOR_HTTP = os.environ.get('CATRACA_SERVIDOR_HTTP', 'pool')
+PORTA_API = int(os.environ.get('CATRACA_PORTA', 5000))
+HTTP_WORKERS = int(os.environ.get('CATRACA_HTTP_WORKERS', 16))
+HTTP_FILA = int(os.environ.get('CATRACA_HTTP_FILA', 64))
+HTTP_TIMEOUT = float(os.environ.get('CATRACA_HTTP_TIMEOUT', 10))
+
+# Diagnóstico e teste da catraca rodam como tarefas no processo do hardware
+# (ver tarefas_hardware.py); o resultado do diagnóstico vale por
+# CATRACA_TTL_DIAGNOSTICO segundos antes de outro pedido ir ao sensor.
+TTL_DIAGNOSTICO = float(os.environ.get('CATRACA_TTL_DIAGNOSTICO', 30))
+
+# Backup/restauração em arquivo pela API: só o nome do arquivo, sempre
+# dentro de CATRACA_DIRETORIO_BACKUP (caminhos livres só na linha de comando)
+DIRETORIO_BACKUP = os.environ.get('CATRACA_DIRETORIO_BACKUP',
+                                  os.path.join(os.path.dirname(os.path.abspath(__file__)), 'backups'))
+
+# Logs por componente, só enfileirados nas threads do serviço: o console
+# (tty1) é escrito por outra thread (níveis e arquivo em log_catraca.py)
+log = componente('sistema')
+log_sensor = componente('sensor')
+log_consulta = componente('consulta')
+log_gpio = componente('gpio')
+log_cadastro = componente('cadastro')
+log_api = componente('api')
+
+def marcar_inicio(marcos, marco):
+    """Anota (uma vez) quantos segundos do início do serviço até `marco`"""
+    if marco in marcos:
+        return
+    segundos = round(time.monotonic() - INICIO, 3)
+    marcos[marco] = segundos
+    DURACAO_ETAPA.rotulo(fluxo='inicializacao', etapa=marco).observar(segundos)
+    log.info(f"⏱️ Inicialização: {marco} em {segundos:.2f}s", extra={"marco": marco, "segundos": segundos})
+
+def consultar_logs(desde=0, nivel=None, componente=None, limite=200):
+    """Registros do buffer de logs deste processo e a situação da fila (para /api/logs)"""
+    logs = configurar_logs()
+    return {"registros": logs.consultar(desde, nivel, componente, limite), "logs": logs.metricas()}
+
+def caminho_gpio(numero):
+    """Arquivo 'value' do pino (no simulador, se estiver ativo)"""
+    if GPIO_SIMULADO:
+        return simulador_gpio.caminho(numero)
+    return f"/sys/class/gpio/gpio{numero}/value"
+
+# Configuração Flask
+app = Flask(__name__)
 
 # Instância global do Webhook Manager
 webhook_manager = WebhookManager()
@@ -93,12 +161,23 @@ webhook_manager = WebhookManager()
 
 class SistemaCatraca:
     def __init__(self):
-        self.sensor = None
+        self.faixas = carregar_faixas(FAIXAS_CONFIG, Faixa(FAIXA_PRINCIPAL, SENSOR_PORT, GPIO_OUT, GPIO_IN), caminho_gpio)
+        self.principal = self.faixas[0]
+        for faixa in self.faixas:
+            faixa.saude.ao_registrar = lambda classe, nome=faixa.nome: RESULTADOS_SENSOR.rotulo(faixa=nome, classe=classe).inc()
         self.modo_atual = "CONSULTA"
-        self.lock_sensor = threading.Lock()
+        self.mudanca_modo = threading.Condition()
+        self.sensor_cadastro = None
+        self.agendador_cadastro = AgendadorSensor(lambda: self.sensor_cadastro) if SENSOR_CADASTRO_PORT else self.agendador
+        self.cadastro_intercalado = CADASTRO_INTERCALADO or bool(SENSOR_CADASTRO_PORT)
+        self.captura_cadastro = None
+        self.lock_templates = threading.Lock()
+        self.thread_templates = None
+        self.progresso_templates = None
+        self.estado_templates = {"operacao": None, "em_andamento": False}
+        self.sincronizador = None
         self.cadastro_ativo = False
         self.running = True
-        self.thread_consulta = None
         self.ultimo_erro_sensor = None
         self.etapa_cadastro = 'inativo'
         self.mensagem_cadastro = ""
@@ -108,80 +187,282 @@ class SistemaCatraca:
         self.thread_cadastro = None
         self.webhook_manager = webhook_manager
         self.webhook_url_cadastro_atual = None
+        self.eventos_cadastro = CanalEventos()
+        self.cancelamento_cadastro = threading.Event()
+        self.pinos = {}
+        self.lock_pinos = threading.Lock()
+        self.pool = obter_pool(PG_CONFIG)
+        self.snapshot = SnapshotLocal(SNAPSHOT_LOCAL)
+        self.indice = IndiceBiometria(self.pool, snapshot=self.snapshot, no=NO_CATRACA)
+        self.registrador = RegistradorAcessos(self.pool, SPOOL_ACESSOS)
+        self.filtro_acessos = FiltroAcessos(
+            JANELA_REPETICAO, VALIDADE_ANTIPASSBACK if any(faixa.antipassback for faixa in self.faixas) else 0
+        )
+        self.tarefas = FilaTarefas()
+        self.indice_preparado = threading.Event()
+        self.marcos = {}
         
+    # O sensor e o agendador "da catraca" são os da faixa principal
+    @property
+    def sensor(self):
+        return self.principal.sensor
+    
+    @sensor.setter
+    def sensor(self, sensor):
+        self.principal.sensor = sensor
+    
+    @property
+    def agendador(self):
+        return self.principal.agendador
+    
+    def faixa(self, nome=None):
+        """Faixa pelo nome (a principal se None); None se não existir"""
+        if nome is None:
+            return self.principal
+        return next((faixa for faixa in self.faixas if faixa.nome == nome), None)
+    
     def conectar_banco(self):
-        return psycopg2.connect(**PG_CONFIG)
+        """Empresta uma conexão do pool (usar com 'with')"""
+        return self.pool.conexao()
+    
+    def definir_modo(self, modo):
+        """Troca o modo e acorda quem está esperando por ele"""
+        with self.mudanca_modo:
+            self.modo_atual = modo
+            self.mudanca_modo.notify_all()
+    
+    def consulta_liberada(self, faixa=None):
+        """
+        A consulta roda em modo CONSULTA e, se intercalado, também durante o
+        cadastro. O cadastro só usa o leitor da faixa principal: as outras
+        faixas nunca param.
+        """
+        if faixa is not None and faixa is not self.principal:
+            return True
+        return self.modo_atual == "CONSULTA" or (self.modo_atual == "CADASTRO" and self.cadastro_intercalado)
+    
+    def aguardar_consulta(self, timeout):
+        """Espera a consulta ser liberada; retorna False se o tempo acabar"""
+        with self.mudanca_modo:
+            return self.mudanca_modo.wait_for(lambda: self.consulta_liberada() or not self.running, timeout)
+    
+    def comando_sensor(self, metodo, *args, prioridade=PRIORIDADE_DIAGNOSTICO, faixa=None):
+        """Executa um método do sensor na thread do agendador e espera o resultado"""
+        return (faixa or self.principal).agendador.chamar(metodo, *args, prioridade=prioridade)
     
-    def inicializar_sensor(self):
+    def reiniciar_sensor(self, faixa=None, tentativas=3):
+        """Reabre o sensor dentro do agendador, sem comandos intercalados"""
+        faixa = faixa or self.principal
+        if faixa.saude.adquirido:
+            REINICIALIZACOES_SENSOR.rotulo(faixa=faixa.nome).inc()
+        
+        def _reabrir(_sensor):
+            faixa.sensor = self.inicializar_sensor(faixa.porta, tentativas)
+            faixa.ultimo_erro = None if faixa.sensor else self.ultimo_erro_sensor
+            if faixa.sensor:
+                self.sensor_aberto(faixa)
+            return faixa.sensor
+        
+        return faixa.agendador.executar(_reabrir, PRIORIDADE_RECONHECIMENTO, nome='reinicializar')
+    
+    def inicializar_sensor(self, porta=SENSOR_PORT, max_tentativas=3):
         """Inicializa o sensor com múltiplas tentativas"""
         tentativas = 0
-        max_tentativas = 3
         
         while tentativas < max_tentativas:
             try:
-                print(f"🔧 Tentativa {tentativas + 1}/{max_tentativas} de conectar sensor...")
-                finger = PyFingerprint(SENSOR_PORT, SENSOR_BAUD, 0xFFFFFFFF, 0x00000000)
+                log_sensor.info(f"🔧 Tentativa {tentativas + 1}/{max_tentativas} de conectar sensor...")
+                finger = criar_sensor(porta, SENSOR_BAUD)
                 
                 if not finger.verifyPassword():
                     raise Exception("Senha do sensor incorreta")
                 
                 finger.getTemplateCount()
-                print("✅ Sensor biométrico inicializado e testado")
+                log_sensor.info("✅ Sensor biométrico inicializado e testado")
                 return finger
                 
             except Exception as e:
                 tentativas += 1
                 self.ultimo_erro_sensor = str(e)
-                print(f"❌ Tentativa {tentativas} falhou: {e}")
+                log_sensor.error(f"❌ Tentativa {tentativas} falhou: {e}")
                 if tentativas < max_tentativas:
-                    print("🔄 Tentando novamente em 3 segundos...")
+                    log_sensor.info("🔄 Tentando novamente em 3 segundos...")
                     time.sleep(3)
         
-        print(f"❌ Não foi possível inicializar sensor após {max_tentativas} tentativas")
+        log_sensor.error(f"❌ Não foi possível inicializar sensor após {max_tentativas} tentativas")
         return None
     
-    def diagnosticar_sensor(self):
+    def sensor_aberto(self, faixa):
+        """Leitor da faixa aberto (na inicialização ou depois de uma falha)"""
+        primeira = f"sensor_{faixa.nome}" not in self.marcos
+        marcar_inicio(self.marcos, f"sensor_{faixa.nome}")
+        if faixa is self.principal:
+            # Já na thread do agendador: o índice fica do tamanho deste sensor
+            try:
+                self.indice.ajustar_capacidade(faixa.sensor.getStorageCapacity())
+            except Exception as e:
+                log_sensor.warning(f"⚠️ Capacidade do sensor não lida, índice mantém {len(self.indice.slots)} posições: {e}")
+            self.iniciar_sincronizacao()
+            if primeira:
+                # Diagnóstico de partida fora da inicialização (e já no cache da API)
+                self.agendar_diagnostico()
+    
+    def preparar_indice(self):
+        """Aquece e começa a escutar alterações do índice biométrico (cresce com as posições do banco)"""
+        try:
+            migrar_dedos(self.pool)
+            self.indice.instalar_gatilhos()
+            if NO_CATRACA:
+                sincronizador = SincronizadorTemplates(self.pool, NO_CATRACA, self.executar_espelhado)
+                sincronizador.preparar()
+                self.sincronizador = sincronizador
+            self.indice.aquecer()
+        except Exception as e:
+            log.error(f"❌ Erro ao aquecer índice biométrico: {e}")
+            try:
+                self.indice.aquecer_do_snapshot()
+            except Exception as e:
+                log.error(f"❌ Erro ao carregar snapshot local: {e}")
+        
+        self.indice.iniciar_escuta()
+        self.indice_preparado.set()
+        marcar_inicio(self.marcos, 'indice')
+        self.iniciar_sincronizacao()
+    
+    def iniciar_sincronizacao(self):
+        """Sincronização de templates, quando o índice e o sensor principal estiverem prontos"""
+        with self.lock_templates:
+            if not self.sincronizador or self.sincronizador.thread or not self.sensor:
+                return
+            self.sincronizador.iniciar()
+        log.info(f"✅ Sincronização de templates iniciada (nó {NO_CATRACA})")
+    
+    def abrir_leitor_cadastro(self):
+        """Segundo leitor (balcão) só para as capturas do cadastro"""
+        self.sensor_cadastro = self.inicializar_sensor(SENSOR_CADASTRO_PORT)
+        if not self.sensor_cadastro:
+            log_sensor.warning("⚠️ Leitor de cadastro indisponível - capturas no leitor da catraca")
+            self.agendador_cadastro = self.agendador
+        return self.sensor_cadastro is not None
+    
+    def prontidao(self):
+        """Pronto para reconhecer: índice carregado e ao menos um leitor respondendo"""
+        faixas = {faixa.nome: faixa.saude.estado for faixa in self.faixas}
+        return {
+            "pronto": self.indice_preparado.is_set() and any(estado != 'adquirindo' and estado != 'falha'
+                                                             for estado in faixas.values()),
+            "indice": self.indice.origem if self.indice_preparado.is_set() else "carregando",
+            "faixas": faixas,
+            "marcos": dict(self.marcos),
+        }
+    
+    def executar_espelhado(self, funcao):
+        """
+        Comando de manutenção dos templates (sincronização, restauração), na
+        menor prioridade. Os leitores de todas as faixas guardam os mesmos
+        templates nas mesmas posições, então o comando vai para todos; vale
+        o resultado da faixa principal.
+        """
+        futuros = [faixa.agendador.enviar(funcao, PRIORIDADE_DIAGNOSTICO, 'templates')
+                   for faixa in self.faixas if faixa.sensor and faixa is not self.principal]
+        resultado = self.agendador.executar(funcao, PRIORIDADE_DIAGNOSTICO, nome='templates')
+        for futuro in futuros:
+            futuro.result()
+        return resultado
+    
+    def replicar_template(self, posicao, caracteristicas):
+        """Grava um template cadastrado na faixa principal nos leitores das outras faixas"""
+        def _gravar(sensor):
+            sensor.uploadCharacteristics(0x01, list(caracteristicas))
+            return sensor.storeTemplate(posicao, 0x01)
+        
+        for faixa in self.faixas:
+            if faixa is self.principal or not faixa.sensor:
+                continue
+            try:
+                faixa.agendador.executar(_gravar, PRIORIDADE_CADASTRO, nome='replicar_template')
+            except Exception as e:
+                faixa.ultimo_erro = str(e)
+                log_sensor.warning(f"⚠️ Template da posição {posicao} não gravado na faixa {faixa.nome}: {e}")
+    
+    def modo_operacao(self):
+        """
+        ONLINE com o banco central; OFFLINE usando dados locais ainda válidos.
+        Dados sem idade (nunca sincronizados) contam como expirados.
+        """
+        if self.indice.conectado:
+            return "ONLINE"
+        idade = self.idade_dados()
+        if idade is not None and idade <= VALIDADE_SNAPSHOT:
+            return "OFFLINE"
+        return "OFFLINE_EXPIRADO"
+    
+    def idade_dados(self):
+        """Segundos desde a última vez que o índice foi sincronizado com o banco"""
+        if self.indice.ultima_atualizacao is None:
+            return None
+        return time.time() - self.indice.ultima_atualizacao
+    
+    def diagnosticar_sensor(self, faixa=None):
         """Faz diagnóstico completo do sensor"""
-        if not self.sensor:
-            print("❌ Sensor não inicializado")
+        faixa = faixa or self.principal
+        if not faixa.sensor:
+            log_sensor.error(f"❌ Sensor da faixa {faixa.nome} não inicializado")
             return False
             
         try:
-            print("🔍 Diagnosticando sensor...")
+            log_sensor.info(f"🔍 Diagnosticando sensor da faixa {faixa.nome}...")
             
-            print(f"   - Templates armazenados: {self.sensor.getTemplateCount()}")
-            print(f"   - Capacidade total: {self.sensor.getStorageCapacity()}")
+            log_sensor.info(f"   - Templates armazenados: {self.comando_sensor('getTemplateCount', faixa=faixa)}")
+            log_sensor.info(f"   - Capacidade total: {self.comando_sensor('getStorageCapacity', faixa=faixa)}")
             
-            # Testar leitura rápida
-            print("   - Testando leitura (aguarde 3 segundos)...")
+            # Testar leitura rápida (com prioridade baixa: não atrasa a catraca)
+            log_sensor.info("   - Testando leitura (aguarde 3 segundos)...")
             for i in range(3):
-                if self.sensor.readImage():
-                    print("   ✅ Sensor consegue ler imagens!")
+                if self.comando_sensor('readImage', faixa=faixa):
+                    log_sensor.info("   ✅ Sensor consegue ler imagens!")
                     return True
                 time.sleep(1)
             
-            print("   ⚠️ Sensor não detecta digitais (pode ser normal se não houver dedo)")
+            log_sensor.warning("   ⚠️ Sensor não detecta digitais (pode ser normal se não houver dedo)")
             return True
             
         except Exception as e:
-            print(f"   ❌ Erro no diagnóstico: {e}")
+            log_sensor.error(f"   ❌ Erro no diagnóstico: {e}")
+            faixa.ultimo_erro = str(e)
             return False
     
+    def pino(self, path, saida=False):
+        """Retorna o pino já aberto para o caminho (abre na primeira vez)"""
+        with self.lock_pinos:
+            if path not in self.pinos:
+                self.pinos[path] = PinoGPIO(path, saida=saida)
+                if not saida and not self.pinos[path].suporta_borda:
+                    log_gpio.warning(f"⚠️ GPIO {path} sem suporte a borda - usando leitura periódica")
+            return self.pinos[path]
+    
     def set_gpio(self, path, value):
         try:
-            with open(path, "w") as f:
-                f.write(str(value))
+            self.pino(path, saida=True).escrever(value)
         except Exception as e:
-            print(f"❌ Erro GPIO {path}: {e}")
+            log_gpio.error(f"❌ Erro GPIO {path}: {e}")
     
     def ler_gpio(self, path):
         try:
-            with open(path, "r") as f:
-                return int(f.read().strip())
+            return self.pino(path).ler()
         except Exception as e:
-            print(f"❌ Erro leitura GPIO {path}: {e}")
+            log_gpio.error(f"❌ Erro leitura GPIO {path}: {e}")
             return 0
     
+    def aguardar_gpio(self, path, valor, timeout):
+        """Espera o pino chegar ao valor (por interrupção de borda quando houver)"""
+        try:
+            return self.pino(path).aguardar(valor, timeout)
+        except Exception as e:
+            log_gpio.error(f"❌ Erro aguardando GPIO {path}: {e}")
+            time.sleep(timeout)
+            return False
+    
     def get_periodo(self):
         hora = datetime.now().hour
         if 5 <= hora < 12:
@@ -191,255 +472,191 @@ class SistemaCatraca:
         else:
             return "NOITE"
     
-    def acesso_por_biometria(self):
-        if not self.sensor:
+    def contar_reconhecimento(self, faixa, resultado, erro=None):
+        RECONHECIMENTOS.rotulo(faixa=faixa.nome, resultado=resultado).inc()
+        faixa.contar_reconhecimento(resultado)
+        if resultado == 'match':
+            marcar_inicio(self.marcos, 'primeiro_reconhecimento')
+        if erro is not None:
+            faixa.saude.registrar_erro(erro)
+        else:
+            faixa.saude.registrar(classe_reconhecimento(resultado))
+    
+    def acesso_por_biometria(self, faixa=None):
+        faixa = faixa or self.principal
+        if not faixa.sensor:
             return None
             
         try:
-            with self.lock_sensor:
-                tempo_inicio = time.time()
-                timeout = 5
+            tempo_inicio = time.time()
+            timeout = 5
+            
+            def _ler_e_identificar(sensor):
+                # Leitura, conversão e busca num só comando: um cadastro
+                # intercalado não troca a imagem nem o buffer 0x01 no meio
+                if not sensor.readImage():
+                    return None
+                with cronometrar(DURACAO_ETAPA, fluxo='consulta', etapa='convertImage'):
+                    sensor.convertImage(0x01)
                 
+                # Cadastro esperando uma captura no mesmo leitor: o dedo é
+                # dele, mesmo que já esteja cadastrado (a verificação de
+                # duplicidade do cadastro recusa), e não libera a catraca
+                espera = self.captura_cadastro if faixa.agendador is self.agendador_cadastro else None
+                if espera is not None:
+                    espera.entregar(sensor.downloadCharacteristics(0x01))
+                    return (-1, 'cadastro')
+                with cronometrar(DURACAO_ETAPA, fluxo='consulta', etapa='searchTemplate'):
+                    return sensor.searchTemplate()
+            
+            # Cada tentativa é um comando curto: cadastro e diagnóstico
+            # entram entre uma leitura e outra
+            with cronometrar(DURACAO_ETAPA, fluxo='consulta', etapa='aguardar_dedo'):
                 while time.time() - tempo_inicio < timeout:
-                    if self.sensor.readImage():
+                    if not self.consulta_liberada(faixa):
+                        return None
+                    result = faixa.agendador.executar(_ler_e_identificar, PRIORIDADE_RECONHECIMENTO, nome='identificar')
+                    if result is not None:
                         break
                     time.sleep(0.1)
                 else:
                     # Timeout - nenhum dedo detectado
+                    self.contar_reconhecimento(faixa, 'timeout')
                     return None
+            
+            positionNumber = result[0]
                 
-                self.sensor.convertImage(0x01)
-                result = self.sensor.searchTemplate()
-                positionNumber = result[0]
-                
-                if positionNumber == -1:
-                    # Digital não encontrada no sensor
-                    return None
-                
-                conn = self.conectar_banco()
-                cursor = conn.cursor()
-                cursor.execute("""
-                    SELECT u.id, u.nome, u.tipo, u.identificador
-                    FROM usuario u
-                    JOIN user_finger uf ON u.id = uf.user_id
-                    WHERE uf.template_position = %s
-                """, (positionNumber,))
-                usuario = cursor.fetchone()
-                cursor.close()
-                conn.close()
-                
-                return usuario if usuario else None
+            if positionNumber == -1:
+                # Digital não encontrada no sensor (ou entregue ao cadastro)
+                self.contar_reconhecimento(faixa, 'captura_cadastro' if result[1] == 'cadastro' else 'sem_match')
+                return None
+            
+            modo = self.modo_operacao()
+            if modo == "OFFLINE_EXPIRADO":
+                log_consulta.warning("⛔ Banco indisponível e dados locais expirados - acesso negado")
+                self.contar_reconhecimento(faixa, 'negado_offline')
+                return None
+            
+            # Resolução em memória, fora do lock do sensor
+            with cronometrar(DURACAO_ETAPA, fluxo='consulta', etapa='busca_usuario'):
+                usuario = self.indice.buscar(positionNumber)
+                if usuario is None and modo == "ONLINE":
+                    try:
+                        usuario = self.indice.resolver_ausente(positionNumber)
+                    except Exception as e:
+                        log_consulta.error(f"❌ Erro ao consultar posição {positionNumber} no banco: {e}")
+            
+            self.contar_reconhecimento(faixa, 'match' if usuario else 'sem_usuario')
+            return usuario
                 
         except Exception as e:
-            print(f"❌ Erro na autenticação: {e}")
-            if "connection" in str(e).lower() or "timeout" in str(e).lower():
-                print("🔄 Tentando reinicializar sensor...")
-                self.sensor = self.inicializar_sensor()
+            # Imagem ruim é do dedo; o resto vai para o monitor de saúde,
+            # que decide se é hora de reabrir o sensor
+            if classificar_erro(e) == SEM_MATCH:
+                self.contar_reconhecimento(faixa, 'imagem_ruim')
+                return None
+            log_consulta.error(f"❌ Erro na autenticação: {e}", extra={"faixa": faixa.nome})
+            faixa.ultimo_erro = str(e)
+            self.contar_reconhecimento(faixa, 'erro', e)
             return None
     
     def registrar_acesso(self, usuario_id, nome, tipo, identificador):
+        """Enfileira a passagem para gravação em lote (não bloqueia no banco)"""
         try:
-            conn = self.conectar_banco()
-            cursor = conn.cursor()
             periodo = self.get_periodo()
-            data = datetime.now().strftime("%Y-%m-%d")
-            hora = datetime.now().strftime("%H:%M:%S")
-            
-            cursor.execute("""
-                INSERT INTO log_entrada (usuario_id, nome, tipo, periodo, identificador)
-                VALUES (%s, %s, %s, %s, %s)
-            """, (usuario_id, nome, tipo, periodo, identificador))
-            conn.commit()
-            cursor.close()
-            conn.close()
-            
-            print(f"📌 Acesso registrado - {nome} em {data} {hora} ({periodo})")
-            
+            self.registrador.registrar(usuario_id, nome, tipo, periodo, identificador)
         except Exception as e:
-            print(f"❌ Erro ao registrar acesso: {e}")
+            log_consulta.error(f"❌ Erro ao registrar acesso: {e}")
     
-    def liberar_catraca(self):
-        self.set_gpio(GPIO_OUT, 1)
-        print("🔓 Catraca liberada")
-        
-        for i in range(80):  # 8 segundos
-            if self.ler_gpio(GPIO_IN) == 1:
-                print("✅ Passagem detectada")
-                time.sleep(1)
-                self.set_gpio(GPIO_OUT, 0)
-                print("🔒 Catraca fechada")
-                return True
-            time.sleep(0.1)
+    def liberar_catraca(self, faixa=None, nome=None):
+        faixa = faixa or self.principal
+        # Um teste pedido pela API espera a passagem em andamento terminar
+        with faixa.lock_catraca:
+            self.set_gpio(faixa.gpio_saida, 1)
+            log_gpio.info(f"🔓 Catraca liberada ({faixa.nome})", extra={"faixa": faixa.nome})
+            
+            with cronometrar(DURACAO_ETAPA, fluxo='consulta', etapa='catraca_liberada'):
+                passou = self.aguardar_gpio(faixa.gpio_entrada, 1, 8)  # 8 segundos
+                if passou:
+                    log_gpio.info("✅ Passagem detectada", extra={"faixa": faixa.nome})
+                    time.sleep(1)
+                else:
+                    log_gpio.warning("⏱️ Timeout - Usuário não passou", extra={"faixa": faixa.nome})
+                self.set_gpio(faixa.gpio_saida, 0)
         
-        print("⏱️ Timeout - Usuário não passou")
-        self.set_gpio(GPIO_OUT, 0)
-        return False
+        resultado = 'passou' if passou else 'timeout'
+        PASSAGENS.rotulo(faixa=faixa.nome, resultado=resultado).inc()
+        faixa.contar_passagem(resultado, nome)
+        if passou:
+            log_gpio.info("🔒 Catraca fechada", extra={"faixa": faixa.nome})
+        return passou
+
+    def notificar_etapa(self, etapa, mensagem, dados=None, success=True):
+        """Atualiza a etapa do cadastro, publica no stream SSE e envia o webhook"""
+        with self.lock_cadastro:
+            self.etapa_cadastro = etapa
+            self.mensagem_cadastro = mensagem
+            self._publicar_estado(dados, success)
+        self.webhook_manager.enviar_webhook(etapa, mensagem, dados, success)
+    
+    def _publicar_estado(self, dados=None, success=True):
+        """Publica o estado atual do cadastro (chamar com lock_cadastro)"""
+        self.eventos_cadastro.publicar({
+            "etapa": self.etapa_cadastro,
+            "mensagem": self.mensagem_cadastro,
+            "dados": dados,
+            "cadastro": self.dados_cadastro_atual,
+            "em_andamento": self.cadastro_em_andamento,
+            "success": success,
+            "timestamp": datetime.now().isoformat()
+        })
+    
+    def cancelar_cadastro(self):
+        """Sinaliza o cancelamento; a thread de cadastro encerra na próxima verificação"""
+        with self.lock_cadastro:
+            if not self.cadastro_em_andamento:
+                return False
+            self.cancelamento_cadastro.set()
+        # Comandos do cadastro ainda na fila do sensor nem chegam a executar
+        self.agendador.cancelar_pendentes(PRIORIDADE_CADASTRO)
+        self.notificar_etapa('cancelado', 'Cadastro cancelado pelo usuário', success=False)
+        return True
 
-    def cadastrar_biometria(self, user_id, identificador, nome, webhook_url=None):
+    def cadastrar_biometria(self, user_id, identificador, nome, webhook_url=None, dedo=0):
         with self.lock_cadastro:
             if self.cadastro_em_andamento:
                 return {"success": False, "message": "Já existe um cadastro em andamento"}
             
-            # 🛑 PARAR MODO CONSULTA durante o cadastro
-            self.modo_atual = "CADASTRO"
-            print("🛑 Modo consulta pausado para cadastro")
+            # 🛑 PARAR MODO CONSULTA durante o cadastro (intercalado: só sinaliza)
+            self.definir_modo("CADASTRO")
+            if self.cadastro_intercalado:
+                log_cadastro.info("🔀 Cadastro intercalado com a consulta")
+            else:
+                log_cadastro.info("🛑 Modo consulta pausado para cadastro")
             # Configurar webhook para este cadastro
             if webhook_url:
                 self.webhook_url_cadastro_atual = webhook_url
-                self.webhook_manager.set_webhook_url(webhook_url)
-                print(f"🎯 Webhook configurado para este cadastro: {webhook_url}")
+                self.webhook_manager.set_webhook_url(webhook_url, f"cadastro_{user_id}_{int(time.time())}")
+                log_cadastro.info(f"🎯 Webhook configurado para este cadastro: {webhook_url}")
             
             self.cadastro_em_andamento = True
+            self.cancelamento_cadastro.clear()
             self.etapa_cadastro = 'iniciando'
             self.mensagem_cadastro = "Iniciando processo de cadastro"
             self.dados_cadastro_atual = {
                 'user_id': user_id,
                 'identificador': identificador,
-                'nome': nome
+                'nome': nome,
+                'dedo': dedo
             }
+            self._publicar_estado()
 
         try:
-            print(f"👤 Iniciando cadastro para: {nome}")
-
-            # 🎯 ETAPA 1: INICIALIZAÇÃO - NOTIFICAR VIA WEBHOOK
-            self.webhook_manager.enviar_webhook('iniciando', 'Iniciando cadastro de biometria...')
-            time.sleep(2)
-
-            self.webhook_manager.enviar_webhook('conectado', 'Conectando com a catraca...')
-            time.sleep(1)
-
-            # ============ PRIMEIRA LEITURA ============
-            self.webhook_manager.enviar_webhook('aguardando_primeira', 'Coloque o dedo no sensor para a primeira leitura')
-            print("👉 PRIMEIRA LEITURA - Coloque o dedo no sensor...")
-
-            # 🎯 AGUARDAR PRIMEIRA LEITURA COM TIMEOUT
-            tempo_inicio = time.time()
-            timeout = 30
-            primeira_lida = False
-
-            while time.time() - tempo_inicio < timeout:
-                with self.lock_cadastro:
-                    if self.etapa_cadastro == 'cancelar':
-                        self.webhook_manager.enviar_webhook('cancelado', 'Cadastro cancelado pelo usuário', success=False)
-                        return {"success": False, "message": "Cadastro cancelado"}
-                
-                if self.sensor.readImage():
-                    primeira_lida = True
-                    break
-                
-                # 🎯 ATUALIZAR MENSAGEM PERIODICAMENTE VIA WEBHOOK
-                if int(time.time() - tempo_inicio) % 5 == 0:
-                    tempo_restante = int(timeout - (time.time() - tempo_inicio))
-                    self.webhook_manager.enviar_webhook('aguardando_primeira', f'Aguardando primeira leitura... {tempo_restante}s restantes')
-                time.sleep(0.1)
-            
-            if not primeira_lida:
-                self.webhook_manager.enviar_webhook('erro', 'Timeout - falha ao detectar dedo na primeira leitura', success=False)
-                return {"success": False, "message": "Timeout - falha ao detectar dedo na primeira leitura"}
-
-            # 🎯 PRIMEIRA LEITURA CAPTURADA
-            self.sensor.convertImage(0x01)
-            
-            self.webhook_manager.enviar_webhook('primeira_capturada', 'Primeira digital capturada com sucesso!')
-            print("✅ Primeira leitura capturada")
-            time.sleep(2)
-
-            # 🎯 VERIFICAR SE DIGITAL JÁ EXISTE
-            self.webhook_manager.enviar_webhook('verificando_existente', 'Verificando se digital já está cadastrada...')
-            time.sleep(1)
-
-            result = self.sensor.searchTemplate()
-            if result[0] >= 0:
-                mensagem = f"Digital já cadastrada na posição {result[0]}"
-                self.webhook_manager.enviar_webhook('erro', mensagem, success=False)
-                return {"success": False, "message": mensagem}
-
-            # ============ SEGUNDA LEITURA ============
-            self.webhook_manager.enviar_webhook('aguardando_segunda', 'Remova e coloque o mesmo dedo novamente para confirmar')
-            print("👉 SEGUNDA LEITURA - Remova e coloque o mesmo dedo novamente...")
-            time.sleep(3)
-
-            # 🎯 AGUARDAR SEGUNDA LEITURA
-            tempo_inicio = time.time()
-            segunda_lida = False
-
-            while time.time() - tempo_inicio < timeout:
-                with self.lock_cadastro:
-                    if self.etapa_cadastro == 'cancelar':
-                        self.webhook_manager.enviar_webhook('cancelado', 'Cadastro cancelado pelo usuário', success=False)
-                        return {"success": False, "message": "Cadastro cancelado"}
-                
-                if self.sensor.readImage():
-                    segunda_lida = True
-                    break
-                
-                # 🎯 ATUALIZAR MENSAGEM PERIODICAMENTE VIA WEBHOOK
-                if int(time.time() - tempo_inicio) % 5 == 0:
-                    tempo_restante = int(timeout - (time.time() - tempo_inicio))
-                    self.webhook_manager.enviar_webhook('aguardando_segunda', f'Aguardando segunda leitura... {tempo_restante}s restantes')
-                time.sleep(0.1)
-
-            if not segunda_lida:
-                self.webhook_manager.enviar_webhook('erro', 'Timeout - falha ao detectar dedo na segunda leitura', success=False)
-                return {"success": False, "message": "Timeout - falha ao detectar dedo na segunda leitura"}
-
-            # 🎯 SEGUNDA LEITURA CAPTURADA
-            self.sensor.convertImage(0x02)
-            
-            self.webhook_manager.enviar_webhook('segunda_capturada', 'Segunda digital capturada com sucesso!')
-            print("✅ Segunda leitura capturada")
-            time.sleep(2)
-
-            # ============ VALIDAÇÃO ============
-            self.webhook_manager.enviar_webhook('validando', 'Validando correspondência das digitais...')
-            time.sleep(2)
-
-            # 🎯 COMPARAR DIGITAIS
-            similarity = self.sensor.compareCharacteristics()
-            print(f"🔍 Similaridade das digitais: {similarity}")
-
-            if similarity == 0:
-                self.webhook_manager.enviar_webhook('erro', 'Digitais não correspondem. Tente novamente.', success=False)
-                return {"success": False, "message": "Digitais não correspondem"}
-
-            self.webhook_manager.enviar_webhook('validacao_ok', 'Digitais correspondem! Salvando...')
-            time.sleep(1)
-
-            # ============ SALVANDO ============
-            self.webhook_manager.enviar_webhook('salvando', 'Salvando digital no banco de dados...')
-            time.sleep(1)
-
-            # 🎯 ARMAZENAR TEMPLATE
-            position = self.sensor.storeTemplate()
-            print(f"✅ Digital armazenada na posição {position}")
-
-            # 🎯 SALVAR NO BANCO DE DADOS
-            conn = self.conectar_banco()
-            cursor = conn.cursor()
-            cursor.execute("""
-                INSERT INTO user_finger (user_id, template_position)
-                VALUES (%s, %s)
-                ON CONFLICT (user_id) DO UPDATE SET template_position = EXCLUDED.template_position
-            """, (user_id, position))
-            conn.commit()
-            cursor.close()
-            conn.close()
-
-            # ============ FINALIZAÇÃO ============
-            self.webhook_manager.enviar_webhook('finalizado', f'Cadastro finalizado com sucesso! Digital salva na posição {position}')
-            time.sleep(2)
-
-            self.webhook_manager.enviar_webhook('sucesso', f'Biometria cadastrada com sucesso para {nome}', {'posicao': position})
-
-            return {
-                "success": True, 
-                "message": f"Digital vinculada ao usuário {nome}",
-                "position": position
-            }
+            return MaquinaCadastro(self, user_id, identificador, nome, dedo).executar()
 
         except Exception as e:
             error_message = str(e)
-            print(f"🎯 [CATRACA ERRO] Erro detectado no cadastro: {error_message}")
+            log_cadastro.error(f"🎯 [CATRACA ERRO] Erro detectado no cadastro: {error_message}")
 
             if 'timeout' in error_message.lower():
              mensagem_usuario = "Tempo esgotado - não foi detectada a digital no sensor"
@@ -454,7 +671,7 @@ class SistemaCatraca:
             else:
              mensagem_usuario = f"Erro técnico: {str(e)}"
 
-            print(f"❌ [CATRACA] Mensagem de erro para usuário: {mensagem_usuario}")
+            log_cadastro.error(f"❌ [CATRACA] Mensagem de erro para usuário: {mensagem_usuario}")
         
         # ✅ ENVIAR WEBHOOK DE ERRO COM LOG DETALHADO
             webhook_data = {
@@ -470,9 +687,9 @@ class SistemaCatraca:
                 'success': False,
                 'session_id': f"session_{user_id}_{int(time.time())}"  # ← SESSION ID CONSISTENTE
             }
-            print(f"📨 [CATRACA] Enviando webhook de erro: {webhook_data}")
+            log_cadastro.debug(f"📨 [CATRACA] Enviando webhook de erro: {webhook_data}")
             
-            self.webhook_manager.enviar_webhook('erro', mensagem_usuario, {
+            self.notificar_etapa('erro', mensagem_usuario, {
                 'erro_tecnico': str(e),
                 'user_id': user_id,
                 'timestamp': datetime.now().isoformat()
@@ -482,26 +699,28 @@ class SistemaCatraca:
 
         finally:
             with self.lock_cadastro:
+                CADASTROS.rotulo(resultado=self.etapa_cadastro if self.etapa_cadastro in ('sucesso', 'erro', 'cancelado') else 'interrompido').inc()
                 self.cadastro_em_andamento = False
-                self.modo_atual = "CONSULTA"
-                print("✅ Modo consulta restaurado")
-                if self.etapa_cadastro not in ['finalizado', 'erro']:
+                self.definir_modo("CONSULTA")
+                log_cadastro.info("✅ Modo consulta restaurado")
+                if self.etapa_cadastro not in ['finalizado', 'erro', 'sucesso', 'cancelado']:
                     self.etapa_cadastro = 'inativo'
                     self.mensagem_cadastro = "Processo finalizado"
                 # Limpar webhook após cadastro
                 self.webhook_url_cadastro_atual = None
+                self._publicar_estado()
 
-    def _executar_cadastro(self, user_id, identificador, nome, webhook_url=None):
+    def _executar_cadastro(self, user_id, identificador, nome, webhook_url=None, dedo=0):
         """Executa o cadastro em thread separada"""
         try:
-            print(f"🧵 Iniciando thread de cadastro para usuário {user_id}")
-            resultado = self.cadastrar_biometria(user_id, identificador, nome, webhook_url)
-            print(f"🧵 Thread de cadastro finalizada: {resultado}")
+            log_cadastro.info(f"🧵 Iniciando thread de cadastro para usuário {user_id}")
+            resultado = self.cadastrar_biometria(user_id, identificador, nome, webhook_url, dedo)
+            log_cadastro.info(f"🧵 Thread de cadastro finalizada: {resultado}")
         except Exception as e:
-            print(f"❌ Erro na thread de cadastro: {e}")
-            self.webhook_manager.enviar_webhook('erro', f"Erro na execução: {str(e)}", success=False)
+            log_cadastro.error(f"❌ Erro na thread de cadastro: {e}")
+            self.notificar_etapa('erro', f"Erro na execução: {str(e)}", success=False)
 
-    def iniciar_cadastro_assincrono(self, user_id, identificador, nome, webhook_url=None):
+    def iniciar_cadastro_assincrono(self, user_id, identificador, nome, webhook_url=None, dedo=0):
         """Inicia o cadastro de forma assíncrona"""
         with self.lock_cadastro:
             if self.cadastro_em_andamento:
@@ -513,13 +732,15 @@ class SistemaCatraca:
             self.dados_cadastro_atual = {
                 'user_id': user_id,
                 'identificador': identificador,
-                'nome': nome
+                'nome': nome,
+                'dedo': dedo
             }
+            self._publicar_estado()
 
         # Iniciar thread
         self.thread_cadastro = threading.Thread(
             target=self._executar_cadastro, 
-            args=(user_id, identificador, nome, webhook_url)
+            args=(user_id, identificador, nome, webhook_url, dedo)
         )
         self.thread_cadastro.daemon = True
         self.thread_cadastro.start()
@@ -530,75 +751,301 @@ class SistemaCatraca:
             "etapa": "iniciando"
         }
     
-    def modo_consulta(self):
-        print("🔄 Iniciando modo consulta...")
-        contador_erro = 0
-        max_erros_consecutivos = 5
+    def modo_consulta(self, faixa=None):
+        faixa = faixa or self.principal
+        log_consulta.info(f"🔄 Iniciando modo consulta na faixa {faixa.nome}...")
         
         while self.running:
             try:
-                # ✅ NÃO PROCESSAR CONSULTA se estiver em modo CADASTRO
-                if self.modo_atual == "CADASTRO":
-                    time.sleep(1)
+                # ✅ NÃO PROCESSAR CONSULTA durante o cadastro (exceto intercalado)
+                if not self.consulta_liberada(faixa):
+                    self.aguardar_consulta(1)
                     continue
                     
-                if self.modo_atual == "CONSULTA" and self.sensor and not self.cadastro_ativo:
-                    usuario = self.acesso_por_biometria()
+                # Em falha o monitor de saúde está reabrindo o sensor; sem o
+                # índice ainda não há a quem atribuir uma digital
+                if (faixa.sensor and not self.cadastro_ativo and not faixa.saude.em_falha
+                        and self.indice_preparado.is_set()):
+                    usuario = self.acesso_por_biometria(faixa)
                     
                     if usuario:
                         usuario_id, nome, tipo, identificador = usuario
-                        print(f"✅ Acesso permitido: {nome}")
                         
-                        if self.liberar_catraca():
+                        decisao = self.filtro_acessos.verificar(usuario_id, faixa)
+                        if decisao != LIBERAR:
+                            ACESSOS_SUPRIMIDOS.rotulo(faixa=faixa.nome, motivo=decisao).inc()
+                            if decisao == REPETIDO:
+                                time.sleep(0.5)
+                            else:
+                                log_consulta.warning(f"⛔ Anti-passback: {nome} já passou no sentido {faixa.sentido}",
+                                                     extra={"faixa": faixa.nome, "usuario_id": usuario_id})
+                                time.sleep(2)
+                            continue
+                        
+                        log_consulta.info(f"✅ Acesso permitido: {nome} ({faixa.nome})",
+                                          extra={"faixa": faixa.nome, "usuario_id": usuario_id})
+                        if self.liberar_catraca(faixa, nome):
+                            self.filtro_acessos.registrar(usuario_id, faixa)
                             self.registrar_acesso(usuario_id, nome, tipo, identificador)
-                        contador_erro = 0
                     else:
-                        contador_erro += 1
-                        if contador_erro >= max_erros_consecutivos:
-                            print("⚠️ Muitos erros consecutivos, verificando sensor...")
-                            if not self.diagnosticar_sensor():
-                                print("❌ Sensor com problemas, tentando reinicializar...")
-                                self.sensor = self.inicializar_sensor()
-                            contador_erro = 0
-                        
                         time.sleep(0.5)  
                 else:
                     time.sleep(1) 
                     
             except Exception as e:
-                print(f"❌ Erro no modo consulta: {e}")
-                contador_erro += 1
+                log_consulta.error(f"❌ Erro no modo consulta ({faixa.nome}): {e}", extra={"faixa": faixa.nome})
+                faixa.ultimo_erro = str(e)
+                faixa.saude.registrar_erro(e)
                 time.sleep(2)
         
-        print("🛑 Modo consulta finalizado")
+        log_consulta.info(f"🛑 Modo consulta finalizado ({faixa.nome})")
+    
+    def iniciar_consultas(self):
+        """Uma thread de reconhecimento e um monitor de saúde por faixa"""
+        for faixa in self.faixas:
+            faixa.saude.iniciar(lambda faixa=faixa: self.reiniciar_sensor(faixa, tentativas=1))
+            faixa.thread_consulta = threading.Thread(
+                target=self.modo_consulta, args=(faixa,), name=f"consulta-{faixa.nome}", daemon=True
+            )
+            faixa.thread_consulta.start()
+    
+    def iniciar_operacao_templates(self, operacao, arquivo=None, limpar=False):
+        """
+        Backup/restauração dos templates em segundo plano; False se já houver
+        uma rodando. `arquivo` é só o nome, resolvido em DIRETORIO_BACKUP.
+        """
+        caminho = backup_templates.caminho_no_diretorio(DIRETORIO_BACKUP, arquivo) if arquivo else None
+        with self.lock_templates:
+            if self.thread_templates and self.thread_templates.is_alive():
+                return False
+            self.progresso_templates = None
+            self.estado_templates = {"operacao": operacao, "em_andamento": True, "arquivo": arquivo}
+            self.thread_templates = threading.Thread(
+                target=self._operacao_templates, args=(operacao, caminho, limpar), daemon=True
+            )
+            self.thread_templates.start()
+        return True
+    
+    def _operacao_templates(self, operacao, arquivo, limpar):
+        # Um comando por template, com prioridade de diagnóstico: a catraca
+        # continua reconhecendo durante o backup
+        def executar(funcao):
+            return self.agendador.executar(funcao, PRIORIDADE_DIAGNOSTICO)
+        
+        try:
+            if operacao == 'backup':
+                posicoes = backup_templates.posicoes_ocupadas(executar)
+                self.progresso_templates = backup_templates.Progresso('backup', len(posicoes))
+                templates = backup_templates.baixar_templates(executar, posicoes, self.progresso_templates)
+                if arquivo:
+                    backup_templates.salvar_arquivo(arquivo, templates)
+                else:
+                    backup_templates.salvar_no_banco(self.pool, templates)
+            else:
+                if arquivo:
+                    templates = backup_templates.ler_arquivo(arquivo)
+                else:
+                    templates = backup_templates.carregar_do_banco(self.pool)
+                self.progresso_templates = backup_templates.Progresso('restauração', len(templates))
+                backup_templates.restaurar_templates(self.executar_espelhado, templates, limpar, self.progresso_templates)
+            
+            log.info(f"✅ Operação de templates concluída: {self.progresso_templates.resumo()}")
+            self.estado_templates = dict(self.estado_templates, em_andamento=False, success=True)
+        except Exception as e:
+            log.error(f"❌ Erro na operação de templates ({operacao}): {e}")
+            self.estado_templates = dict(self.estado_templates, em_andamento=False, success=False, erro=str(e))
+    
+    def diagnostico(self):
+        """Diagnóstico do sensor principal e situação de cada faixa"""
+        sensor_ok = self.diagnosticar_sensor() if self.sensor else False
+        return {
+            "sensor_conectado": self.sensor is not None,
+            "sensor_operacional": sensor_ok,
+            "modo_atual": self.modo_atual,
+            "ultimo_erro": self.ultimo_erro_sensor,
+            "agendador_sensor": self.agendador.metricas(),
+            "faixas": {faixa.nome: {
+                "sensor_conectado": faixa.sensor is not None,
+                "ultimo_erro": faixa.ultimo_erro,
+                "saude_sensor": faixa.saude.metricas(),
+                "agendador_sensor": faixa.agendador.metricas()
+            } for faixa in self.faixas}
+        }
+    
+    def testar_catraca(self, faixa=None):
+        """Libera a catraca da faixa como num acesso; retorna o nome da faixa"""
+        encontrada = self.faixa(faixa)
+        if encontrada is None:
+            raise ValueError(f"Faixa não encontrada: {faixa}")
+        passou = self.liberar_catraca(encontrada)
+        return {"faixa": encontrada.nome, "passou": passou}
+    
+    def agendar_diagnostico(self, atualizar=False):
+        """Tarefa de diagnóstico (a última concluída, se ainda valer)"""
+        return self.tarefas.submeter('diagnostico', self.diagnostico, chave='diagnostico',
+                                     validade=0 if atualizar else TTL_DIAGNOSTICO)
+    
+    def agendar_teste_catraca(self, faixa=None):
+        """Tarefa de teste da catraca (uma por faixa de cada vez)"""
+        encontrada = self.faixa(faixa)
+        if encontrada is None:
+            raise ValueError(f"Faixa não encontrada: {faixa}")
+        return self.tarefas.submeter('teste_catraca', lambda: self.testar_catraca(encontrada.nome),
+                                     chave=f"teste_catraca:{encontrada.nome}")
+    
+    def estado(self):
+        """
+        Fotografia do sistema para a API (publicada no bloco compartilhado a
+        cada INTERVALO_ESTADO): só os campos pequenos de status. Métricas,
+        pool do banco, webhooks e tarefas vão pelos comandos, quando pedidos.
+        """
+        progresso = self.progresso_templates
+        return {
+            "publicado_em": time.time(),
+            "pid": os.getpid(),
+            "sensor_conectado": self.sensor is not None,
+            "prontidao": self.prontidao(),
+            "status": {
+                "online": self.sensor is not None,
+                "modo": self.modo_atual,
+                "sensor_status": "conectado" if self.sensor else "erro",
+                "cadastro_ativo": self.cadastro_ativo,
+                "cadastro_intercalado": self.cadastro_intercalado,
+                "leitor_cadastro": "dedicado" if self.agendador_cadastro is not self.agendador else "catraca",
+                "acessos_pendentes": self.registrador.pendentes,
+                "modo_operacao": self.modo_operacao(),
+                "origem_dados": self.indice.origem,
+                "idade_dados_s": self.idade_dados(),
+                "filtro_acessos": self.filtro_acessos.metricas(),
+                "faixas": {faixa.nome: faixa.status() for faixa in self.faixas}
+            },
+            "cadastro": self.eventos_cadastro.estado,
+            "eventos_cadastro": self.eventos_cadastro.ultimos(EVENTOS_PUBLICADOS),
+            "templates": {
+                **self.estado_templates,
+                "progresso": progresso.resumo() if progresso else None,
+                "sincronizacao": self.sincronizador.metricas() if self.sincronizador else None
+            },
+        }
+    
+    def executar_comando(self, nome, argumentos):
+        """Ações pedidas pela API (no processo separado, chegam pelo socket)"""
+        comandos = {
+            'iniciar_cadastro': self.iniciar_cadastro_assincrono,
+            'cancelar_cadastro': self.cancelar_cadastro,
+            'agendar_teste_catraca': self.agendar_teste_catraca,
+            'agendar_diagnostico': self.agendar_diagnostico,
+            'consultar_tarefa': self.tarefas.consultar,
+            'esquecer_passagem': self.filtro_acessos.esquecer,
+            'operacao_templates': self.iniciar_operacao_templates,
+            'logs': consultar_logs,
+            'metricas': registro_metricas.renderizar,
+            'metricas_banco': self.pool.metricas,
+            'metricas_webhooks': self.webhook_manager.metricas,
+        }
+        if nome not in comandos:
+            raise ValueError(f"Comando desconhecido: {nome}")
+        return comandos[nome](**argumentos)
     
     def parar(self):
         self.running = False
-        if self.thread_consulta:
-            self.thread_consulta.join(timeout=5)
-        print("🛑 Sistema da catraca parado")
+        self.tarefas.parar()
+        self.indice.parar()
+        if self.sincronizador:
+            self.sincronizador.parar()
+        self.registrador.parar()
+        self.webhook_manager.parar()
+        with self.mudanca_modo:
+            self.mudanca_modo.notify_all()
+        for faixa in self.faixas:
+            faixa.saude.parar()
+            if faixa.thread_consulta:
+                faixa.thread_consulta.join(timeout=5)
+            faixa.agendador.parar()
+        if self.agendador_cadastro is not self.agendador:
+            self.agendador_cadastro.parar()
+        self.pool.fechar()
+        with self.lock_pinos:
+            for pino in self.pinos.values():
+                pino.fechar()
+            self.pinos.clear()
+        log.info("🛑 Sistema da catraca parado")
+
+class CatracaLocal:
+    """Mesma interface do ClienteCatraca, com o hardware no próprio processo"""
+    
+    def __init__(self, sistema):
+        self.sistema = sistema
+    
+    def estado(self):
+        return dict(self.sistema.estado(), idade_s=0.0)
+    
+    def comando(self, nome, /, **argumentos):
+        return self.sistema.executar_comando(nome, argumentos)
 
-# Instância global do sistema
-sistema = SistemaCatraca()
+# Instância global do sistema (só no processo do hardware) e acesso a ele
+# pela API: CatracaLocal no mesmo processo, ClienteCatraca no separado
+sistema = None
+catraca = None
+canal_eventos = None
+processo_hardware = None
+servidor_http = None
+encerrando = threading.Event()
+marcos_api = {}
+
+registro_metricas.medidor('catraca_acessos_pendentes', 'Passagens no spool aguardando o banco',
+                          lambda: sistema.registrador.pendentes)
+registro_metricas.medidor('catraca_webhooks_fila', 'Webhooks aguardando entrega',
+                          lambda: sistema.webhook_manager.metricas()['fila'])
+registro_metricas.medidor('catraca_templates_versao_aplicada', 'Última versão do repositório central gravada no sensor',
+                          lambda: sistema.sincronizador.versao_aplicada if sistema.sincronizador else None)
+registro_metricas.medidor('catraca_dados_idade_segundos', 'Idade do índice biométrico em memória',
+                          lambda: sistema.idade_dados())
+registro_metricas.medidor('catraca_logs_descartados', 'Registros de log descartados com a fila cheia',
+                          lambda: configurar_logs().metricas()['descartados'])
 
 # ==================== ROTAS REST API ====================
 
+def resposta_erro(e, mensagem):
+    """503 se o processo do hardware não respondeu; 500 nos outros erros"""
+    codigo = 503 if isinstance(e, HardwareIndisponivel) else 500
+    return jsonify({
+        "success": False,
+        "message": f"{mensagem}: {str(e)}"
+    }), codigo
+
+def resposta_tarefa(tarefa, mensagem):
+    """202 com a tarefa agendada no hardware e onde acompanhá-la"""
+    url = f"/api/tarefas/{tarefa['id']}"
+    return jsonify({
+        "success": True,
+        "message": mensagem,
+        "tarefa": tarefa,
+        "status_url": url
+    }), 202, {"Location": url}
+
+@app.before_request
+def contar_inicializacao():
+    marcar_inicio(marcos_api, 'primeira_requisicao')
+
+@app.errorhandler(HardwareIndisponivel)
+def hardware_indisponivel(e):
+    return jsonify({"success": False, "message": str(e)}), 503
+
 @app.route('/api/biometry', methods=['GET'])
 def api_biometry_get():
     """Endpoint GET para consultar status atual"""
     try:
-        with sistema.lock_cadastro:
-            return jsonify({
-                "etapa": sistema.etapa_cadastro,
-                "mensagem": sistema.mensagem_cadastro,
-                "dados": sistema.dados_cadastro_atual,
-                "success": True
-            })
-    except Exception as e:
+        # Último estado publicado pelo hardware: leitura sem falar com ele
+        estado = catraca.estado()["cadastro"]
         return jsonify({
-            "success": False,
-            "message": f"Erro interno: {str(e)}"
-        }), 500
+            "etapa": estado["etapa"],
+            "mensagem": estado["mensagem"],
+            "dados": estado.get("cadastro"),
+            "success": True
+        })
+    except Exception as e:
+        return resposta_erro(e, "Erro interno")
 
 @app.route('/api/catraca/iniciar-cadastro', methods=['POST'])
 def iniciar_cadastro():
@@ -608,6 +1055,7 @@ def iniciar_cadastro():
         identificador = data.get('identificador')
         nome = data.get('nome')
         webhook_url = data.get('webhook_url')  # ✅ Nova: receber URL do webhook
+        dedo = data.get('dedo', 0)  # outro número cadastra um dedo adicional
 
         if not user_id or not identificador:
             return jsonify({
@@ -615,152 +1063,449 @@ def iniciar_cadastro():
                 "message": "user_id e identificador são obrigatórios"
             }), 400
 
-        print(f"🎯 Recebido comando de cadastro para usuário {user_id}")
+        if not str(dedo).isdigit() or not 0 <= int(dedo) < DEDOS_POR_USUARIO:
+            return jsonify({
+                "success": False,
+                "message": f"dedo deve ser um número de 0 a {DEDOS_POR_USUARIO - 1}"
+            }), 400
+
+        log_cadastro.info(f"🎯 Recebido comando de cadastro para usuário {user_id}")
         if webhook_url:
-            print(f"🎯 Webhook URL recebida: {webhook_url}")
+            log_cadastro.info(f"🎯 Webhook URL recebida: {webhook_url}")
 
-        return jsonify(sistema.iniciar_cadastro_assincrono(user_id, identificador, nome, webhook_url))
+        return jsonify(catraca.comando('iniciar_cadastro', user_id=user_id, identificador=identificador, nome=nome,
+                                       webhook_url=webhook_url, dedo=int(dedo)))
 
     except Exception as e:
-        return jsonify({
-            "success": False,
-            "message": f"Erro interno: {str(e)}"
-        }), 500
+        return resposta_erro(e, "Erro interno")
 
 @app.route('/api/cancelar-cadastro', methods=['POST'])
 def cancelar_cadastro():
     try:
-        with sistema.lock_cadastro:
-            if sistema.cadastro_em_andamento:
-                sistema.etapa_cadastro = 'cancelado'
-                sistema.mensagem_cadastro = "Cadastro cancelado pelo usuário"
-                sistema.cadastro_em_andamento = False
-                
-                # Notificar via Webhook
-                sistema.webhook_manager.enviar_webhook('cancelado', 'Cadastro cancelado pelo usuário', success=False)
+        # Notifica via SSE e webhook
+        catraca.comando('cancelar_cadastro')
                 
         return jsonify({
             "success": True,
             "message": "Cadastro cancelado"
         })
     except Exception as e:
-        return jsonify({
-            "success": False,
-            "message": f"Erro ao cancelar: {str(e)}"
-        }), 500
+        return resposta_erro(e, "Erro ao cancelar")
 
 @app.route('/api/cadastro-status', methods=['GET'])
 def cadastro_status():
     try:
-        with sistema.lock_cadastro:
-            return jsonify({
-                "etapa": sistema.etapa_cadastro,
-                "mensagem": sistema.mensagem_cadastro,
-                "dados": sistema.dados_cadastro_atual,
-                "em_andamento": sistema.cadastro_em_andamento,
-                "timestamp": datetime.now().isoformat()
-            })
-    except Exception as e:
+        estado = catraca.estado()["cadastro"]
         return jsonify({
-            "success": False,
-            "message": f"Erro ao obter status: {str(e)}"
-        }), 500
+            "etapa": estado["etapa"],
+            "mensagem": estado["mensagem"],
+            "dados": estado.get("cadastro"),
+            "em_andamento": estado["em_andamento"],
+            "evento_id": estado.get("id"),
+            "timestamp": datetime.now().isoformat()
+        })
+    except Exception as e:
+        return resposta_erro(e, "Erro ao obter status")
+
+@app.route('/api/cadastro-eventos', methods=['GET'])
+def cadastro_eventos():
+    """Stream SSE com cada mudança de etapa do cadastro (retoma por Last-Event-ID)"""
+    ultimo_id = request.headers.get('Last-Event-ID') or request.args.get('ultimo_id')
+    try:
+        ultimo_id = int(ultimo_id) if ultimo_id is not None else None
+    except ValueError:
+        ultimo_id = None
+    
+    return Response(
+        stream_with_context(canal_eventos.stream(ultimo_id, lambda: not encerrando.is_set())),
+        mimetype='text/event-stream',
+        headers={
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no'
+        }
+    )
 
 @app.route('/api/catraca/status', methods=['GET'])
 def status():
     try:
-        sensor_status = "conectado" if sistema.sensor else "erro"
-        online = sistema.sensor is not None
-        
+        estado = catraca.estado()
         return jsonify({
             "success": True,
-            "online": online,
-            "modo": sistema.modo_atual,
-            "sensor_status": sensor_status,
-            "cadastro_ativo": sistema.cadastro_ativo
+            **estado["status"],
+            "hardware_idade_s": estado["idade_s"]
         })
     except Exception as e:
-        return jsonify({
-            "success": False,
-            "message": f"Erro ao verificar status: {str(e)}"
-        }), 500
+        return resposta_erro(e, "Erro ao verificar status")
 
 @app.route('/api/catraca/teste-catraca', methods=['POST'])
 def teste_catraca():
     try:
-        sistema.liberar_catraca()
-        return jsonify({
-            "success": True,
-            "message": "Teste de catraca executado"
-        })
+        dados = request.get_json(silent=True) or {}
+        nome = dados.get('faixa') or request.args.get('faixa')
+        if nome is not None and nome not in catraca.estado()["status"]["faixas"]:
+            return jsonify({"success": False, "message": "Faixa não encontrada"}), 404
+        
+        # Volta na hora: a liberação (até 9s) roda numa tarefa do hardware
+        tarefa = catraca.comando('agendar_teste_catraca', faixa=nome)
+        return resposta_tarefa(tarefa, f"Teste de catraca agendado ({nome or 'faixa principal'})")
     except Exception as e:
-        return jsonify({
-            "success": False,
-            "message": f"Erro no teste: {str(e)}"
-        }), 500
+        return resposta_erro(e, "Erro no teste")
+
+@app.route('/api/tarefas/<tarefa_id>', methods=['GET'])
+def tarefa_status(tarefa_id):
+    """Status e resultado de uma tarefa (diagnóstico, teste da catraca)"""
+    tarefa = catraca.comando('consultar_tarefa', tarefa_id=tarefa_id)
+    if tarefa is None:
+        return jsonify({"success": False, "message": "Tarefa não encontrada"}), 404
+    return jsonify({"success": True, **tarefa})
+
+@app.route('/api/catraca/passagens/<int:usuario_id>', methods=['DELETE'])
+def esquecer_passagem(usuario_id):
+    """Libera o usuário da janela de repetição e do anti-passback"""
+    catraca.comando('esquecer_passagem', usuario_id=usuario_id)
+    return jsonify({"success": True, "message": f"Passagens do usuário {usuario_id} esquecidas"})
 
 @app.route('/api/health', methods=['GET'])
 def health():
-    return jsonify({
+    """Sempre 200 se a API responde; com ?pronto=1, 503 até o hardware estar pronto"""
+    prontidao = None
+    try:
+        estado = catraca.estado()
+        sensor_conectado = estado["sensor_conectado"]
+        hardware = "ativo" if estado["idade_s"] <= LIMITE_IDADE else "sem_resposta"
+        prontidao = estado.get("prontidao")
+    except HardwareIndisponivel:
+        sensor_conectado = False
+        hardware = "indisponivel"
+    pronto = hardware == "ativo" and bool(prontidao and prontidao["pronto"])
+    resposta = jsonify({
         "status": "online",
         "service": "catraca_api",
-        "sensor_connected": sistema.sensor is not None,
+        "hardware": hardware,
+        "sensor_connected": sensor_conectado,
+        "ready": pronto,
+        "prontidao": prontidao,
+        "inicializacao_api": marcos_api,
+        "http": servidor_http.metricas() if servidor_http else None,
         "timestamp": datetime.now().isoformat()
     })
+    if request.args.get('pronto') in ('1', 'true') and not pronto:
+        return resposta, 503
+    return resposta
 
 @app.route('/api/diagnostico', methods=['GET'])
 def diagnostico():
+    """Último diagnóstico, se tiver menos de TTL_DIAGNOSTICO; senão agenda outro (?atualizar=1 força)"""
     try:
-        sensor_ok = sistema.diagnosticar_sensor() if sistema.sensor else False
-        
+        atualizar = request.args.get('atualizar') in ('1', 'true')
+        # Dentro do TTL o hardware devolve o último diagnóstico concluído
+        tarefa = catraca.comando('agendar_diagnostico', atualizar=atualizar)
+        if tarefa["status"] != CONCLUIDA:
+            return resposta_tarefa(tarefa, "Diagnóstico agendado")
         return jsonify({
-            "sensor_conectado": sistema.sensor is not None,
-            "sensor_operacional": sensor_ok,
-            "modo_atual": sistema.modo_atual,
-            "ultimo_erro": sistema.ultimo_erro_sensor
+            **tarefa["resultado"],
+            "tarefa_id": tarefa["id"],
+            "idade_s": round(time.time() - tarefa["concluida_em"], 1)
         })
     except Exception as e:
+        codigo = 503 if isinstance(e, HardwareIndisponivel) else 500
         return jsonify({
             "error": str(e)
-        }), 500
+        }), codigo
+
+def validar_arquivo_backup(nome):
+    """Resposta 400 se `nome` não for um nome simples de arquivo (None se estiver ok ou ausente)"""
+    if nome in (None, ''):
+        return None
+    try:
+        backup_templates.caminho_no_diretorio(DIRETORIO_BACKUP, nome)
+    except ValueError as e:
+        return jsonify({"success": False, "message": str(e)}), 400
+    return None
+
+@app.route('/api/templates/backup', methods=['POST'])
+def templates_backup():
+    """Baixa todos os templates do sensor para o banco (ou para um arquivo)"""
+    dados = request.get_json(silent=True) or {}
+    erro = validar_arquivo_backup(dados.get('arquivo'))
+    if erro:
+        return erro
+    if not catraca.estado()["sensor_conectado"]:
+        return jsonify({"success": False, "message": "Sensor não inicializado"}), 503
+    if not catraca.comando('operacao_templates', operacao='backup', arquivo=dados.get('arquivo')):
+        return jsonify({"success": False, "message": "Já existe uma operação de templates em andamento"}), 409
+    return jsonify({"success": True, "message": "Backup de templates iniciado"}), 202
+
+@app.route('/api/templates/restaurar', methods=['POST'])
+def templates_restaurar():
+    """Grava no sensor os templates do backup (banco ou arquivo)"""
+    dados = request.get_json(silent=True) or {}
+    erro = validar_arquivo_backup(dados.get('arquivo'))
+    if erro:
+        return erro
+    if not catraca.estado()["sensor_conectado"]:
+        return jsonify({"success": False, "message": "Sensor não inicializado"}), 503
+    if not catraca.comando('operacao_templates', operacao='restauracao', arquivo=dados.get('arquivo'),
+                           limpar=bool(dados.get('limpar'))):
+        return jsonify({"success": False, "message": "Já existe uma operação de templates em andamento"}), 409
+    return jsonify({"success": True, "message": "Restauração de templates iniciada"}), 202
+
+@app.route('/api/templates/status', methods=['GET'])
+def templates_status():
+    """Progresso e vazão do último backup/restauração"""
+    return jsonify({
+        "success": True,
+        **catraca.estado()["templates"]
+    })
+
+@app.route('/api/banco/metricas', methods=['GET'])
+def banco_metricas():
+    """Métricas do pool de conexões (espera e rotatividade)"""
+    return jsonify({
+        "success": True,
+        "pool": catraca.comando('metricas_banco')
+    })
+
+@app.route('/api/webhooks/metricas', methods=['GET'])
+def webhooks_metricas():
+    """Profundidade da fila e latência de entrega dos webhooks"""
+    return jsonify({
+        "success": True,
+        "webhooks": catraca.comando('metricas_webhooks')
+    })
+
+@app.route('/api/metrics', methods=['GET'])
+def metrics():
+    """Latências por etapa e contadores no formato de texto do Prometheus"""
+    return Response(catraca.comando('metricas'), mimetype='text/plain; version=0.0.4')
+
+@app.route('/api/logs', methods=['GET'])
+def logs():
+    """
+    Últimos registros do buffer de logs: ?desde=<id> (só os mais novos),
+    ?nivel=WARNING, ?componente=consulta, ?limite=200 e ?origem=api para
+    os da própria API no lugar dos do hardware
+    """
+    try:
+        filtros = {
+            "desde": int(request.args.get('desde', 0)),
+            "nivel": request.args.get('nivel'),
+            "componente": request.args.get('componente'),
+            "limite": max(1, min(int(request.args.get('limite', 200)), CAPACIDADE_BUFFER)),
+        }
+    except ValueError:
+        return jsonify({"success": False, "message": "desde e limite devem ser números"}), 400
+    if filtros["nivel"] and not isinstance(logging.getLevelName(filtros["nivel"].upper()), int):
+        return jsonify({"success": False, "message": f"Nível de log desconhecido: {filtros['nivel']}"}), 400
+    
+    origem = request.args.get('origem', 'hardware')
+    if origem not in ('hardware', 'api'):
+        return jsonify({"success": False, "message": "origem deve ser hardware ou api"}), 400
+    try:
+        resultado = consultar_logs(**filtros) if origem == 'api' else catraca.comando('logs', **filtros)
+        registros = resultado["registros"]
+        return jsonify({
+            "success": True,
+            "origem": origem,
+            "registros": registros,
+            "ultimo_id": registros[-1]["id"] if registros else filtros["desde"],
+            "logs": resultado["logs"]
+        })
+    except Exception as e:
+        return resposta_erro(e, "Erro ao ler logs")
+
+# ==================== PROCESSOS ====================
 
 def signal_handler(sig, frame):
-    print('\n🛑 Recebido sinal de desligamento...')
-    sistema.parar()
+    log.info("🛑 Recebido sinal de desligamento...")
+    if encerrando.is_set():
+        return
+    encerrando.set()
+    if servidor_http:
+        # Esta thread é a do serve_forever: para de aceitar em outra, e
+        # iniciar_api() drena as requisições antes de parar o hardware
+        if canal_eventos:
+            canal_eventos.acordar()
+        threading.Thread(target=servidor_http.shutdown, name="http-shutdown", daemon=True).start()
+        return
+    desligar_hardware()
     sys.exit(0)
 
-def iniciar_sistema():
-    print("🚀 Iniciando Sistema da Catraca (Webhook + REST API)...")
+def desligar_hardware():
+    """Para o sistema deste processo ou o processo do hardware filho"""
+    if sistema:
+        sistema.parar()
+    if processo_hardware and processo_hardware.is_alive():
+        processo_hardware.terminate()
+        processo_hardware.join(timeout=10)
+
+def preparar_hardware():
+    """
+    Sistema, tarefas, gravador de acessos e threads de consulta. Nada aqui
+    espera o sensor ou o banco: os leitores abrem pelo monitor de saúde e o
+    índice carrega numa tarefa, enquanto o estado já é publicado.
+    """
+    global sistema
+    sistema = SistemaCatraca()
+    
+    # Diagnóstico, teste da catraca e as etapas de inicialização abaixo
+    sistema.tarefas.iniciar()
+    
+    # Cada faixa começa sem sensor; o monitor de saúde o abre em segundo
+    # plano, com espera crescente entre as tentativas (1s, 2s, 4s...)
+    for faixa in sistema.faixas:
+        faixa.saude.adquirir()
+    
+    # Segundo leitor (balcão) só para as capturas do cadastro
+    if SENSOR_CADASTRO_PORT:
+        sistema.tarefas.submeter('leitor_cadastro', sistema.abrir_leitor_cadastro)
+    
+    # Índice posição -> usuário (banco ou snapshot); a consulta espera por ele
+    sistema.tarefas.submeter('preparar_indice', sistema.preparar_indice)
     
+    # Gravador de acessos (reenvia o que ficou no spool)
+    sistema.registrador.iniciar()
+    
+    # Iniciar uma thread de consulta por faixa
+    sistema.iniciar_consultas()
+    log.info(f"✅ Threads de consulta iniciadas: {', '.join(faixa.nome for faixa in sistema.faixas)}")
+
+def iniciar_hardware():
+    """Processo do hardware: publica o estado e atende os comandos da API"""
+    configurar_logs('hardware')
     signal.signal(signal.SIGINT, signal_handler)
     signal.signal(signal.SIGTERM, signal_handler)
     
-    # Inicializar sensor
-    sistema.sensor = sistema.inicializar_sensor()
+    # Antes de criar as threads: elas herdam o escalonamento
+    politica = elevar_prioridade(PRIORIDADE_HARDWARE)
+    log.info(f"⚙️ Processo do hardware (pid {os.getpid()}): escalonamento {politica or 'normal'}")
     
-    if sistema.sensor:
-        sistema.diagnosticar_sensor()
-    else:
-        print("⚠️ Sistema iniciando sem sensor - modo offline")
-    
-    # Iniciar thread de consulta
-    sistema.thread_consulta = threading.Thread(target=sistema.modo_consulta, daemon=True)
-    sistema.thread_consulta.start()
-    print("✅ Thread de consulta iniciada")
-    
-    print("✅ Servidor REST API iniciado na porta 5000")
-    print("📍 Endpoints disponíveis:")
-    print("   - POST http://192.168.11.220:5000/api/catraca/iniciar-cadastro")
-    print("   - GET  http://192.168.11.220:5000/api/catraca/status")
-    print("   - GET  http://192.168.11.220:5000/api/health")
-    print("   - GET  http://192.168.11.220:5000/api/diagnostico")
-    print("   - GET  http://192.168.11.220:5000/api/biometry")
-    print("   - GET  http://192.168.11.220:5000/api/cadastro-status")
-    print("   - POST http://192.168.11.220:5000/api/cancelar-cadastro")
-    print("🔌 Webhook disponível via POST para: http://seu-nodejs:3001/api/webhook/biometria")
+    preparar_hardware()
+    bloco = BlocoEstado(BLOCO_ESTADO, escrita=True)
+    servidor = ServidorComandos(SOCKET_COMANDOS, CHAVE_IPC, sistema.executar_comando)
+    servidor.iniciar()
+    log.info(f"✅ Estado publicado em {BLOCO_ESTADO}, comandos em {SOCKET_COMANDOS}")
+    
+    # Publica a cada INTERVALO_ESTADO ou logo após um evento do cadastro
+    eventos = sistema.eventos_cadastro
+    try:
+        publicar_estado(bloco, sistema.estado, lambda timeout: eventos.eventos_desde(eventos.ultimo_id, timeout),
+                        lambda: sistema.running)
+    finally:
+        servidor.parar()
+        bloco.fechar()
+
+def espelhar_eventos(canal):
+    """API separada: repete no canal local os eventos de cadastro do hardware"""
+    pid = None
+    while True:
+        try:
+            estado = catraca.estado()
+            if estado.get("pid") != pid:
+                pid = estado.get("pid")
+                canal.recomecar()
+            for evento in estado.get("eventos_cadastro", []):
+                canal.receber(evento)
+        except HardwareIndisponivel:
+            pass
+        except Exception as e:
+            log.warning(f"⚠️ Erro ao acompanhar eventos do cadastro: {e}")
+        time.sleep(INTERVALO_ESTADO / 2)
+
+def supervisionar_hardware():
+    """Mantém o processo do hardware rodando (reinicia com espera crescente)"""
+    global processo_hardware
+    contexto = multiprocessing.get_context('spawn')
+    espera = 1
+    while not encerrando.is_set():
+        processo_hardware = contexto.Process(target=iniciar_hardware, name="catraca-hardware")
+        processo_hardware.start()
+        inicio = time.monotonic()
+        processo_hardware.join()
+        if encerrando.is_set():
+            return
+        
+        espera = 1 if time.monotonic() - inicio > 60 else min(espera * 2, 30)
+        log.warning(f"⚠️ Processo do hardware terminou (código {processo_hardware.exitcode}), reiniciando em {espera}s")
+        time.sleep(espera)
+        # Marcos do novo processo contam do reinício, não da subida do serviço
+        os.environ['CATRACA_INICIO'] = str(time.monotonic())
+
+def iniciar_api():
+    global servidor_http
+    log_api.info(f"✅ Servidor REST API iniciado na porta {PORTA_API}")
+    log_api.info("📍 Endpoints disponíveis:")
+    log_api.info(f"   - POST http://192.168.11.220:{PORTA_API}/api/catraca/iniciar-cadastro")
+    log_api.info(f"   - GET  http://192.168.11.220:{PORTA_API}/api/catraca/status")
+    log_api.info(f"   - GET  http://192.168.11.220:{PORTA_API}/api/health")
+    log_api.info(f"   - GET  http://192.168.11.220:{PORTA_API}/api/diagnostico")
+    log_api.info(f"   - GET  http://192.168.11.220:{PORTA_API}/api/tarefas/<tarefa_id>")
+    log_api.info(f"   - POST http://192.168.11.220:{PORTA_API}/api/templates/backup")
+    log_api.info(f"   - POST http://192.168.11.220:{PORTA_API}/api/templates/restaurar")
+    log_api.info(f"   - GET  http://192.168.11.220:{PORTA_API}/api/templates/status")
+    log_api.info(f"   - GET  http://192.168.11.220:{PORTA_API}/api/banco/metricas")
+    log_api.info(f"   - GET  http://192.168.11.220:{PORTA_API}/api/webhooks/metricas")
+    log_api.info(f"   - GET  http://192.168.11.220:{PORTA_API}/api/metrics (Prometheus)")
+    log_api.info(f"   - GET  http://192.168.11.220:{PORTA_API}/api/biometry")
+    log_api.info(f"   - GET  http://192.168.11.220:{PORTA_API}/api/cadastro-status")
+    log_api.info(f"   - POST http://192.168.11.220:{PORTA_API}/api/cancelar-cadastro")
+    log_api.info(f"   - DELETE http://192.168.11.220:{PORTA_API}/api/catraca/passagens/<usuario_id>")
+    log_api.info(f"   - GET  http://192.168.11.220:{PORTA_API}/api/cadastro-eventos (SSE)")
+    log_api.info(f"   - GET  http://192.168.11.220:{PORTA_API}/api/logs")
+    log_api.info("🔌 Webhook disponível via POST para: http://seu-nodejs:3001/api/webhook/biometria")
     
     # Manter endpoints REST para compatibilidade, mas priorizar webhook
-    app.run(host='0.0.0.0', port=5000, debug=False, threaded=True)
+    if SERVIDOR_HTTP == 'desenvolvimento':
+        app.run(host='0.0.0.0', port=PORTA_API, debug=False, threaded=True)
+        return
+    
+    servidor_http = ServidorHTTP('0.0.0.0', PORTA_API, app, workers=HTTP_WORKERS, fila=HTTP_FILA, timeout=HTTP_TIMEOUT)
+    log_api.info(f"⚙️ HTTP: {HTTP_WORKERS} workers, fila de {HTTP_FILA} conexões, timeout {HTTP_TIMEOUT:.0f}s")
+    marcar_inicio(marcos_api, 'api_escutando')
+    servidor_http.serve_forever()
+    
+    # shutdown() veio do signal_handler: termina as requisições em andamento
+    # (que ainda podem mandar comandos ao hardware) e só então desliga
+    servidor_http.encerrar()
+    desligar_hardware()
+    log_api.info("✅ API encerrada")
+
+def iniciar_sistema(modo='completo'):
+    """
+    completo  processo do hardware filho deste, que serve a API (padrão)
+    hardware  só o processo do hardware (a API roda em outro serviço)
+    api       só a API, falando com um processo do hardware já rodando
+    unico     tudo num processo só, como antes da separação
+    """
+    global catraca, canal_eventos
+    configurar_logs('hardware' if modo == 'hardware' else None if modo == 'unico' else 'api')
+    log.info(f"🚀 Iniciando Sistema da Catraca (Webhook + REST API, modo {modo})...")
+    
+    if modo == 'hardware':
+        iniciar_hardware()
+        return
+    
+    signal.signal(signal.SIGINT, signal_handler)
+    signal.signal(signal.SIGTERM, signal_handler)
+    
+    if modo == 'unico':
+        preparar_hardware()
+        catraca = CatracaLocal(sistema)
+        canal_eventos = sistema.eventos_cadastro
+    else:
+        if modo == 'completo':
+            threading.Thread(target=supervisionar_hardware, name="supervisor-hardware", daemon=True).start()
+        try:
+            os.nice(NICE_API)
+        except OSError:
+            pass
+        catraca = ClienteCatraca(BLOCO_ESTADO, SOCKET_COMANDOS, CHAVE_IPC)
+        canal_eventos = CanalEventos()
+        threading.Thread(target=espelhar_eventos, args=(canal_eventos,), name="espelho-eventos", daemon=True).start()
+    
+    iniciar_api()
 
 if __name__ == "__main__":
-    iniciar_sistema()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Sistema da catraca (hardware + REST API)")
+    parser.add_argument('modo', nargs='?', default='completo', choices=['completo', 'hardware', 'api', 'unico'])
+    iniciar_sistema(parser.parse_args().modo)
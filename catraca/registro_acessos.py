@@ -0,0 +1,283 @@
+#!/usr/bin/env python3
+
+import json
+import os
+import queue
+import threading
+import time
+from datetime import datetime
+
+from metricas import cronometrar, DURACAO_ETAPA
+from log_catraca import componente
+
+log = componente('acessos')
+
+SQL_INSERIR_LOTE = """
+    INSERT INTO log_entrada (usuario_id, nome, tipo, periodo, identificador,
+                             created_at, data_entrada, horario)
+    VALUES %s
+"""
+
+MODELO_LOTE = "(%s, %s, %s, %s, %s, %s::timestamp, %s::timestamp::date, %s::timestamp::time)"
+
+
+class RegistradorAcessos:
+    """
+    Grava os acessos em log_entrada fora da thread de reconhecimento.
+
+    Cada passagem é primeiro anexada ao spool local (uma linha JSON por
+    evento) e só depois entra na fila da thread gravadora, que insere em
+    lotes. O arquivo '.offset' ao lado do spool guarda até onde o banco já
+    confirmou; na inicialização tudo que estiver depois dele é reenviado na
+    ordem original. A entrega é "pelo menos uma vez": se o processo cair
+    entre o commit e a gravação do offset, o último lote é repetido.
+
+    Erros de conexão seguram a fila e são repetidos com espera crescente.
+    Se o banco recusa os dados (valor inválido, restrição violada), o lote é
+    regravado linha por linha e as linhas recusadas vão para o arquivo
+    '.quarentena' ao lado do spool, para a fila não parar numa linha ruim.
+    """
+
+    def __init__(self, pool, caminho_spool='spool_acessos.jsonl', tamanho_lote=50,
+                 espera_lote=0.2, sincronizar_disco=True):
+        self.pool = pool
+        self.caminho_spool = caminho_spool
+        self.caminho_offset = caminho_spool + '.offset'
+        self.caminho_quarentena = caminho_spool + '.quarentena'
+        self.tamanho_lote = tamanho_lote
+        self.espera_lote = espera_lote
+        self.sincronizar_disco = sincronizar_disco
+
+        self.fila = queue.Queue()
+        self.lock_spool = threading.Lock()
+        self.running = True
+        self.thread_gravacao = None
+
+        self.pendentes = 0
+        self.gravados = 0
+        self.lotes = 0
+        self.falhas = 0
+        self.quarentena = 0
+        self.ultimo_erro = None
+
+    # ==================== PRODUTOR ====================
+
+    def registrar(self, usuario_id, nome, tipo, periodo, identificador):
+        """Registra a passagem com o horário local; nunca toca no banco"""
+        evento = {
+            'usuario_id': usuario_id,
+            'nome': nome,
+            'tipo': tipo,
+            'periodo': periodo,
+            'identificador': identificador,
+            'created_at': datetime.now().isoformat(sep=' '),
+        }
+        linha = (json.dumps(evento, ensure_ascii=False) + '\n').encode('utf-8')
+
+        # Spool e fila na mesma ordem: o lock cobre os dois
+        with cronometrar(DURACAO_ETAPA, fluxo='consulta', etapa='registro_spool'), self.lock_spool:
+            with open(self.caminho_spool, 'ab') as f:
+                f.write(linha)
+                f.flush()
+                if self.sincronizar_disco:
+                    os.fsync(f.fileno())
+                fim = f.tell()
+            self.pendentes += 1
+            self.fila.put((fim, evento))
+
+        return evento
+
+    # ==================== CICLO DE VIDA ====================
+
+    def iniciar(self):
+        self._reenviar_spool()
+        self.thread_gravacao = threading.Thread(target=self._gravar, daemon=True)
+        self.thread_gravacao.start()
+
+    def parar(self, timeout=5):
+        self.running = False
+        if self.thread_gravacao:
+            self.thread_gravacao.join(timeout=timeout)
+
+    def _reenviar_spool(self):
+        """Coloca na fila, em ordem, os eventos ainda não confirmados no banco"""
+        if not os.path.exists(self.caminho_spool):
+            return
+
+        offset = self._ler_offset()
+        quantidade = 0
+        with self.lock_spool:
+            with open(self.caminho_spool, 'r+b') as f:
+                f.seek(offset)
+                for linha in iter(f.readline, b''):
+                    if not linha.endswith(b'\n'):
+                        # Linha parcial de uma queda no meio da escrita
+                        f.truncate(f.tell() - len(linha))
+                        break
+                    try:
+                        evento = json.loads(linha)
+                    except ValueError:
+                        continue
+                    self.fila.put((f.tell(), evento))
+                    quantidade += 1
+            self.pendentes += quantidade
+
+        if quantidade:
+            log.info(f"📦 {quantidade} acessos pendentes no spool serão reenviados")
+
+    # ==================== CONSUMIDOR ====================
+
+    def _gravar(self):
+        espera = 1
+        lote = []
+
+        while self.running or lote or not self.fila.empty():
+            if not lote:
+                lote = self._coletar_lote()
+                if not lote:
+                    continue
+
+            try:
+                self._inserir(lote)
+            except Exception as e:
+                erro = e
+                if _erro_dos_dados(e):
+                    lote, erro = self._inserir_por_linha(lote)
+                    if not lote:
+                        espera = 1
+                        continue
+                self.falhas += 1
+                self.ultimo_erro = str(erro)
+                log.error(f"❌ Erro ao gravar {len(lote)} acessos (mantidos no spool): {erro}")
+                if not self.running:
+                    break
+                time.sleep(espera)
+                espera = min(espera * 2, 30)
+                continue
+
+            espera = 1
+            self._confirmar(lote[-1][0], len(lote))
+            lote = []
+
+    def _coletar_lote(self):
+        try:
+            lote = [self.fila.get(timeout=1)]
+        except queue.Empty:
+            return []
+
+        # Espera um pouco para juntar passagens seguidas no mesmo INSERT
+        limite = time.monotonic() + self.espera_lote
+        while len(lote) < self.tamanho_lote:
+            restante = limite - time.monotonic()
+            try:
+                if restante > 0:
+                    lote.append(self.fila.get(timeout=restante))
+                else:
+                    lote.append(self.fila.get_nowait())
+            except queue.Empty:
+                break
+        return lote
+
+    def _inserir(self, lote):
+        eventos = [evento for _, evento in lote]
+
+        with cronometrar(DURACAO_ETAPA, fluxo='consulta', etapa='insercao_log'), self.pool.conexao() as conn:
+            cursor = conn.cursor()
+            if len(eventos) == 1:
+                e = eventos[0]
+                cursor.execute(
+                    "EXECUTE inserir_log_entrada (%s, %s, %s, %s, %s, %s)",
+                    (e['usuario_id'], e['nome'], e['tipo'], e['periodo'], e['identificador'], e['created_at'])
+                )
+            else:
+                from psycopg2.extras import execute_values
+                execute_values(cursor, SQL_INSERIR_LOTE, [
+                    (e['usuario_id'], e['nome'], e['tipo'], e['periodo'], e['identificador'],
+                     e['created_at'], e['created_at'], e['created_at'])
+                    for e in eventos
+                ], template=MODELO_LOTE, page_size=self.tamanho_lote)
+            conn.commit()
+            cursor.close()
+
+        for e in eventos:
+            log.info(f"📌 Acesso registrado - {e['nome']} em {e['created_at']} ({e['periodo']})")
+
+    def _inserir_por_linha(self, lote):
+        """
+        Grava uma linha por vez; as que o banco recusa vão para a quarentena.
+        Retorna o que sobrou do lote e o erro, se um erro de conexão interromper.
+        """
+        for i, (offset, evento) in enumerate(lote):
+            try:
+                self._inserir([(offset, evento)])
+                quarentenados = 0
+            except Exception as e:
+                if not _erro_dos_dados(e):
+                    return lote[i:], e
+                self._quarentenar(evento, e)
+                quarentenados = 1
+            self._confirmar(offset, 1, quarentenados)
+        return [], None
+
+    def _quarentenar(self, evento, erro):
+        self.ultimo_erro = str(erro)
+        log.error(f"❌ Acesso recusado pelo banco, movido para {self.caminho_quarentena}: {evento} ({erro})")
+        linha = json.dumps({'evento': evento, 'erro': str(erro), 'momento': datetime.now().isoformat(sep=' ')},
+                           ensure_ascii=False, default=str) + '\n'
+        with open(self.caminho_quarentena, 'ab') as f:
+            f.write(linha.encode('utf-8'))
+            f.flush()
+            if self.sincronizar_disco:
+                os.fsync(f.fileno())
+
+    def _confirmar(self, offset, quantidade, quarentenados=0):
+        with self.lock_spool:
+            self.pendentes -= quantidade
+            self.gravados += quantidade - quarentenados
+            self.quarentena += quarentenados
+            self.lotes += 1
+
+            if self.pendentes == 0 and self.fila.empty():
+                # Tudo confirmado: o spool recomeça do zero. O offset é zerado
+                # antes do truncamento; uma queda entre os dois só repete eventos
+                self._gravar_offset(0)
+                open(self.caminho_spool, 'wb').close()
+            else:
+                self._gravar_offset(offset)
+
+    # ==================== OFFSET ====================
+
+    def _ler_offset(self):
+        try:
+            with open(self.caminho_offset) as f:
+                offset = int(f.read().strip() or 0)
+        except (OSError, ValueError):
+            return 0
+
+        # Offset além do fim: o spool foi truncado depois da última gravação
+        return offset if offset <= os.path.getsize(self.caminho_spool) else 0
+
+    def _gravar_offset(self, offset):
+        temporario = self.caminho_offset + '.tmp'
+        with open(temporario, 'w') as f:
+            f.write(str(offset))
+            f.flush()
+            if self.sincronizar_disco:
+                os.fsync(f.fileno())
+        os.replace(temporario, self.caminho_offset)
+
+    def metricas(self):
+        return {
+            "pendentes": self.pendentes,
+            "gravados": self.gravados,
+            "lotes": self.lotes,
+            "falhas": self.falhas,
+            "quarentena": self.quarentena,
+            "ultimo_erro": self.ultimo_erro,
+        }
+
+
+def _erro_dos_dados(erro):
+    """O banco recusou a linha em si (repetir não adianta); conexão e pool esgotado são passageiros"""
+    import psycopg2
+    return isinstance(erro, (psycopg2.DataError, psycopg2.IntegrityError, KeyError, TypeError))
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+
+import threading
+import time
+from collections import OrderedDict
+
+JANELA_PADRAO = 10            # segundos
+VALIDADE_ANTIPASSBACK = 12 * 3600  # segundos
+CAPACIDADE_PADRAO = 10000
+
+# Decisões de `verificar`
+LIBERAR = 'liberar'
+REPETIDO = 'repeticao'
+ANTIPASSBACK = 'antipassback'
+
+
+class FiltroAcessos:
+    """
+    Cache em memória da última liberação de cada usuário (chave: user id).
+
+    - Repetição: o mesmo usuário reconhecido de novo na mesma faixa, menos
+      de `janela` segundos depois de passar, não abre a catraca nem grava
+      outro log_entrada. Cada leitura suprimida renova a janela, então o
+      dedo parado no leitor continua suprimido; o momento da passagem,
+      usado pelo anti-passback, não muda.
+    - Anti-passback (só nas faixas com `antipassback` e `sentido`): quem
+      passou num sentido não passa de novo no mesmo sentido, em nenhuma
+      faixa, antes de passar no outro ou de `validade` segundos.
+
+    As entradas ficam em ordem de uso; acima de `capacidade` a mais antiga
+    sai, e as vencidas saem ao serem consultadas. O estado é do processo:
+    outra catraca não enxerga as passagens desta.
+    """
+
+    def __init__(self, janela=JANELA_PADRAO, validade=VALIDADE_ANTIPASSBACK, capacidade=CAPACIDADE_PADRAO):
+        self.janela = janela
+        self.validade = validade
+        self.capacidade = capacidade
+        self.entradas = OrderedDict()
+        self.lock = threading.Lock()
+
+        self.consultas = 0
+        self.acertos = 0
+        self.suprimidos = {REPETIDO: 0, ANTIPASSBACK: 0}
+        self.descartados = 0
+
+    def verificar(self, usuario_id, faixa):
+        """LIBERAR, REPETIDO ou ANTIPASSBACK para o usuário nesta faixa"""
+        agora = time.monotonic()
+        with self.lock:
+            self.consultas += 1
+            entrada = self.entradas.get(usuario_id)
+            if entrada is None:
+                return LIBERAR
+            if agora - entrada['momento'] >= self.validade and agora - entrada['leitura'] >= self.janela:
+                del self.entradas[usuario_id]
+                self.descartados += 1
+                return LIBERAR
+
+            self.acertos += 1
+            decisao = LIBERAR
+            if entrada['faixa'] == faixa.nome and agora - entrada['leitura'] < self.janela:
+                decisao = REPETIDO
+                entrada['leitura'] = agora
+            elif (getattr(faixa, 'antipassback', False) and faixa.sentido
+                  and entrada['sentido'] == faixa.sentido and agora - entrada['momento'] < self.validade):
+                decisao = ANTIPASSBACK
+
+            if decisao != LIBERAR:
+                self.suprimidos[decisao] += 1
+                self.entradas.move_to_end(usuario_id)
+            return decisao
+
+    def registrar(self, usuario_id, faixa):
+        """Anota a passagem do usuário por esta faixa"""
+        agora = time.monotonic()
+        with self.lock:
+            self.entradas[usuario_id] = {
+                'faixa': faixa.nome,
+                'sentido': faixa.sentido,
+                'momento': agora,   # passagem (anti-passback)
+                'leitura': agora,   # último reconhecimento (janela de repetição)
+            }
+            self.entradas.move_to_end(usuario_id)
+            while len(self.entradas) > self.capacidade:
+                self.entradas.popitem(last=False)
+                self.descartados += 1
+
+    def esquecer(self, usuario_id=None):
+        """Libera um usuário (ou todos) das duas regras"""
+        with self.lock:
+            if usuario_id is None:
+                self.entradas.clear()
+            else:
+                self.entradas.pop(usuario_id, None)
+
+    def metricas(self):
+        with self.lock:
+            return {
+                "janela_s": self.janela,
+                "validade_antipassback_s": self.validade,
+                "capacidade": self.capacidade,
+                "usuarios": len(self.entradas),
+                "consultas": self.consultas,
+                "acertos": self.acertos,
+                "suprimidos": dict(self.suprimidos),
+                "descartados": self.descartados,
+            }
@@ -0,0 +1,245 @@
+#!/usr/bin/env python3
+
+import threading
+import time
+
+from agendador_sensor import PRIORIDADE_DIAGNOSTICO, SensorIndisponivel
+from log_catraca import componente
+
+log = componente('saude')
+
+# Classes de resultado de um comando do sensor
+OK = 'ok'                          # sensor respondeu (reconheceu, negou, sonda ok)
+OCIOSO = 'ocioso'                  # ninguém colocou o dedo no tempo de espera
+SEM_MATCH = 'sem_match'            # dedo lido sem template correspondente (ou imagem ruim)
+ERRO_PROTOCOLO = 'erro_protocolo'  # resposta inválida, corrompida ou ausente
+DESCONECTADO = 'desconectado'      # porta serial sumiu / sensor não inicializado
+
+CLASSES = (OK, OCIOSO, SEM_MATCH, ERRO_PROTOCOLO, DESCONECTADO)
+
+INTERVALO_SONDA = 30        # segundos sem resposta do sensor antes de sondar
+TIMEOUT_SONDA = 10          # segundos
+LIMITE_ERROS_PROTOCOLO = 3  # erros de protocolo seguidos que contam como falha
+ESPERA_INICIAL = 1          # segundos até a 2ª tentativa de reabrir
+ESPERA_MAXIMA = 60          # teto do backoff exponencial
+
+# Erros do PyFingerprint que são do dedo, não do sensor
+MENSAGENS_LEITURA = ('the image', 'could not read image')
+MENSAGENS_DESCONEXAO = ('could not open port', 'no such file', 'input/output error',
+                        'device reports readiness', 'device disconnected')
+
+# Resultado do reconhecimento (ver SistemaCatraca.acesso_por_biometria) -> classe
+CLASSE_RECONHECIMENTO = {
+    'timeout': OCIOSO,
+    'sem_match': SEM_MATCH,
+    'imagem_ruim': SEM_MATCH,
+}
+
+
+def classificar_erro(erro):
+    """Classe de uma exceção levantada por um comando do sensor"""
+    mensagem = str(erro).lower()
+    if any(trecho in mensagem for trecho in MENSAGENS_LEITURA):
+        return SEM_MATCH
+    if isinstance(erro, TimeoutError):
+        return ERRO_PROTOCOLO
+    if isinstance(erro, (OSError, SensorIndisponivel)) or any(trecho in mensagem for trecho in MENSAGENS_DESCONEXAO):
+        return DESCONECTADO
+    return ERRO_PROTOCOLO
+
+
+def classe_reconhecimento(resultado):
+    return CLASSE_RECONHECIMENTO.get(resultado, OK)
+
+
+class MonitorSaude:
+    """
+    Saúde do sensor de uma faixa.
+
+    Cada resultado do sensor é classificado (ok, ocioso, sem match, erro de
+    protocolo, desconectado). Ocioso e sem match são operação normal: o
+    sensor respondeu. Uma desconexão, ou `limite_protocolo` erros de
+    protocolo seguidos, colocam a faixa em falha; a thread do monitor então
+    reabre o sensor com backoff exponencial (1s, 2s, 4s... até
+    `espera_maxima`) até conseguir.
+
+    Sem resultados por `intervalo_sonda` segundos (consulta pausada, sensor
+    nunca aberto), a thread envia um getTemplateCount com prioridade de
+    diagnóstico, que não atrasa reconhecimento nem cadastro.
+
+    Na inicialização, `adquirir()` antes de `iniciar()` faz a mesma thread
+    abrir o sensor pela primeira vez, com o mesmo backoff: o processo não
+    espera o leitor para subir.
+    """
+
+    def __init__(self, nome, agendador, intervalo_sonda=INTERVALO_SONDA, limite_protocolo=LIMITE_ERROS_PROTOCOLO,
+                 espera_inicial=ESPERA_INICIAL, espera_maxima=ESPERA_MAXIMA, ao_registrar=None):
+        self.nome = nome
+        self.agendador = agendador
+        self.intervalo_sonda = intervalo_sonda
+        self.limite_protocolo = limite_protocolo
+        self.espera_inicial = espera_inicial
+        self.espera_maxima = espera_maxima
+        self.ao_registrar = ao_registrar
+        self.reabrir = None
+
+        self.cond = threading.Condition()
+        self.running = True
+        self.thread = None
+
+        self.resultados = {classe: 0 for classe in CLASSES}
+        self.erros_seguidos = 0
+        self.falha = None
+        self.ultimo_erro = None
+        self.ultima_resposta = time.monotonic()
+        self.tentativas = 0
+        self.proxima_tentativa = 0.0
+        self.sondas = 0
+        self.sondas_falhas = 0
+        self.recuperacoes = 0
+        self.adquirido = True
+
+    # ==================== RESULTADOS ====================
+
+    def registrar(self, classe, erro=None):
+        """Anota um resultado; uma falha acorda a thread de recuperação"""
+        if self.ao_registrar:
+            self.ao_registrar(classe)
+        with self.cond:
+            self.resultados[classe] += 1
+            if classe in (OK, OCIOSO, SEM_MATCH):
+                self.erros_seguidos = 0
+                self.ultima_resposta = time.monotonic()
+                return
+
+            self.erros_seguidos += 1
+            self.ultimo_erro = str(erro) if erro is not None else classe
+            if self.falha is None and (classe == DESCONECTADO or self.erros_seguidos >= self.limite_protocolo):
+                self.falha = classe
+                self.tentativas = 0
+                self.proxima_tentativa = time.monotonic()
+                log.warning(f"🚨 Sensor da faixa {self.nome} em falha ({classe}): {self.ultimo_erro}")
+                self.cond.notify()
+
+    def registrar_erro(self, erro):
+        """Classifica e anota uma exceção; retorna a classe"""
+        classe = classificar_erro(erro)
+        self.registrar(classe, erro)
+        return classe
+
+    def adquirir(self):
+        """Sensor ainda não aberto: a thread do monitor o abre em segundo plano"""
+        with self.cond:
+            self.adquirido = False
+            # O estado 'adquirindo' já diz que o sensor não abriu; ultimo_erro
+            # fica para erros de verdade
+            self.falha = DESCONECTADO
+            self.tentativas = 0
+            self.proxima_tentativa = time.monotonic()
+            self.cond.notify()
+
+    @property
+    def em_falha(self):
+        return self.falha is not None
+
+    @property
+    def estado(self):
+        if self.falha:
+            return 'falha' if self.adquirido else 'adquirindo'
+        return 'degradado' if self.erros_seguidos else 'ok'
+
+    # ==================== MONITOR ====================
+
+    def iniciar(self, reabrir):
+        """`reabrir()` reabre o sensor da faixa e retorna o sensor (ou None)"""
+        self.reabrir = reabrir
+        self.thread = threading.Thread(target=self._monitorar, name=f"saude-{self.nome}", daemon=True)
+        self.thread.start()
+
+    def parar(self):
+        with self.cond:
+            self.running = False
+            self.cond.notify_all()
+        if self.thread:
+            self.thread.join(timeout=3)
+
+    def _monitorar(self):
+        while True:
+            with self.cond:
+                if not self.running:
+                    return
+                agora = time.monotonic()
+                if self.falha:
+                    espera = self.proxima_tentativa - agora
+                else:
+                    espera = self.ultima_resposta + self.intervalo_sonda - agora
+                if espera > 0:
+                    self.cond.wait(espera)
+                    continue
+                em_falha = self.falha is not None
+
+            if em_falha:
+                self._recuperar()
+            else:
+                self._sondar()
+
+    def _sondar(self):
+        """Comando barato para saber se o sensor ainda responde"""
+        if self.agendador.comando_atual is not None:
+            # Sensor ocupado com outro comando: não é silêncio
+            with self.cond:
+                self.ultima_resposta = time.monotonic()
+            return
+
+        self.sondas += 1
+        try:
+            self.agendador.chamar('getTemplateCount', prioridade=PRIORIDADE_DIAGNOSTICO, timeout=TIMEOUT_SONDA)
+        except Exception as e:
+            self.sondas_falhas += 1
+            self.registrar_erro(e)
+        else:
+            with self.cond:
+                self.erros_seguidos = 0
+                self.ultima_resposta = time.monotonic()
+
+    def _recuperar(self):
+        with self.cond:
+            self.tentativas += 1
+            tentativa = self.tentativas
+
+        try:
+            sensor = self.reabrir()
+        except Exception as e:
+            log.error(f"❌ Erro ao reabrir sensor da faixa {self.nome}: {e}")
+            sensor = None
+
+        with self.cond:
+            agora = time.monotonic()
+            if sensor:
+                log.info(f"✅ Sensor da faixa {self.nome} {'recuperado' if self.adquirido else 'aberto'} na tentativa {tentativa}")
+                if self.adquirido:
+                    self.recuperacoes += 1
+                self.adquirido = True
+                self.falha = None
+                self.erros_seguidos = 0
+                self.tentativas = 0
+                self.ultima_resposta = agora
+            else:
+                espera = min(self.espera_maxima, self.espera_inicial * 2 ** (tentativa - 1))
+                self.proxima_tentativa = agora + espera
+                log.warning(f"⚠️ Sensor da faixa {self.nome} indisponível, nova tentativa em {espera:.0f}s")
+
+    def metricas(self):
+        with self.cond:
+            return {
+                "estado": self.estado,
+                "falha": self.falha,
+                "ultimo_erro": self.ultimo_erro,
+                "erros_seguidos": self.erros_seguidos,
+                "resultados": dict(self.resultados),
+                "tentativas_reabrir": self.tentativas,
+                "recuperacoes": self.recuperacoes,
+                "sondas": self.sondas,
+                "sondas_falhas": self.sondas_falhas,
+                "sem_resposta_s": round(time.monotonic() - self.ultima_resposta, 1),
+            }
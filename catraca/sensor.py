@@ -0,0 +1,604 @@
+#!/usr/bin/env python3
+"""
+Camada de acesso ao sensor biométrico.
+
+`criar_sensor` devolve um objeto com a mesma interface do PyFingerprint; o
+serviço usa estes métodos, com as assinaturas dele:
+
+    verifyPassword, getSystemParameters, getStorageCapacity,
+    getTemplateCount, getTemplateIndex(page), readImage,
+    convertImage(charBufferNumber), searchTemplate, createTemplate,
+    storeTemplate(positionNumber, charBufferNumber),
+    loadTemplate(positionNumber, charBufferNumber), compareCharacteristics,
+    deleteTemplate(positionNumber, count), clearDatabase,
+    downloadCharacteristics(charBufferNumber),
+    uploadCharacteristics(charBufferNumber, characteristicsData)
+
+O backend real é a própria classe PyFingerprint; qual backend usar vem da
+variável de ambiente CATRACA_SENSOR:
+
+    pyfingerprint  (padrão) sensor real na porta serial
+    simulado       SensorSimulado em memória
+    simulado-pty   SensorSimulado atrás de um pty, acessado pelo próprio
+                   PyFingerprint (exercita o protocolo serial de verdade)
+
+CATRACA_SENSOR_ROTEIRO aponta para um JSON com templates iniciais,
+latências e eventos de dedo (ver `carregar_roteiro`).
+"""
+
+import hashlib
+import json
+import os
+import pty
+import random
+import threading
+import time
+import tty
+
+# Protocolo (mesmos valores usados pelo PyFingerprint)
+STARTCODE = 0xEF01
+PACOTE_COMANDO = 0x01
+PACOTE_DADOS = 0x02
+PACOTE_ACK = 0x07
+PACOTE_FIM_DADOS = 0x08
+
+CMD_LER_IMAGEM = 0x01
+CMD_CONVERTER_IMAGEM = 0x02
+CMD_COMPARAR = 0x03
+CMD_BUSCAR = 0x04
+CMD_CRIAR_TEMPLATE = 0x05
+CMD_ARMAZENAR = 0x06
+CMD_CARREGAR = 0x07
+CMD_BAIXAR_CARACTERISTICAS = 0x08
+CMD_ENVIAR_CARACTERISTICAS = 0x09
+CMD_APAGAR = 0x0C
+CMD_LIMPAR = 0x0D
+CMD_PARAMETROS = 0x0F
+CMD_VERIFICAR_SENHA = 0x13
+CMD_CONTAR_TEMPLATES = 0x1D
+CMD_INDICE_TEMPLATES = 0x1F
+
+OK = 0x00
+ERRO_SEM_DEDO = 0x02
+ERRO_NAO_CORRESPONDE = 0x08
+ERRO_NAO_ENCONTRADO = 0x09
+ERRO_CARACTERISTICAS_DIFERENTES = 0x0A
+ERRO_POSICAO_INVALIDA = 0x0B
+ERRO_CARREGAR = 0x0C
+ERRO_IMAGEM_INVALIDA = 0x15
+
+TAMANHO_CARACTERISTICAS = 512
+TAMANHO_PACOTE = 128
+POSICOES_POR_PAGINA = 256
+
+# Tempos aproximados de um R307 a 57600 baud (segundos)
+LATENCIAS_PADRAO = {
+    'verifyPassword': 0.01,
+    'getSystemParameters': 0.01,
+    'getTemplateCount': 0.01,
+    'getTemplateIndex': 0.01,
+    'readImage': 0.12,
+    'convertImage': 0.25,
+    'searchTemplate': 0.2,
+    'createTemplate': 0.05,
+    'storeTemplate': 0.05,
+    'loadTemplate': 0.03,
+    'compareCharacteristics': 0.05,
+    'deleteTemplate': 0.02,
+    'clearDatabase': 0.1,
+    'downloadCharacteristics': 0.1,
+    'uploadCharacteristics': 0.1,
+}
+
+
+def caracteristicas_do_dedo(dedo):
+    """Características determinísticas (512 bytes) para um identificador de dedo"""
+    semente = hashlib.sha256(str(dedo).encode('utf-8')).digest()
+    return list((semente * (TAMANHO_CARACTERISTICAS // len(semente) + 1))[:TAMANHO_CARACTERISTICAS])
+
+
+class SensorSimulado:
+    """
+    Sensor em memória com dedos "colocados" por roteiro.
+
+    Cada dedo é um identificador qualquer; as características dele são
+    derivadas do identificador, então o mesmo dedo sempre casa com o
+    template que gerou. Cada comando dorme a latência configurada para
+    reproduzir o tempo do sensor real.
+    """
+
+    def __init__(self, capacidade=1000, latencias=None, fator_latencia=1.0):
+        self.capacidade = capacidade
+        self.latencias = dict(LATENCIAS_PADRAO, **(latencias or {}))
+        self.fator_latencia = fator_latencia
+        self.templates = {}
+        self.buffers = {0x01: None, 0x02: None}
+        self.imagem = None
+        self.dedo_atual = None
+        self.dedos_ruins = set()
+        self.lock = threading.RLock()
+        self.comandos = 0
+        self.desconectado = False
+
+    # ==================== CONTROLE DO SIMULADOR ====================
+
+    def colocar_dedo(self, dedo):
+        self.dedo_atual = dedo
+
+    def remover_dedo(self):
+        self.dedo_atual = None
+
+    def desconectar(self):
+        """Todo comando passa a falhar como um cabo USB solto"""
+        self.desconectado = True
+
+    def reconectar(self):
+        self.desconectado = False
+
+    def tocar(self, dedo, duracao=0.6):
+        """Coloca o dedo e o remove depois de `duracao` segundos (sem bloquear)"""
+        self.colocar_dedo(dedo)
+        timer = threading.Timer(duracao, self._remover_se, args=(dedo,))
+        timer.daemon = True
+        timer.start()
+        return timer
+
+    def _remover_se(self, dedo):
+        if self.dedo_atual == dedo:
+            self.remover_dedo()
+
+    def cadastrar_dedo(self, dedo, posicao=None):
+        """Grava direto no armazenamento o template de um dedo"""
+        with self.lock:
+            if posicao is None:
+                posicao = self._primeira_livre()
+            self.templates[posicao] = caracteristicas_do_dedo(dedo)
+            return posicao
+
+    def _esperar(self, comando):
+        if self.desconectado:
+            raise OSError(5, 'Input/output error')
+        self.comandos += 1
+        atraso = self.latencias.get(comando, 0) * self.fator_latencia
+        if atraso > 0:
+            time.sleep(atraso)
+
+    def _primeira_livre(self):
+        for posicao in range(self.capacidade):
+            if posicao not in self.templates:
+                return posicao
+        raise Exception('Could not store template in that position')
+
+    def _validar_buffer(self, numero):
+        if numero not in self.buffers:
+            raise ValueError('The given charbuffer number is invalid!')
+
+    def _validar_posicao(self, posicao):
+        if posicao < 0 or posicao >= self.capacidade:
+            raise ValueError('The given position number is invalid!')
+
+    # ==================== INTERFACE DO SENSOR ====================
+
+    def verifyPassword(self):
+        self._esperar('verifyPassword')
+        return True
+
+    def getSystemParameters(self):
+        self._esperar('getSystemParameters')
+        # status, id, capacidade, segurança, endereço, tamanho do pacote (2 = 128), baud/9600
+        return (0, 0, self.capacidade, 3, 0xFFFFFFFF, 2, 6)
+
+    def getStorageCapacity(self):
+        return self.getSystemParameters()[2]
+
+    def getMaxPacketSize(self):
+        return TAMANHO_PACOTE
+
+    def getTemplateCount(self):
+        self._esperar('getTemplateCount')
+        return len(self.templates)
+
+    def getTemplateIndex(self, page):
+        if page < 0 or page > 3:
+            raise ValueError('The given index page is invalid!')
+        self._esperar('getTemplateIndex')
+        inicio = page * POSICOES_POR_PAGINA
+        return [(inicio + i) in self.templates for i in range(POSICOES_POR_PAGINA)]
+
+    def readImage(self):
+        with self.lock:
+            self._esperar('readImage')
+            if self.dedo_atual is None:
+                return False
+            self.imagem = self.dedo_atual
+            return True
+
+    def convertImage(self, charBufferNumber=0x01):
+        self._validar_buffer(charBufferNumber)
+        with self.lock:
+            self._esperar('convertImage')
+            if self.imagem is None:
+                raise Exception('The image is invalid')
+            if self.imagem in self.dedos_ruins:
+                raise Exception('The image is too messy')
+            self.buffers[charBufferNumber] = caracteristicas_do_dedo(self.imagem)
+            return True
+
+    def searchTemplate(self):
+        with self.lock:
+            self._esperar('searchTemplate')
+            alvo = self.buffers[0x01]
+            if alvo is not None:
+                for posicao in sorted(self.templates):
+                    if self.templates[posicao] == alvo:
+                        return (posicao, 150)
+            return (-1, -1)
+
+    def createTemplate(self):
+        with self.lock:
+            self._esperar('createTemplate')
+            if self.buffers[0x01] is None or self.buffers[0x01] != self.buffers[0x02]:
+                return False
+            return True
+
+    def storeTemplate(self, positionNumber=-1, charBufferNumber=0x01):
+        self._validar_buffer(charBufferNumber)
+        with self.lock:
+            if positionNumber == -1:
+                positionNumber = self._primeira_livre()
+            self._validar_posicao(positionNumber)
+            self._esperar('storeTemplate')
+            if self.buffers[charBufferNumber] is None:
+                raise Exception('Could not store template in that position')
+            self.templates[positionNumber] = list(self.buffers[charBufferNumber])
+            return positionNumber
+
+    def loadTemplate(self, positionNumber, charBufferNumber=0x01):
+        self._validar_posicao(positionNumber)
+        self._validar_buffer(charBufferNumber)
+        with self.lock:
+            self._esperar('loadTemplate')
+            if positionNumber not in self.templates:
+                raise Exception('The template could not be read')
+            self.buffers[charBufferNumber] = list(self.templates[positionNumber])
+            return True
+
+    def compareCharacteristics(self):
+        with self.lock:
+            self._esperar('compareCharacteristics')
+            if self.buffers[0x01] is not None and self.buffers[0x01] == self.buffers[0x02]:
+                return 150
+            return 0
+
+    def deleteTemplate(self, positionNumber, count=1):
+        self._validar_posicao(positionNumber)
+        if count < 0 or count > self.capacidade - positionNumber:
+            raise ValueError('The given count is invalid!')
+        with self.lock:
+            self._esperar('deleteTemplate')
+            for posicao in range(positionNumber, positionNumber + count):
+                self.templates.pop(posicao, None)
+            return True
+
+    def clearDatabase(self):
+        with self.lock:
+            self._esperar('clearDatabase')
+            self.templates.clear()
+            return True
+
+    def downloadCharacteristics(self, charBufferNumber=0x01):
+        self._validar_buffer(charBufferNumber)
+        with self.lock:
+            self._esperar('downloadCharacteristics')
+            if self.buffers[charBufferNumber] is None:
+                raise Exception('Could not download characteristics')
+            return list(self.buffers[charBufferNumber])
+
+    def uploadCharacteristics(self, charBufferNumber=0x01, characteristicsData=[0]):
+        self._validar_buffer(charBufferNumber)
+        if characteristicsData == [0]:
+            raise ValueError('The characteristics data is required!')
+        with self.lock:
+            self._esperar('uploadCharacteristics')
+            self.buffers[charBufferNumber] = list(characteristicsData)
+            return True
+
+
+# ==================== ROTEIRO DE EVENTOS ====================
+
+def carregar_roteiro(caminho, sensor, simulador_gpio=None):
+    """
+    Aplica um roteiro JSON ao sensor simulado e inicia os eventos.
+
+    Formato:
+        {
+          "templates": {"0": "dedo-ana", "1": "dedo-bia"},
+          "latencias": {"readImage": 0.05},
+          "fator_latencia": 1.0,
+          "repetir": true,
+          "eventos": [
+            {"t": 1.0, "acao": "tocar", "dedo": "dedo-ana", "duracao": 0.6},
+            {"t": 2.0, "acao": "passagem", "gpio": 412},
+            {"t": 5.0, "acao": "trafego", "dedos": ["dedo-ana"], "intervalo": 1.5},
+            {"t": 9.0, "acao": "desconectar"}, {"t": 12.0, "acao": "reconectar"}
+          ]
+        }
+    """
+    with open(caminho) as f:
+        roteiro = json.load(f)
+
+    for posicao, dedo in roteiro.get('templates', {}).items():
+        sensor.cadastrar_dedo(dedo, int(posicao))
+    sensor.latencias.update(roteiro.get('latencias', {}))
+    sensor.fator_latencia = roteiro.get('fator_latencia', sensor.fator_latencia)
+
+    thread = threading.Thread(
+        target=executar_eventos,
+        args=(sensor, roteiro.get('eventos', []), roteiro.get('repetir', False), simulador_gpio),
+        daemon=True
+    )
+    thread.start()
+    return thread
+
+
+def executar_eventos(sensor, eventos, repetir=False, simulador_gpio=None):
+    while True:
+        inicio = time.monotonic()
+        for evento in sorted(eventos, key=lambda e: e.get('t', 0)):
+            atraso = inicio + evento.get('t', 0) - time.monotonic()
+            if atraso > 0:
+                time.sleep(atraso)
+            _aplicar_evento(sensor, evento, simulador_gpio)
+        if not repetir:
+            return
+
+
+def _aplicar_evento(sensor, evento, simulador_gpio):
+    acao = evento.get('acao')
+    if acao == 'colocar':
+        sensor.colocar_dedo(evento['dedo'])
+    elif acao == 'remover':
+        sensor.remover_dedo()
+    elif acao == 'tocar':
+        sensor.tocar(evento['dedo'], evento.get('duracao', 0.6))
+    elif acao == 'desconectar':
+        sensor.desconectar()
+    elif acao == 'reconectar':
+        sensor.reconectar()
+    elif acao == 'passagem' and simulador_gpio:
+        simulador_gpio.pulso(evento.get('gpio', 412), evento.get('atraso', 0.5), evento.get('duracao', 0.3))
+    elif acao == 'trafego':
+        gerar_trafego(sensor, evento['dedos'], evento.get('intervalo', 2.0),
+                      evento.get('quantidade'), simulador_gpio, evento.get('gpio', 412))
+
+
+def gerar_trafego(sensor, dedos, intervalo=2.0, quantidade=None, simulador_gpio=None, gpio=412):
+    """Toques aleatórios em sequência, com passagem no GPIO se houver simulador"""
+    enviados = 0
+    while quantidade is None or enviados < quantidade:
+        sensor.tocar(random.choice(dedos))
+        if simulador_gpio:
+            simulador_gpio.pulso(gpio, atraso=intervalo / 3, duracao=0.2)
+        enviados += 1
+        time.sleep(intervalo)
+
+
+# ==================== PTY (PROTOCOLO SERIAL) ====================
+
+class ServidorSerialSimulado:
+    """
+    Expõe um SensorSimulado em um pseudo-terminal falando o protocolo do
+    sensor, para que o PyFingerprint (ou outro cliente) conecte nele como
+    se fosse /dev/ttyUSB0.
+    """
+
+    def __init__(self, sensor, link=None):
+        self.sensor = sensor
+        self.mestre, self.escravo = pty.openpty()
+        tty.setraw(self.escravo)
+        self.caminho = os.ttyname(self.escravo)
+        self.link = link
+        if link:
+            if os.path.lexists(link):
+                os.remove(link)
+            os.symlink(self.caminho, link)
+        self.running = True
+        self.thread = None
+
+    def iniciar(self):
+        self.thread = threading.Thread(target=self._atender, daemon=True)
+        self.thread.start()
+        return self.caminho if not self.link else self.link
+
+    def parar(self):
+        self.running = False
+        os.close(self.mestre)
+        os.close(self.escravo)
+
+    # ---- enquadramento ----
+
+    def _ler_exato(self, tamanho):
+        dados = b''
+        while len(dados) < tamanho:
+            parte = os.read(self.mestre, tamanho - len(dados))
+            if not parte:
+                raise EOFError()
+            dados += parte
+        return dados
+
+    def _ler_pacote(self):
+        # Sincroniza no STARTCODE
+        while self._ler_exato(1) != b'\xef':
+            pass
+        if self._ler_exato(1) != b'\x01':
+            return None, []
+        cabecalho = self._ler_exato(7)
+        tipo = cabecalho[4]
+        tamanho = (cabecalho[5] << 8) | cabecalho[6]
+        corpo = self._ler_exato(tamanho)
+        return tipo, list(corpo[:-2])
+
+    def _escrever_pacote(self, tipo, payload):
+        tamanho = len(payload) + 2
+        soma = (tipo + (tamanho >> 8) + (tamanho & 0xFF) + sum(payload)) & 0xFFFF
+        pacote = bytes([0xEF, 0x01, 0xFF, 0xFF, 0xFF, 0xFF, tipo, tamanho >> 8, tamanho & 0xFF])
+        pacote += bytes(payload) + bytes([soma >> 8, soma & 0xFF])
+        os.write(self.mestre, pacote)
+
+    def _ack(self, *payload):
+        self._escrever_pacote(PACOTE_ACK, list(payload))
+
+    # ---- despacho ----
+
+    def _atender(self):
+        while self.running:
+            try:
+                tipo, dados = self._ler_pacote()
+            except (EOFError, OSError):
+                return
+            if tipo != PACOTE_COMANDO or not dados:
+                continue
+            try:
+                self._tratar(dados[0], dados[1:])
+            except Exception:
+                self._ack(0x01)  # erro de comunicação
+
+    def _tratar(self, comando, args):
+        s = self.sensor
+
+        if comando == CMD_VERIFICAR_SENHA:
+            self._ack(OK if s.verifyPassword() else 0x13)
+        elif comando == CMD_PARAMETROS:
+            status, sid, capacidade, seguranca, endereco, pacote, baud = s.getSystemParameters()
+            self._ack(OK, status >> 8, status & 0xFF, sid >> 8, sid & 0xFF,
+                      capacidade >> 8, capacidade & 0xFF, seguranca >> 8, seguranca & 0xFF,
+                      (endereco >> 24) & 0xFF, (endereco >> 16) & 0xFF, (endereco >> 8) & 0xFF, endereco & 0xFF,
+                      pacote >> 8, pacote & 0xFF, baud >> 8, baud & 0xFF)
+        elif comando == CMD_CONTAR_TEMPLATES:
+            total = s.getTemplateCount()
+            self._ack(OK, total >> 8, total & 0xFF)
+        elif comando == CMD_INDICE_TEMPLATES:
+            usados = s.getTemplateIndex(args[0])
+            bytes_pagina = [
+                sum(1 << bit for bit in range(8) if usados[i * 8 + bit])
+                for i in range(POSICOES_POR_PAGINA // 8)
+            ]
+            self._ack(OK, *bytes_pagina)
+        elif comando == CMD_LER_IMAGEM:
+            self._ack(OK if s.readImage() else ERRO_SEM_DEDO)
+        elif comando == CMD_CONVERTER_IMAGEM:
+            try:
+                s.convertImage(args[0])
+                self._ack(OK)
+            except Exception:
+                self._ack(ERRO_IMAGEM_INVALIDA)
+        elif comando == CMD_BUSCAR:
+            posicao, pontuacao = s.searchTemplate()
+            if posicao < 0:
+                self._ack(ERRO_NAO_ENCONTRADO, 0, 0, 0, 0)
+            else:
+                self._ack(OK, posicao >> 8, posicao & 0xFF, pontuacao >> 8, pontuacao & 0xFF)
+        elif comando == CMD_CRIAR_TEMPLATE:
+            self._ack(OK if s.createTemplate() else ERRO_CARACTERISTICAS_DIFERENTES)
+        elif comando == CMD_ARMAZENAR:
+            try:
+                s.storeTemplate((args[1] << 8) | args[2], args[0])
+                self._ack(OK)
+            except Exception:
+                self._ack(ERRO_POSICAO_INVALIDA)
+        elif comando == CMD_CARREGAR:
+            try:
+                s.loadTemplate((args[1] << 8) | args[2], args[0])
+                self._ack(OK)
+            except Exception:
+                self._ack(ERRO_CARREGAR)
+        elif comando == CMD_COMPARAR:
+            pontuacao = s.compareCharacteristics()
+            if pontuacao:
+                self._ack(OK, pontuacao >> 8, pontuacao & 0xFF)
+            else:
+                self._ack(ERRO_NAO_CORRESPONDE, 0, 0)
+        elif comando == CMD_APAGAR:
+            s.deleteTemplate((args[0] << 8) | args[1], (args[2] << 8) | args[3])
+            self._ack(OK)
+        elif comando == CMD_LIMPAR:
+            s.clearDatabase()
+            self._ack(OK)
+        elif comando == CMD_BAIXAR_CARACTERISTICAS:
+            dados = s.downloadCharacteristics(args[0])
+            self._ack(OK)
+            for inicio in range(0, len(dados), TAMANHO_PACOTE):
+                parte = dados[inicio:inicio + TAMANHO_PACOTE]
+                fim = inicio + TAMANHO_PACOTE >= len(dados)
+                self._escrever_pacote(PACOTE_FIM_DADOS if fim else PACOTE_DADOS, parte)
+        elif comando == CMD_ENVIAR_CARACTERISTICAS:
+            self._ack(OK)
+            recebido = []
+            while True:
+                tipo, parte = self._ler_pacote()
+                recebido.extend(parte)
+                if tipo == PACOTE_FIM_DADOS:
+                    break
+            s.uploadCharacteristics(args[0], recebido)
+        else:
+            self._ack(0x01)
+
+
+# ==================== FÁBRICA ====================
+
+def criar_sensor(porta='/dev/ttyUSB0', baud=57600, backend=None):
+    """Cria o sensor do backend configurado (CATRACA_SENSOR)"""
+    backend = backend or os.environ.get('CATRACA_SENSOR', 'pyfingerprint')
+
+    if backend == 'pyfingerprint':
+        from pyfingerprint.pyfingerprint import PyFingerprint
+        return PyFingerprint(porta, baud, 0xFFFFFFFF, 0x00000000)
+
+    simulado = _sensor_simulado(porta)
+
+    if backend == 'simulado':
+        return simulado
+
+    if backend == 'simulado-pty':
+        from pyfingerprint.pyfingerprint import PyFingerprint
+        return PyFingerprint(_servidor_pty(simulado).caminho, baud, 0xFFFFFFFF, 0x00000000)
+
+    raise ValueError(f"Backend de sensor desconhecido: {backend}")
+
+
+_sensores_simulados = {}
+_servidores_pty = {}
+_lock_fabrica = threading.Lock()
+
+
+def _servidor_pty(simulado):
+    with _lock_fabrica:
+        if id(simulado) not in _servidores_pty:
+            _servidores_pty[id(simulado)] = ServidorSerialSimulado(simulado)
+            _servidores_pty[id(simulado)].iniciar()
+        return _servidores_pty[id(simulado)]
+
+
+def _sensor_simulado(porta):
+    """
+    Um sensor simulado por porta: reconexões (inicializar_sensor depois de
+    um erro) continuam vendo os mesmos templates, e cada faixa da catraca
+    tem o seu leitor. O roteiro (CATRACA_SENSOR_ROTEIRO) vale para o
+    primeiro sensor criado.
+    """
+    with _lock_fabrica:
+        if porta not in _sensores_simulados:
+            simulado = SensorSimulado()
+            roteiro = os.environ.get('CATRACA_SENSOR_ROTEIRO')
+            if roteiro and not _sensores_simulados:
+                carregar_roteiro(roteiro, simulado, _simulador_gpio_ambiente())
+            _sensores_simulados[porta] = simulado
+        return _sensores_simulados[porta]
+
+
+def _simulador_gpio_ambiente():
+    diretorio = os.environ.get('CATRACA_GPIO_SIMULADO')
+    if not diretorio:
+        return None
+    from gpio import SimuladorGPIO
+    return SimuladorGPIO(diretorio)
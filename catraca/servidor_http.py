@@ -0,0 +1,292 @@
+#!/usr/bin/env python3
+"""
+Servidor HTTP da API para produção, sem dependências além do Flask.
+
+O servidor de desenvolvimento (`app.run(threaded=True)`) cria uma thread
+por conexão, sem limite, e ao desligar derruba o que estiver em andamento.
+Aqui as conexões são atendidas por um número fixo de workers; as que
+chegam com todos ocupados esperam numa fila limitada, e acima dela
+recebem 503 na hora. As conexões ficam abertas entre requisições
+(HTTP/1.1 keep-alive) até `timeout` segundos sem receber nada; com
+conexões esperando na fila, a resposta fecha a conexão para liberar o
+worker, e o cliente volta para o fim da fila.
+
+Cada stream SSE ocupa um worker enquanto o cliente estiver conectado.
+"""
+
+import socket
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+
+from werkzeug.serving import BaseWSGIServer, WSGIRequestHandler, InternalServerError, connection_dropped_errors
+from werkzeug.wsgi import LimitedStream
+
+from log_catraca import componente
+
+log = componente('http')
+
+WORKERS = 16
+FILA = 64                # conexões aceitas esperando um worker
+TIMEOUT_REQUISICAO = 10  # segundos sem dados do cliente (inclui keep-alive ocioso)
+TEMPO_DRENAGEM = 10      # segundos para as requisições em andamento terminarem
+CORPO_MAXIMO_DESCARTE = 1024 * 1024  # corpo não lido maior que isso fecha a conexão
+
+CORPO_LOTADO = b'{"success": false, "message": "Servidor HTTP sem workers livres"}\n'
+RESPOSTA_LOTADO = (
+    b"HTTP/1.1 503 Service Unavailable\r\n"
+    b"Content-Type: application/json\r\n"
+    b"Content-Length: %d\r\n"
+    b"Retry-After: 1\r\n"
+    b"Connection: close\r\n"
+    b"\r\n" % len(CORPO_LOTADO)
+) + CORPO_LOTADO
+
+
+class ManipuladorHTTP(WSGIRequestHandler):
+    """Uma conexão; sabe se está parada esperando a próxima requisição"""
+
+    protocol_version = "HTTP/1.1"
+    # Cabeçalho e corpo saem em dois send(): com Nagle, numa conexão mantida
+    # aberta, o segundo espera o ACK atrasado do cliente (~40 ms)
+    disable_nagle_algorithm = True
+
+    def setup(self):
+        self.timeout = self.server.timeout_requisicao
+        self.ocioso = False
+        self.atendidas = 0
+        super().setup()
+        self.server.conectar(self)
+
+    def finish(self):
+        self.server.desconectar(self)
+        super().finish()
+
+    def handle_one_request(self):
+        self.ocioso = True
+        if self.atendidas and self.server.encerrando:
+            self.close_connection = True
+            return
+        super().handle_one_request()
+        self.atendidas += 1
+        if self.server.encerrando:
+            self.close_connection = True
+
+    def parse_request(self):
+        self.ocioso = False
+        return super().parse_request()
+
+    def log_error(self, formato, *args):
+        # Conexão keep-alive parada até o timeout: fim normal, não é erro
+        if self.ocioso and formato.startswith("Request timed out"):
+            return
+        super().log_error(formato, *args)
+
+    def run_wsgi(self):
+        """
+        Como o run_wsgi do werkzeug, sem o `Connection: close` que ele manda
+        em toda resposta. Para a próxima requisição chegar intacta, o corpo
+        desta é lido só até o Content-Length (o werkzeug esvazia o socket,
+        o que engoliria a requisição seguinte) e a resposta sem tamanho vai
+        em chunked. Fecham a conexão: cliente que pediu, HTTP/1.0 sem
+        keep-alive, corpo em chunked, erro na aplicação, outras conexões
+        esperando um worker e o encerramento.
+        """
+        if self.headers.get("Expect", "").lower().strip(" \t") == "100-continue":
+            self.wfile.write(b"HTTP/1.1 100 Continue\r\n\r\n")
+
+        environ = self.environ = self.make_environ()
+        corpo = None
+        tamanho = int(environ.get("CONTENT_LENGTH") or 0)
+        if environ.get("wsgi.input_terminated") or tamanho > CORPO_MAXIMO_DESCARTE:
+            self.close_connection = True
+        else:
+            corpo = environ["wsgi.input"] = LimitedStream(self.rfile, tamanho)
+        if self.server.encerrando or self.server.ha_espera():
+            self.close_connection = True
+
+        respostas = []  # (status, headers) de cada start_response
+        enviado = False
+        chunked = False
+
+        def write(dados):
+            nonlocal enviado, chunked
+            if not enviado:
+                enviado = True
+                status, headers = respostas[-1]
+                codigo, _, mensagem = status.partition(" ")
+                codigo = int(codigo)
+                self.send_response(codigo, mensagem)
+                nomes = set()
+                for nome, valor in headers:
+                    self.send_header(nome, valor)
+                    nomes.add(nome.lower())
+                if not ("content-length" in nomes or self.command == "HEAD"
+                        or 100 <= codigo < 200 or codigo in (204, 304)):
+                    if self.request_version == "HTTP/1.1":
+                        chunked = True
+                        self.send_header("Transfer-Encoding", "chunked")
+                    else:
+                        # HTTP/1.0 sem tamanho: o fim da resposta é o fim da conexão
+                        self.close_connection = True
+                if self.close_connection:
+                    self.send_header("Connection", "close")
+                elif self.request_version != "HTTP/1.1":
+                    self.send_header("Connection", "keep-alive")
+                self.end_headers()
+
+            if dados:
+                if chunked:
+                    self.wfile.write(b"%x\r\n%s\r\n" % (len(dados), dados))
+                else:
+                    self.wfile.write(dados)
+            self.wfile.flush()
+
+        def start_response(status, headers, exc_info=None):
+            if exc_info:
+                try:
+                    if enviado:
+                        raise exc_info[1].with_traceback(exc_info[2])
+                finally:
+                    exc_info = None
+            respostas.append((status, headers))
+            return write
+
+        def executar(app):
+            iterador = app(environ, start_response)
+            try:
+                for dados in iterador:
+                    write(dados)
+                if not enviado:
+                    write(b"")
+                if chunked:
+                    self.wfile.write(b"0\r\n\r\n")
+                    self.wfile.flush()
+            finally:
+                if hasattr(iterador, "close"):
+                    iterador.close()
+
+        try:
+            executar(self.server.app)
+            if corpo is not None and not self.close_connection:
+                corpo.exhaust()
+        except connection_dropped_errors as e:
+            self.close_connection = True
+            self.connection_dropped(e, environ)
+        except Exception:
+            self.close_connection = True
+            if not enviado:
+                try:
+                    executar(InternalServerError())
+                except Exception:
+                    pass
+            self.server.log("error", f"Erro na requisição {self.command} {self.path}:\n{traceback.format_exc()}")
+
+    def fechar(self):
+        try:
+            self.connection.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+
+class ServidorHTTP(BaseWSGIServer):
+    """WSGI com pool fixo de workers, fila limitada e encerramento gradual"""
+
+    multithread = True
+    request_queue_size = 128
+
+    def __init__(self, host, porta, app, workers=WORKERS, fila=FILA, timeout=TIMEOUT_REQUISICAO):
+        self.workers = workers
+        self.fila = fila
+        self.timeout_requisicao = timeout
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="http")
+        self.cond = threading.Condition()
+        self.manipuladores = set()
+        self.pendentes = 0
+        self.encerrando = False
+
+        self.conexoes_atendidas = 0
+        self.recusadas = 0
+        super().__init__(host, porta, app, handler=ManipuladorHTTP)
+
+    # ==================== CONEXÕES ====================
+
+    def process_request(self, request, client_address):
+        with self.cond:
+            lotado = self.pendentes >= self.workers + self.fila
+            if lotado:
+                self.recusadas += 1
+            else:
+                self.pendentes += 1
+        if lotado:
+            try:
+                request.sendall(RESPOSTA_LOTADO)
+            except OSError:
+                pass
+            self.shutdown_request(request)
+            return
+        self.executor.submit(self._atender, request, client_address)
+
+    def _atender(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+            with self.cond:
+                self.pendentes -= 1
+                self.conexoes_atendidas += 1
+                self.cond.notify_all()
+
+    def ha_espera(self):
+        """Há conexões aceitas esperando um worker (a atual não deve segurar o seu)"""
+        return self.pendentes > self.workers
+
+    def conectar(self, manipulador):
+        with self.cond:
+            self.manipuladores.add(manipulador)
+
+    def desconectar(self, manipulador):
+        with self.cond:
+            self.manipuladores.discard(manipulador)
+
+    # ==================== ENCERRAMENTO ====================
+
+    def encerrar(self, timeout=TEMPO_DRENAGEM):
+        """
+        Para de aceitar conexões, fecha as que estão ociosas e espera as
+        requisições em andamento (e as da fila) por até `timeout` segundos;
+        o que sobrar é derrubado. Roda em outra thread ou depois que o
+        serve_forever retornou (shutdown() numa thread e encerrar() na do
+        serve_forever, quando ele voltar).
+        """
+        self.encerrando = True
+        self.shutdown()
+
+        with self.cond:
+            for manipulador in self.manipuladores:
+                if manipulador.ocioso and manipulador.atendidas:
+                    manipulador.fechar()
+            drenou = self.cond.wait_for(lambda: self.pendentes == 0, timeout)
+            restantes = list(self.manipuladores)
+
+        if not drenou:
+            log.warning(f"⚠️ Encerrando {len(restantes)} conexão(ões) HTTP ainda em andamento")
+            for manipulador in restantes:
+                manipulador.fechar()
+        self.executor.shutdown(wait=True)
+        self.server_close()
+        return drenou
+
+    def metricas(self):
+        with self.cond:
+            return {
+                "workers": self.workers,
+                "fila_maxima": self.fila,
+                "conexoes": len(self.manipuladores),
+                "em_andamento": sum(1 for m in self.manipuladores if not m.ocioso),
+                "pendentes": self.pendentes,
+                "conexoes_atendidas": self.conexoes_atendidas,
+                "recusadas": self.recusadas,
+            }
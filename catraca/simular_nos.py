@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+"""
+Simulação de várias catracas sincronizando templates.
+
+Cada nó é um processo com o seu próprio SensorSimulado e o seu
+SincronizadorTemplates. O processo principal publica, altera e remove
+templates no repositório central e mede quanto tempo cada nó leva para
+chegar à última versão. No fim, cada nó confere o sensor contra o banco.
+
+Use um banco de teste: os templates publicados ficam em template_central.
+
+    python simular_nos.py --dsn "host=localhost dbname=turnstile_system user=postgres" --nos 3
+"""
+
+import argparse
+import multiprocessing
+import time
+
+import psycopg2.extensions
+
+from backup_templates import executar_direto
+from banco import obter_pool
+from sensor import SensorSimulado, caracteristicas_do_dedo
+from sincronizacao_templates import SincronizadorTemplates, criar_tabelas, publicar_template, remover_template
+from log_catraca import configurar_logs
+
+
+def executar_no(no, config, fator_latencia, parar, resultados):
+    configurar_logs(no)
+    sensor = SensorSimulado(fator_latencia=fator_latencia)
+    pool = obter_pool(config)
+    executar = executar_direto(sensor)
+
+    sincronizador = SincronizadorTemplates(pool, no, executar, intervalo=0.5)
+    sincronizador.preparar()
+    sincronizador.iniciar()
+    parar.wait()
+    sincronizador.parar()
+    sincronizador.sincronizar()
+
+    # Confere cada posição do nó com o template publicado
+    with pool.conexao() as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT tp.posicao, tc.caracteristicas
+            FROM template_posicao tp
+            JOIN template_central tc ON tc.id = tp.template_id
+            WHERE tp.no = %s
+        """, (no,))
+        esperado = {posicao: bytes(dados) for posicao, dados in cursor.fetchall()}
+        cursor.close()
+
+    divergentes = 0
+    for posicao, dados in esperado.items():
+        def _baixar(sensor):
+            sensor.loadTemplate(posicao, 0x01)
+            return bytes(sensor.downloadCharacteristics(0x01))
+        if executar(_baixar) != dados:
+            divergentes += 1
+
+    resultados.put({
+        **sincronizador.metricas(),
+        "templates_sensor": sensor.getTemplateCount(),
+        "templates_esperados": len(esperado),
+        "divergentes": divergentes,
+        "comandos_sensor": sensor.comandos,
+    })
+    pool.fechar()
+
+
+def versoes_aplicadas(pool, nos):
+    with pool.conexao() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT no, versao_aplicada FROM template_no WHERE no = ANY(%s)", (nos,))
+        versoes = dict(cursor.fetchall())
+        cursor.close()
+    return versoes
+
+
+def aguardar_convergencia(pool, nos, versao, timeout):
+    """Segundos até todos os nós aplicarem `versao` (None se não chegarem)"""
+    inicio = time.monotonic()
+    while time.monotonic() - inicio < timeout:
+        versoes = versoes_aplicadas(pool, nos)
+        if len(versoes) == len(nos) and min(versoes.values()) >= versao:
+            return time.monotonic() - inicio
+        time.sleep(0.1)
+    return None
+
+
+def publicar(pool, operacoes):
+    """Aplica [(user_id, dedo_simulado ou None para remover)] numa transação"""
+    with pool.conexao() as conn:
+        cursor = conn.cursor()
+        for user_id, dedo in operacoes:
+            if dedo is None:
+                remover_template(cursor, user_id)
+            else:
+                publicar_template(cursor, user_id, caracteristicas_do_dedo(dedo))
+        cursor.execute("SELECT last_value FROM template_versao_seq")
+        versao = cursor.fetchone()[0]
+        conn.commit()
+        cursor.close()
+    return versao
+
+
+def argumentos():
+    parser = argparse.ArgumentParser(description="Simula várias catracas sincronizando templates")
+    parser.add_argument('--dsn', required=True)
+    parser.add_argument('--nos', type=int, default=3)
+    parser.add_argument('--templates', type=int, default=30)
+    parser.add_argument('--remover', type=int, default=5)
+    parser.add_argument('--alterar', type=int, default=5)
+    parser.add_argument('--latencia', type=float, default=0.1, help="fator sobre a latência do sensor real")
+    parser.add_argument('--prefixo', default='sim')
+    parser.add_argument('--timeout', type=float, default=120)
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = argumentos()
+    config = psycopg2.extensions.parse_dsn(args.dsn)
+    nos = [f"{args.prefixo}-{i}" for i in range(1, args.nos + 1)]
+
+    contexto = multiprocessing.get_context('spawn')
+    pool = obter_pool(config)
+    with pool.conexao() as conn:
+        cursor = conn.cursor()
+        criar_tabelas(cursor, gatilho=False)
+        cursor.execute("SELECT id FROM usuario ORDER BY id LIMIT %s", (args.templates,))
+        usuarios = [linha[0] for linha in cursor.fetchall()]
+        conn.commit()
+        cursor.close()
+
+    parar = contexto.Event()
+    resultados = contexto.Queue()
+    processos = [contexto.Process(target=executar_no, args=(no, config, args.latencia, parar, resultados), name=no)
+                 for no in nos]
+    for processo in processos:
+        processo.start()
+
+    print(f"🖧 {len(nos)} nós, {len(usuarios)} usuários")
+    rodadas = [
+        ('publicação', [(u, f"{args.prefixo}-{u}") for u in usuarios]),
+        ('alteração', [(u, f"{args.prefixo}-{u}-novo") for u in usuarios[:args.alterar]]),
+        ('remoção', [(u, None) for u in usuarios[-args.remover:]] if args.remover else []),
+    ]
+    for nome, operacoes in rodadas:
+        versao = publicar(pool, operacoes)
+        segundos = aguardar_convergencia(pool, nos, versao, args.timeout)
+        if segundos is None:
+            print(f"❌ {nome}: nós não chegaram à versão {versao} em {args.timeout:.0f}s "
+                  f"({versoes_aplicadas(pool, nos)})")
+        else:
+            print(f"✅ {nome}: {len(operacoes)} alterações, todos os nós na versão {versao} em {segundos:.2f}s")
+
+    parar.set()
+    relatorios = sorted((resultados.get(timeout=60) for _ in processos), key=lambda r: r['no'])
+    for processo in processos:
+        processo.join()
+
+    for relatorio in relatorios:
+        situacao = "✅" if not relatorio['divergentes'] and relatorio['templates_sensor'] == relatorio['templates_esperados'] else "❌"
+        print(f"{situacao} {relatorio['no']}: versão {relatorio['versao_aplicada']}, "
+              f"{relatorio['templates_sensor']}/{relatorio['templates_esperados']} templates, "
+              f"{relatorio['gravados']} gravados, {relatorio['removidos']} removidos, "
+              f"{relatorio['divergentes']} divergentes, {relatorio['comandos_sensor']} comandos")
+    pool.fechar()
@@ -0,0 +1,439 @@
+#!/usr/bin/env python3
+
+import argparse
+import threading
+import time
+
+from backup_templates import TEMPLATES_POR_PAGINA, executar_direto
+from banco import obter_pool
+from sensor import criar_sensor
+from log_catraca import componente, configurar_logs
+
+log = componente('sincronizacao')
+
+# Canal avisado a cada nova versão publicada no repositório central
+CANAL_TEMPLATES = 'templates_versao'
+
+INTERVALO_SINCRONIZACAO = 5   # segundos entre verificações de nova versão
+TAMANHO_LOTE = 50             # alterações aplicadas por transação
+
+# Trava (pg_advisory_xact_lock) de quem publica no repositório central: as
+# versões são numeradas ao escrever, então só com uma publicação por vez elas
+# ficam visíveis em ordem. Sem isso, um nó que lê a versão 11 antes da 10 ser
+# confirmada avança para 11 e nunca aplica a 10.
+TRAVA_PUBLICACAO = 0x74706c63
+
+SQL_TABELAS = """
+CREATE SEQUENCE IF NOT EXISTS template_versao_seq;
+
+CREATE TABLE IF NOT EXISTS template_central (
+    id serial PRIMARY KEY,
+    user_id integer NOT NULL,
+    dedo smallint NOT NULL DEFAULT 0,
+    caracteristicas bytea,
+    origem varchar(64),
+    versao bigint NOT NULL DEFAULT nextval('template_versao_seq'),
+    UNIQUE (user_id, dedo)
+);
+CREATE INDEX IF NOT EXISTS template_central_versao ON template_central (versao);
+
+CREATE TABLE IF NOT EXISTS template_no (
+    no varchar(64) PRIMARY KEY,
+    versao_aplicada bigint NOT NULL DEFAULT 0,
+    atualizado_em timestamp NOT NULL DEFAULT now()
+);
+
+CREATE TABLE IF NOT EXISTS template_posicao (
+    no varchar(64) NOT NULL REFERENCES template_no (no) ON DELETE CASCADE,
+    template_id integer NOT NULL REFERENCES template_central (id),
+    user_id integer NOT NULL,
+    posicao integer NOT NULL,
+    PRIMARY KEY (no, template_id),
+    UNIQUE (no, posicao)
+);
+"""
+
+# Usa a função criada por IndiceBiometria.instalar_gatilhos
+SQL_GATILHO_POSICAO = """
+DROP TRIGGER IF EXISTS template_posicao_notify_biometria ON public.template_posicao;
+CREATE TRIGGER template_posicao_notify_biometria
+    AFTER INSERT OR UPDATE OR DELETE ON public.template_posicao
+    FOR EACH ROW EXECUTE FUNCTION public.notificar_biometria_alterada();
+"""
+
+
+def criar_tabelas(cursor, gatilho=True):
+    cursor.execute(SQL_TABELAS)
+    if gatilho:
+        cursor.execute(SQL_GATILHO_POSICAO)
+
+
+# ==================== REPOSITÓRIO CENTRAL ====================
+
+def _travar_publicacao(cursor):
+    """Serializa as publicações até o fim da transação do chamador"""
+    cursor.execute("SELECT pg_advisory_xact_lock(%s)", (TRAVA_PUBLICACAO,))
+
+
+def publicar_template(cursor, user_id, caracteristicas, dedo=0, origem=None):
+    """Grava (ou substitui) um template com uma nova versão; retorna (id, versao)"""
+    import psycopg2
+    _travar_publicacao(cursor)
+    cursor.execute("""
+        INSERT INTO template_central (user_id, dedo, caracteristicas, origem)
+        VALUES (%s, %s, %s, %s)
+        ON CONFLICT (user_id, dedo) DO UPDATE
+            SET caracteristicas = EXCLUDED.caracteristicas,
+                origem = EXCLUDED.origem,
+                versao = nextval('template_versao_seq')
+        RETURNING id, versao
+    """, (user_id, dedo, psycopg2.Binary(bytes(caracteristicas)), origem))
+    template_id, versao = cursor.fetchone()
+    cursor.execute("SELECT pg_notify(%s, %s)", (CANAL_TEMPLATES, str(versao)))
+    return template_id, versao
+
+
+def remover_template(cursor, user_id, dedo=None):
+    """Marca os templates do usuário como removidos (cada nó apaga o seu slot)"""
+    _travar_publicacao(cursor)
+    cursor.execute("""
+        UPDATE template_central
+        SET caracteristicas = NULL, origem = NULL, versao = nextval('template_versao_seq')
+        WHERE user_id = %s AND (%s IS NULL OR dedo = %s) AND caracteristicas IS NOT NULL
+        RETURNING versao
+    """, (user_id, dedo, dedo))
+    versoes = [linha[0] for linha in cursor.fetchall()]
+    if versoes:
+        cursor.execute("SELECT pg_notify(%s, %s)", (CANAL_TEMPLATES, str(max(versoes))))
+    return len(versoes)
+
+
+# ==================== NÓ (CATRACA) ====================
+
+class SincronizadorTemplates:
+    """
+    Mantém o sensor de uma catraca igual ao repositório central.
+
+    Cada alteração no `template_central` recebe uma versão crescente. O nó
+    guarda em `template_no` a última versão que aplicou e, a cada rodada,
+    busca só o que veio depois: templates novos ou alterados são gravados no
+    sensor e removidos são apagados. A posição de cada template neste
+    sensor fica em `template_posicao` (por nó), na mesma transação que
+    avança a versão aplicada. Essa transação só abre depois dos comandos do
+    sensor, que rodam sem conexão do banco presa.
+
+    As operações no sensor passam por `executar(funcao)`, que na catraca em
+    funcionamento é o agendador do sensor.
+    """
+
+    def __init__(self, pool, no, executar, intervalo=INTERVALO_SINCRONIZACAO, tamanho_lote=TAMANHO_LOTE):
+        self.pool = pool
+        self.no = no
+        self.executar = executar
+        self.intervalo = intervalo
+        self.tamanho_lote = tamanho_lote
+
+        self.acordar = threading.Event()
+        self.running = True
+        self.thread = None
+        self.lock = threading.Lock()
+
+        self.versao_aplicada = 0
+        self.gravados = 0
+        self.removidos = 0
+        self.falhas = 0
+        self.sem_espaco = 0
+        self.ultimo_erro = None
+        self.ultima_sincronizacao = None
+
+    def preparar(self):
+        """Cria as tabelas (se preciso) e registra o nó"""
+        with self.pool.conexao() as conn:
+            cursor = conn.cursor()
+            criar_tabelas(cursor)
+            cursor.execute("INSERT INTO template_no (no) VALUES (%s) ON CONFLICT (no) DO NOTHING", (self.no,))
+            conn.commit()
+            cursor.close()
+
+    # ==================== APLICAÇÃO DE DELTAS ====================
+
+    def sincronizar(self):
+        """Aplica todas as versões pendentes; retorna quantas alterações aplicou"""
+        with self.lock:
+            total = 0
+            while True:
+                aplicadas = self._aplicar_lote()
+                total += aplicadas
+                if aplicadas < self.tamanho_lote:
+                    break
+            self.ultima_sincronizacao = time.time()
+            return total
+
+    def _aplicar_lote(self):
+        # 1) Lê o lote e as posições deste nó numa transação curta: nenhuma
+        #    conexão do pool fica presa durante os comandos do sensor
+        with self.pool.conexao() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT versao_aplicada FROM template_no WHERE no = %s", (self.no,))
+            versao_inicial = cursor.fetchone()[0]
+            self.versao_aplicada = versao_inicial
+            cursor.execute("""
+                SELECT id, user_id, caracteristicas, origem, versao
+                FROM template_central
+                WHERE versao > %s
+                ORDER BY versao
+                LIMIT %s
+            """, (versao_inicial, self.tamanho_lote))
+            alteracoes = cursor.fetchall()
+            cursor.execute("SELECT template_id, posicao FROM template_posicao WHERE no = %s", (self.no,))
+            posicoes = dict(cursor.fetchall())
+            conn.commit()
+            cursor.close()
+        if not alteracoes:
+            return 0
+
+        # 2) Aplica no sensor, sem transação aberta; guarda o que precisa ir
+        #    para template_posicao
+        reservadas = set(posicoes.values())
+        removidas, gravadas = [], []
+        versao = versao_inicial
+        erro = None
+        for template_id, user_id, caracteristicas, origem, versao_alteracao in alteracoes:
+            posicao = posicoes.get(template_id)
+            try:
+                if caracteristicas is None:
+                    if posicao is not None:
+                        self.executar(_apagar(posicao))
+                        removidas.append(template_id)
+                        reservadas.discard(posicao)
+                        self.removidos += 1
+                elif origem == self.no and posicao is not None:
+                    # Cadastrado aqui mesmo: o sensor já tem este template
+                    pass
+                elif posicao is not None:
+                    self.executar(_gravar(posicao, bytes(caracteristicas)))
+                    gravadas.append((template_id, user_id, posicao))
+                    self.gravados += 1
+                else:
+                    posicao = self.executar(_gravar_na_livre(reservadas, bytes(caracteristicas)))
+                    if posicao is None:
+                        # Sensor cheio: não tenta de novo a cada rodada
+                        self.sem_espaco += 1
+                        self.ultimo_erro = f"Sensor cheio: template {template_id} do usuário {user_id} não gravado"
+                        log.error(f"❌ {self.ultimo_erro}")
+                    else:
+                        reservadas.add(posicao)
+                        gravadas.append((template_id, user_id, posicao))
+                        self.gravados += 1
+            except Exception as e:
+                # Registra o que já foi aplicado; o resto fica para a próxima rodada
+                erro = e
+                break
+            versao = versao_alteracao
+
+        # 3) Anota as posições e a versão numa segunda transação curta
+        with self.pool.conexao() as conn:
+            cursor = conn.cursor()
+            for template_id in removidas:
+                cursor.execute("DELETE FROM template_posicao WHERE no = %s AND template_id = %s",
+                               (self.no, template_id))
+            for template_id, user_id, posicao in gravadas:
+                cursor.execute("""
+                    INSERT INTO template_posicao (no, template_id, user_id, posicao)
+                    VALUES (%s, %s, %s, %s)
+                    ON CONFLICT (no, template_id) DO UPDATE SET posicao = EXCLUDED.posicao
+                """, (self.no, template_id, user_id, posicao))
+            # Só avança de onde este lote partiu: outra sincronização do mesmo
+            # nó no meio tempo desfaz esta transação
+            cursor.execute("""
+                UPDATE template_no SET versao_aplicada = %s, atualizado_em = now()
+                WHERE no = %s AND versao_aplicada = %s
+            """, (versao, self.no, versao_inicial))
+            if cursor.rowcount != 1:
+                conn.rollback()
+                cursor.close()
+                raise RuntimeError(f"Versão aplicada do nó {self.no} mudou durante a sincronização")
+            conn.commit()
+            cursor.close()
+        self.versao_aplicada = versao
+
+        if erro is not None:
+            raise erro
+        return len(alteracoes)
+
+    def registrar_local(self, cursor, user_id, posicao, caracteristicas, dedo=0):
+        """
+        Publica um template cadastrado neste nó e anota a posição dele aqui,
+        na transação do chamador. Os outros nós recebem pelo delta. Retorna
+        a posição que o mesmo dedo ocupava neste nó (None se não havia).
+        """
+        template_id, _ = publicar_template(cursor, user_id, caracteristicas, dedo, origem=self.no)
+        cursor.execute("SELECT posicao FROM template_posicao WHERE no = %s AND template_id = %s",
+                       (self.no, template_id))
+        linha = cursor.fetchone()
+        cursor.execute("""
+            INSERT INTO template_posicao (no, template_id, user_id, posicao)
+            VALUES (%s, %s, %s, %s)
+            ON CONFLICT (no, template_id) DO UPDATE SET posicao = EXCLUDED.posicao
+        """, (self.no, template_id, user_id, posicao))
+        self.acordar.set()
+        return linha[0] if linha else None
+
+    def importar_user_finger(self):
+        """
+        Semeia o repositório com os templates que este sensor já tem em
+        user_finger (cadastro de antes da distribuição). Rodar uma vez, no
+        nó onde os alunos foram cadastrados. Baixa tudo do sensor sem
+        conexão presa e publica em transações curtas de `tamanho_lote`.
+        """
+        with self.pool.conexao() as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                SELECT user_id, dedo, template_position FROM user_finger
+                WHERE template_position IS NOT NULL
+                ORDER BY template_position
+            """)
+            vinculos = cursor.fetchall()
+            conn.commit()
+            cursor.close()
+
+        templates = [(user_id, dedo, posicao, self.executar(_baixar(posicao)))
+                     for user_id, dedo, posicao in vinculos]
+
+        for inicio in range(0, len(templates), self.tamanho_lote):
+            with self.pool.conexao() as conn:
+                cursor = conn.cursor()
+                for user_id, dedo, posicao, caracteristicas in templates[inicio:inicio + self.tamanho_lote]:
+                    self.registrar_local(cursor, user_id, posicao, caracteristicas, dedo)
+                conn.commit()
+                cursor.close()
+        log.info(f"📦 {len(templates)} templates importados de user_finger para o repositório central")
+        return len(templates)
+
+    # ==================== CICLO DE VIDA ====================
+
+    def iniciar(self):
+        self.thread = threading.Thread(target=self._executar, name=f"sincronizacao-{self.no}", daemon=True)
+        self.thread.start()
+
+    def parar(self):
+        self.running = False
+        self.acordar.set()
+        if self.thread:
+            self.thread.join(timeout=5)
+
+    def _executar(self):
+        espera = self.intervalo
+        while self.running:
+            try:
+                aplicadas = self.sincronizar()
+                if aplicadas:
+                    log.info(f"🔁 Nó {self.no}: {aplicadas} alterações de template aplicadas (versão {self.versao_aplicada})")
+                espera = self.intervalo
+            except Exception as e:
+                self.falhas += 1
+                self.ultimo_erro = str(e)
+                log.error(f"❌ Erro na sincronização de templates: {e}")
+                espera = min(espera * 2, 60)
+
+            self.acordar.wait(espera)
+            self.acordar.clear()
+
+    def metricas(self):
+        return {
+            "no": self.no,
+            "versao_aplicada": self.versao_aplicada,
+            "gravados": self.gravados,
+            "removidos": self.removidos,
+            "falhas": self.falhas,
+            "sem_espaco": self.sem_espaco,
+            "ultimo_erro": self.ultimo_erro,
+            "ultima_sincronizacao": self.ultima_sincronizacao,
+        }
+
+
+def _primeira_livre(sensor, reservadas):
+    """Primeira posição vazia no sensor e fora de `reservadas` (None com o sensor cheio)"""
+    capacidade = sensor.getStorageCapacity()
+    for pagina in range((capacidade + TEMPLATES_POR_PAGINA - 1) // TEMPLATES_POR_PAGINA):
+        base = pagina * TEMPLATES_POR_PAGINA
+        for i, ocupada in enumerate(sensor.getTemplateIndex(pagina)):
+            posicao = base + i
+            if posicao >= capacidade:
+                return None
+            if not ocupada and posicao not in reservadas:
+                return posicao
+    return None
+
+
+def _gravar(posicao, caracteristicas):
+    def _comando(sensor):
+        sensor.uploadCharacteristics(0x01, list(caracteristicas))
+        return sensor.storeTemplate(posicao, 0x01)
+    return _comando
+
+
+def _gravar_na_livre(reservadas, caracteristicas):
+    """
+    Escolhe a posição e grava no mesmo comando do sensor: um cadastro não
+    consegue ocupar a posição entre a escolha e a gravação. Retorna a
+    posição (None com o sensor cheio).
+    """
+    def _comando(sensor):
+        posicao = _primeira_livre(sensor, reservadas)
+        if posicao is not None:
+            sensor.uploadCharacteristics(0x01, list(caracteristicas))
+            sensor.storeTemplate(posicao, 0x01)
+        return posicao
+    return _comando
+
+
+def _apagar(posicao):
+    def _comando(sensor):
+        return sensor.deleteTemplate(posicao)
+    return _comando
+
+
+def _baixar(posicao):
+    def _comando(sensor):
+        sensor.loadTemplate(posicao, 0x01)
+        return bytes(sensor.downloadCharacteristics(0x01))
+    return _comando
+
+
+# ==================== LINHA DE COMANDO ====================
+
+def argumentos():
+    parser = argparse.ArgumentParser(description="Distribuição de templates entre catracas")
+    parser.add_argument('operacao', choices=['sincronizar', 'importar', 'remover'])
+    parser.add_argument('--no', required=True, help="identificador desta catraca")
+    parser.add_argument('--dsn', required=True, help="conexão do banco, ex.: 'host=... dbname=turnstile_system user=postgres'")
+    parser.add_argument('--porta', default='/dev/ttyUSB0')
+    parser.add_argument('--usuario', type=int, help="usuário para 'remover'")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    import psycopg2.extensions
+    args = argumentos()
+    configurar_logs()
+    pool = obter_pool(psycopg2.extensions.parse_dsn(args.dsn))
+
+    if args.operacao == 'remover':
+        with pool.conexao() as conn:
+            cursor = conn.cursor()
+            removidos = remover_template(cursor, args.usuario)
+            conn.commit()
+            cursor.close()
+        print(f"🗑️ {removidos} templates marcados para remoção")
+        raise SystemExit(0)
+
+    sensor = criar_sensor(args.porta, 57600)
+    if not sensor.verifyPassword():
+        raise SystemExit("❌ Erro na autenticação do sensor")
+    sincronizador = SincronizadorTemplates(pool, args.no, executar_direto(sensor))
+    sincronizador.preparar()
+
+    if args.operacao == 'importar':
+        sincronizador.importar_user_finger()
+    print(f"✅ {sincronizador.sincronizar()} alterações aplicadas (versão {sincronizador.versao_aplicada})")
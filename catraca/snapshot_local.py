@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+SQL_ESQUEMA = """
+CREATE TABLE IF NOT EXISTS biometria (
+    template_position INTEGER PRIMARY KEY,
+    usuario_id INTEGER NOT NULL,
+    nome TEXT NOT NULL,
+    tipo TEXT NOT NULL,
+    identificador INTEGER
+);
+CREATE INDEX IF NOT EXISTS biometria_usuario ON biometria (usuario_id);
+CREATE TABLE IF NOT EXISTS metadados (
+    chave TEXT PRIMARY KEY,
+    valor TEXT
+);
+"""
+
+
+class SnapshotLocal:
+    """
+    Cópia local (SQLite) dos usuários vinculados em user_finger.
+
+    Serve para autorizar acessos quando o PostgreSQL central está fora do
+    ar. O instante da última sincronização fica em 'metadados' para que a
+    catraca saiba a idade dos dados; um snapshot que nunca sincronizou
+    fica sem instante (None) e é tratado como expirado.
+    """
+
+    def __init__(self, caminho):
+        self.caminho = caminho
+        self.lock = threading.Lock()
+        self.sincronizado_em = None
+
+        with self._transacao() as db:
+            db.executescript(SQL_ESQUEMA)
+            linha = db.execute("SELECT valor FROM metadados WHERE chave = 'sincronizado_em'").fetchone()
+            if linha:
+                self.sincronizado_em = float(linha[0])
+
+    @contextmanager
+    def _transacao(self):
+        db = sqlite3.connect(self.caminho, timeout=5)
+        try:
+            with db:
+                yield db
+        finally:
+            db.close()
+
+    def idade(self):
+        """Segundos desde a última sincronização (None se nunca sincronizou)"""
+        if self.sincronizado_em is None:
+            return None
+        return time.time() - self.sincronizado_em
+
+    # ==================== ESCRITA ====================
+
+    def salvar(self, linhas):
+        """Substitui o snapshot por (posicao, id, nome, tipo, identificador)"""
+        agora = time.time()
+        with self.lock, self._transacao() as db:
+            db.execute("DELETE FROM biometria")
+            db.executemany("INSERT OR REPLACE INTO biometria VALUES (?, ?, ?, ?, ?)", linhas)
+            self._marcar(db, agora)
+        self.sincronizado_em = agora
+
+    def atualizar_usuario(self, usuario_id, linhas):
+        """Troca somente as posições de um usuário"""
+        with self.lock, self._transacao() as db:
+            db.execute("DELETE FROM biometria WHERE usuario_id = ?", (usuario_id,))
+            db.executemany("INSERT OR REPLACE INTO biometria VALUES (?, ?, ?, ?, ?)", linhas)
+
+    def _marcar(self, db, instante):
+        db.execute(
+            "INSERT OR REPLACE INTO metadados (chave, valor) VALUES ('sincronizado_em', ?)",
+            (str(instante),)
+        )
+
+    # ==================== LEITURA ====================
+
+    def carregar(self):
+        """Retorna as linhas no mesmo formato da consulta ao PostgreSQL"""
+        with self.lock, self._transacao() as db:
+            return db.execute(
+                "SELECT template_position, usuario_id, nome, tipo, identificador FROM biometria"
+            ).fetchall()
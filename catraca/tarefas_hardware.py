@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+
+from log_catraca import componente
+
+log = componente('tarefas')
+
+WORKERS = 2
+HISTORICO = 64  # tarefas terminadas guardadas para consulta
+
+# Status de uma tarefa
+PENDENTE = 'pendente'
+EXECUTANDO = 'executando'
+CONCLUIDA = 'concluida'
+ERRO = 'erro'
+
+
+class FilaTarefas:
+    """
+    Ações demoradas do hardware (diagnóstico, teste da catraca) fora da
+    requisição que as pediu.
+
+    `submeter` retorna na hora o registro da tarefa, com um id; `workers`
+    threads as executam por ordem de chegada. Pedidos com a mesma `chave`
+    não se acumulam: enquanto uma tarefa dela estiver pendente ou
+    executando, o pedido recebe essa mesma tarefa, e com `validade` também
+    a concluída há menos de `validade` segundos (cache do diagnóstico).
+    """
+
+    def __init__(self, workers=WORKERS, historico=HISTORICO):
+        self.workers = workers
+        self.historico = historico
+        self.cond = threading.Condition()
+        self.fila = deque()
+        self.tarefas = OrderedDict()  # id -> registro, da mais antiga à mais nova
+        self.por_chave = {}           # chave -> id da última tarefa
+        self.threads = []
+        self.running = True
+
+        self.executadas = 0
+        self.reaproveitadas = 0
+
+    def iniciar(self):
+        for numero in range(self.workers):
+            thread = threading.Thread(target=self._executar, name=f"tarefas-{numero + 1}", daemon=True)
+            thread.start()
+            self.threads.append(thread)
+
+    def parar(self):
+        with self.cond:
+            self.running = False
+            self.cond.notify_all()
+        for thread in self.threads:
+            thread.join(timeout=3)
+
+    # ==================== TAREFAS ====================
+
+    def submeter(self, tipo, funcao, chave=None, validade=0):
+        """Agenda `funcao()`; retorna uma cópia do registro da tarefa"""
+        with self.cond:
+            anterior = self.tarefas.get(self.por_chave.get(chave)) if chave else None
+            if anterior and (anterior["status"] in (PENDENTE, EXECUTANDO)
+                             or (anterior["status"] == CONCLUIDA and time.time() - anterior["concluida_em"] < validade)):
+                self.reaproveitadas += 1
+                return dict(anterior)
+
+            tarefa = {
+                "id": uuid.uuid4().hex[:16],
+                "tipo": tipo,
+                "status": PENDENTE,
+                "criada_em": time.time(),
+                "iniciada_em": None,
+                "concluida_em": None,
+                "resultado": None,
+                "erro": None,
+            }
+            self.tarefas[tarefa["id"]] = tarefa
+            if chave:
+                self.por_chave[chave] = tarefa["id"]
+            self.fila.append((tarefa, funcao))
+            self._descartar_antigas()
+            self.cond.notify()
+            return dict(tarefa)
+
+    def consultar(self, tarefa_id):
+        with self.cond:
+            tarefa = self.tarefas.get(tarefa_id)
+            return dict(tarefa) if tarefa else None
+
+    def _descartar_antigas(self):
+        terminadas = [tarefa_id for tarefa_id, tarefa in self.tarefas.items() if tarefa["status"] in (CONCLUIDA, ERRO)]
+        for tarefa_id in terminadas[:max(0, len(terminadas) - self.historico)]:
+            del self.tarefas[tarefa_id]
+
+    def _executar(self):
+        while True:
+            with self.cond:
+                while self.running and not self.fila:
+                    self.cond.wait()
+                if not self.running:
+                    return
+                tarefa, funcao = self.fila.popleft()
+                tarefa["status"] = EXECUTANDO
+                tarefa["iniciada_em"] = time.time()
+
+            try:
+                resultado, erro = funcao(), None
+            except Exception as e:
+                log.error(f"❌ Erro na tarefa {tarefa['tipo']} ({tarefa['id']}): {e}")
+                resultado, erro = None, str(e)
+
+            with self.cond:
+                tarefa["status"] = ERRO if erro else CONCLUIDA
+                tarefa["resultado"] = resultado
+                tarefa["erro"] = erro
+                tarefa["concluida_em"] = time.time()
+                self.executadas += 1
+                self.cond.notify_all()
+
+    def metricas(self):
+        with self.cond:
+            return {
+                "workers": self.workers,
+                "pendentes": len(self.fila),
+                "executando": sum(1 for tarefa in self.tarefas.values() if tarefa["status"] == EXECUTANDO),
+                "executadas": self.executadas,
+                "reaproveitadas": self.reaproveitadas,
+            }
@@ -0,0 +1,226 @@
+#!/usr/bin/env python3
+
+import threading
+import time
+from collections import deque
+from datetime import datetime
+
+from log_catraca import componente
+
+log = componente('webhooks')
+
+# requests só é importado na primeira entrega: a API e a inicialização
+# não pagam a importação (ver _sessao_http)
+
+# Etapas que encerram um cadastro: entregues com retentativa
+ETAPAS_TERMINAIS = ('sucesso', 'erro', 'cancelado')
+
+# Etapas de progresso: uma nova substitui a anterior ainda não enviada
+ETAPAS_PROGRESSO = ('aguardando_primeira', 'aguardando_remocao', 'aguardando_segunda')
+
+MAX_TENTATIVAS = 5
+ESPERA_INICIAL = 0.5  # segundos, dobra a cada tentativa
+MAX_PENDENTES_SESSAO = 100
+
+
+class WebhookManager:
+    """
+    Entrega de webhooks com um número fixo de workers e conexões persistentes.
+
+    Os eventos são agrupados por sessão (um cadastro) e cada sessão é
+    atendida por no máximo um worker por vez, então a ordem dentro dela é
+    preservada. Eventos de progresso pendentes são substituídos pelo mais
+    novo da mesma etapa, e um evento terminal descarta o progresso que ainda
+    não saiu. Eventos terminais são reenviados com backoff exponencial.
+    """
+
+    def __init__(self, workers=2, timeout=2):
+        self.webhook_url = None
+        self.sessao_atual = None
+        self.timeout = timeout
+        self.num_workers = workers
+
+        self.cond = threading.Condition()
+        self.pendentes = {}        # sessao -> deque de eventos
+        self.sessoes_prontas = deque()
+        self.sessoes_ativas = set()
+        self.running = True
+        self.workers = []
+        self.local = threading.local()
+
+        self.enfileirados = 0
+        self.enviados = 0
+        self.falhas = 0
+        self.coalescidos = 0
+        self.retentativas = 0
+        self.descartados = 0
+        self.latencia_total = 0.0
+        self.latencia_max = 0.0
+
+    def set_webhook_url(self, url, sessao=None):
+        """Define a URL do webhook para notificações"""
+        self.webhook_url = url
+        self.sessao_atual = sessao or url
+        log.info(f"🎯 Webhook URL definida: {url}")
+
+    # ==================== ENFILEIRAMENTO ====================
+
+    def enviar_webhook(self, etapa, mensagem, dados=None, success=True):
+        """Enfileira a notificação; a entrega acontece nos workers"""
+        if not self.webhook_url:
+            log.warning("⚠️  Webhook URL não configurada - pulando notificação")
+            return
+
+        evento = {
+            'url': self.webhook_url,
+            'payload': {
+                "etapa": etapa,
+                "mensagem": mensagem,
+                "dados": dados,
+                "success": success,
+                "timestamp": datetime.now().isoformat()
+            },
+            'enfileirado_em': time.monotonic(),
+        }
+        self._enfileirar(self.sessao_atual or self.webhook_url, evento)
+
+    def _enfileirar(self, sessao, evento):
+        etapa = evento['payload']['etapa']
+
+        with self.cond:
+            self._garantir_workers()
+            fila = self.pendentes.setdefault(sessao, deque())
+
+            if etapa in ETAPAS_TERMINAIS:
+                antes = len(fila)
+                fila_sem_progresso = [e for e in fila if e['payload']['etapa'] not in ETAPAS_PROGRESSO]
+                fila.clear()
+                fila.extend(fila_sem_progresso)
+                self.coalescidos += antes - len(fila)
+            elif etapa in ETAPAS_PROGRESSO and fila and fila[-1]['payload']['etapa'] == etapa:
+                fila.pop()
+                self.coalescidos += 1
+
+            if len(fila) >= MAX_PENDENTES_SESSAO:
+                fila.popleft()
+                self.descartados += 1
+
+            fila.append(evento)
+            self.enfileirados += 1
+
+            if sessao not in self.sessoes_ativas and sessao not in self.sessoes_prontas:
+                self.sessoes_prontas.append(sessao)
+                self.cond.notify()
+
+    def _garantir_workers(self):
+        if self.workers:
+            return
+        for i in range(self.num_workers):
+            worker = threading.Thread(target=self._trabalhar, name=f"webhook-{i}", daemon=True)
+            worker.start()
+            self.workers.append(worker)
+
+    # ==================== ENTREGA ====================
+
+    def _sessao_http(self):
+        # requests.Session não é thread-safe: uma por worker, com keep-alive
+        if not hasattr(self.local, 'sessao'):
+            import requests
+            from requests.adapters import HTTPAdapter
+            sessao = requests.Session()
+            sessao.mount('http://', HTTPAdapter(pool_connections=1, pool_maxsize=1))
+            sessao.mount('https://', HTTPAdapter(pool_connections=1, pool_maxsize=1))
+            sessao.headers['Content-Type'] = 'application/json'
+            self.local.sessao = sessao
+        return self.local.sessao
+
+    def _trabalhar(self):
+        while True:
+            with self.cond:
+                while self.running and not self.sessoes_prontas:
+                    self.cond.wait()
+                if not self.sessoes_prontas:
+                    return
+                sessao = self.sessoes_prontas.popleft()
+                self.sessoes_ativas.add(sessao)
+                evento = self.pendentes[sessao].popleft()
+
+            try:
+                self._entregar(evento)
+            finally:
+                with self.cond:
+                    self.sessoes_ativas.discard(sessao)
+                    if self.pendentes.get(sessao):
+                        self.sessoes_prontas.append(sessao)
+                        self.cond.notify()
+                    else:
+                        self.pendentes.pop(sessao, None)
+
+    def _entregar(self, evento):
+        payload = evento['payload']
+        tentativas = MAX_TENTATIVAS if payload['etapa'] in ETAPAS_TERMINAIS else 1
+        espera = ESPERA_INICIAL
+
+        for tentativa in range(1, tentativas + 1):
+            if self._post(evento['url'], payload):
+                latencia = time.monotonic() - evento['enfileirado_em']
+                with self.cond:
+                    self.enviados += 1
+                    self.latencia_total += latencia
+                    self.latencia_max = max(self.latencia_max, latencia)
+                return True
+
+            if tentativa < tentativas and self.running:
+                with self.cond:
+                    self.retentativas += 1
+                time.sleep(espera)
+                espera *= 2
+
+        with self.cond:
+            self.falhas += 1
+        return False
+
+    def _post(self, url, payload):
+        import requests
+        try:
+            response = self._sessao_http().post(url, json=payload, timeout=self.timeout)
+
+            if response.status_code == 200:
+                log.info(f"📤 Webhook enviado com sucesso: {payload['etapa']}")
+                return True
+            log.warning(f"⚠️  Webhook retornou status {response.status_code}")
+
+        except requests.exceptions.Timeout:
+            log.warning("⏰ Timeout ao enviar webhook")
+        except requests.exceptions.ConnectionError:
+            log.warning("🔌 Erro de conexão ao enviar webhook")
+        except Exception as e:
+            log.error(f"❌ Erro ao enviar webhook: {e}")
+        return False
+
+    # ==================== CICLO DE VIDA / MÉTRICAS ====================
+
+    def parar(self, timeout=3):
+        """Deixa os workers esvaziarem a fila e encerra"""
+        with self.cond:
+            self.running = False
+            self.cond.notify_all()
+        limite = time.monotonic() + timeout
+        for worker in self.workers:
+            worker.join(timeout=max(limite - time.monotonic(), 0))
+
+    def metricas(self):
+        with self.cond:
+            return {
+                "workers": len(self.workers),
+                "fila": sum(len(fila) for fila in self.pendentes.values()),
+                "sessoes_pendentes": len(self.pendentes),
+                "enfileirados": self.enfileirados,
+                "enviados": self.enviados,
+                "falhas": self.falhas,
+                "coalescidos": self.coalescidos,
+                "retentativas": self.retentativas,
+                "descartados": self.descartados,
+                "latencia_media_ms": round(1000 * self.latencia_total / self.enviados, 3) if self.enviados else 0.0,
+                "latencia_max_ms": round(1000 * self.latencia_max, 3),
+            }